@@ -1,32 +1,167 @@
 PYRANOMETER_DIVIDE_NUMBER = 0.00001797
+# continuous conversion of the ads1115: a background thread keeps the last conversions in a ring buffer
+# and the measure uses their mean or median ("mean" or "median") instead of a single conversion
+PYRANOMETER_CONTINUOUS_MODE = True
+PYRANOMETER_DATA_RATE = 860
+PYRANOMETER_OVERSAMPLING = 64
+PYRANOMETER_SAMPLE_INTERVAL_SEC = 0.01
+PYRANOMETER_AGGREGATE = "median"
+
+# backend used to talk to the hardware ("blinka" for the real sensors, "simulated" or "replay" to run without them)
+SENSOR_BACKEND = "blinka"
+# options of the backend, for example {"latency": 0.01, "noise": 0.1, "speed": 100} for "simulated"
+# or {"files": "data/data_*.csv", "speed": 100} for "replay"
+SENSOR_BACKEND_OPTIONS = {}
 
 ANEMOMETER_SERIAL_PORT = '/dev/ttyACM0'
+# maximum time to wait for the wind speed answer (must fit in SECONDS_BETWEEN_MEASURES)
+ANEMOMETER_READ_TIMEOUT_SEC = 0.5
+ANEMOMETER_PRESSURE_TIMEOUT_SEC = 5
+# minimum time between two reconnection attempts when the anemometer is disconnected
+ANEMOMETER_RECONNECT_DELAY_SEC = 10
 # raspberry pi id (0 = interior, 1 = exterior)
 RASPBERRY_PI_ID = 0
 # raspberry pi hat (False = red hat (C library), True = small hat (python library))
 RASPBERRY_PI_IS_PYTHON_HAT = True
 
 DATA_FILE_BEGINNING = "data/data_"
+# a new data file is started every day ("daily"), when it reaches DATA_FILE_MAX_BYTES ("size") or never (None)
+DATA_FILE_ROTATION = "daily"
+DATA_FILE_MAX_BYTES = 10000000
+# the lines are kept in a buffer and written every DATA_FILE_FLUSH_EVERY_LINES lines, the file is synchronized
+# on the SD card every DATA_FILE_FSYNC_INTERVAL_SEC seconds (and when the application stops)
+DATA_FILE_BUFFER_SIZE = 8192
+DATA_FILE_FLUSH_EVERY_LINES = 10
+DATA_FILE_FSYNC_INTERVAL_SEC = 600
+# binary archive of the measures of the data files (fixed size records, read with binary_archive.py)
+BINARY_ARCHIVE_ENABLED = True
+BINARY_ARCHIVE_FILE = "data/archive.bin"
+# SQLite database of the measures, with a table for each resolution (1 second, 1 minute and 1 hour). The rows older than
+# the retention time of their resolution (seconds, None to keep them) are deleted every hour
+SQLITE_STORE_ENABLED = False
+SQLITE_STORE_FILE = "data/measures.db"
+SQLITE_RETENTION_SEC = {1: 7*24*3600, 60: 2*365*24*3600, 3600: None}
+# file of the hourly summaries (mean, min and max of each channel)
+DATA_FILE_HOURLY_BEGINNING = "data/hourly_"
 DATA_FILE_FIRST_LINE = "heure de la mesure,intensite (W*m^-2),temperature (Celsius),temperature globe (Celsius),humidite (%),vitesse_du_vent (m*s^-1)"+'\n'
 
 LOG_FILE_NAME = "logs/logs_"
 
 SECONDS_BETWEEN_PRESSURE_UPDATE = 3600
 SECONDS_BETWEEN_MEASURES = 1
+# period of each sensor in seconds, for example {"anemometer": 0.25, "sht31_d": 10, "bmp280": 3600, ...} for the
+# wind at 4 Hz, the humidity every 10 seconds and the pressure every hour (the bmp280 calibrates the anemometer)
+SENSOR_PERIODS_SEC = {"mcp9808": SECONDS_BETWEEN_MEASURES, "sht31_d": SECONDS_BETWEEN_MEASURES, "anemometer": SECONDS_BETWEEN_MEASURES,
+                      "pyrano": SECONDS_BETWEEN_MEASURES, "bmp280": SECONDS_BETWEEN_PRESSURE_UPDATE}
+# what to do with the ticks missed because a measure took too long ("skip" or "catch_up")
+TICK_MISSED_POLICY = "skip"
+# maximum number of missed ticks caught up, more missed ticks are skipped
+TICK_MAX_CATCH_UP = 3
+# bounds of the histogram of the lateness of the ticks in milliseconds
+TICK_JITTER_HISTOGRAM_MS = [1, 5, 10, 50, 100, 500, 1000]
+# time given to each sensor to answer during a measure, a sensor that answers later is missing for this measure
+SENSOR_DEADLINES_SEC = {"mcp9808": 0.3, "sht31_d": 0.3, "pyrano": 0.3, "anemometer": 0.6}
+# bus of each sensor, for the error counters of the metrics (the pyranometer is read by the ads1115 on I2C)
+SENSOR_BUSES = {"mcp9808": "i2c", "sht31_d": "i2c", "bmp280": "i2c", "pyrano": "i2c", "anemometer": "rs485"}
 SECONDS_TO_DATA_LOG = "0"
 MINUTES_TO_DATA_SEND = "0,5,10,15,20,25,30,35,40,45,50,55"
+# how the measures, the saves and the sends are run: "threads" (apscheduler jobs and the measures loop),
+# "asyncio" (event loop with the stages sampler -> aggregator -> sinks linked by bounded queues, see async_pipeline.py)
+# or "processes" (acquisition, storage and uplink processes sharing a ring of samples, see process_pipeline.py,
+# Python 3.8 or newer)
+PIPELINE_MODE = "threads"
+# samples waiting for the aggregator, the oldest are dropped when it is full so the ticks stay on time
+PIPELINE_SAMPLE_QUEUE_SIZE = 64
+# closed windows waiting for a sink, the aggregator waits when it is full
+PIPELINE_SINK_QUEUE_SIZE = 4
+# time given to the stages to finish their queues when the application stops
+PIPELINE_SHUTDOWN_TIMEOUT_SEC = 10
+# samples kept in the shared ring of the processes mode (one hour of ticks), a process restarted after a crash
+# reads the samples written while it was stopped
+SHARED_RING_CAPACITY = 4096
+# time between two reads of the shared ring by the storage and uplink processes
+PROCESS_POLL_INTERVAL_SEC = 0.5
+# delay before restarting a stopped process, doubled at each stop up to PROCESS_MAX_RESTART_DELAY_SEC
+PROCESS_RESTART_DELAY_SEC = 1
+PROCESS_MAX_RESTART_DELAY_SEC = 60
+
+# metrics of the station (durations of the sensors and of the steps, errors, ticks, queues, LoRa uplinks) in the
+# Prometheus text format, see metrics.py. They are served on http://METRICS_HTTP_ADDRESS:METRICS_HTTP_PORT/metrics
+# (None to disable the endpoint) and written every METRICS_TEXTFILE_INTERVAL_SEC in METRICS_TEXTFILE (None to
+# disable the file). In the processes mode, each process writes its own file (the name of the process is added to
+# METRICS_TEXTFILE) and there is no endpoint
+METRICS_ENABLED = True
+METRICS_HTTP_ADDRESS = "127.0.0.1"
+METRICS_HTTP_PORT = 9101
+METRICS_TEXTFILE = None
+METRICS_TEXTFILE_INTERVAL_SEC = 60
+# bounds of the histograms of the durations in seconds
+METRICS_LATENCY_BUCKETS_SEC = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5]
+METRICS_LORA_BUCKETS_SEC = [0.5, 1, 2, 5, 10, 20, 30, 60, 120]
 
 LED_INTERVAL_MEASURE = 1
-LED_INTERVAL_SAVE = 0.5
-LED_INTERVAL_SEND = 0.1
+# interval while a sensor is missing, until every sensor answers again
+LED_INTERVAL_SENSOR_ERROR = 20
 LED_INTERVA_STOPPED = 3
 
 RASPBERRY_PI_SWITCH_GPIO = 21
+# time in milliseconds during which the bounces of the switch are ignored
+SWITCH_BOUNCE_TIME_MS = 50
 RASPBERRY_PI_LED_GPIO = 25
 
 SEND_LORA_EXE_PATH = "./lora/send_lora"
-LORA_MAX_RETRIES_WHEN_FAILED = 10
+# the LMIC executable needs the root rights to use the GPIOs
+SEND_LORA_SUDO = True
+# the frames are queued on the disk and sent by a separate thread. A failed send is tried again after
+# LORA_TIME_BETWEEN_RETRIES_SEC, doubled after each failure up to LORA_MAX_TIME_BETWEEN_RETRIES_SEC
+LORA_OUTBOX_DIRECTORY = "data/outbox"
+# frames kept in the queue (one week of frames), the oldest are dropped
+LORA_OUTBOX_MAX_FRAMES = 2016
 LORA_TIME_BETWEEN_RETRIES_SEC = 20
-LORA_TIME_BETWEEN_INTERIOR_AND_EXTERIOR_SEC = 30
+LORA_MAX_TIME_BETWEEN_RETRIES_SEC = 1800
+# data rate of the frames (EU868, DR0 is SF12) and duty cycle of the sub-band (1 %)
+LORA_DATA_RATE = 0
+LORA_DUTY_CYCLE = 0.01
+# the devices send in turn: a cycle of LORA_SLOT_CYCLE_SEC is divided in one slot for each device id of the
+# control byte and a device sends at a jittered time of its slot only
+LORA_SLOT_CYCLE_SEC = 60
+LORA_MAX_DEVICES = 8
+# version of the LoRa payload: 1 sends the mean of the last minutes in one frame, 2 sends the means of each
+# LORA_BATCH_INTERVAL_SEC (a resolution of ROLLUP_TIERS) in as few frames as possible. The decoder of the
+# network server must know the version 2 before it is used
+LORA_PAYLOAD_VERSION = 1
+LORA_BATCH_INTERVAL_SEC = 60
+# maximum size of a payload at the slowest data rate (EU868, DR0)
+LORA_MAX_PAYLOAD_BYTES = 51
+# without the python hat, the frames are sent by the LMIC daemon (lora/lora_daemon) listening on this socket,
+# or by running SEND_LORA_EXE_PATH for each frame when the daemon is not used or its socket does not exist
+LORA_USE_DAEMON = True
+LORA_DAEMON_SOCKET = "/run/lora_daemon.sock"
+# time to wait for the result of a frame (the daemon gives up after 120 sec)
+LORA_DAEMON_TIMEOUT_SEC = 130
+# ask the network server to acknowledge the frames (a frame without ack is sent again by the outbox)
+LORA_CONFIRMED_UPLINKS = False
+# the RAK811 joins the network once and keeps the session, it joins again after a failed send or when the
+# session sent this number of frames (one day of frames) or is older than this time (None to never rejoin)
+LORA_REJOIN_AFTER_FRAMES = 288
+LORA_REJOIN_AFTER_SEC = 24*3600
 
-CONSTANT_DATA_STRUCTURE_INIT_VALUES = {"Rayonnement solaire total": [], "Température": [], "Température globe": [], "Humidité": [], "Vitesse du vent": []}
\ No newline at end of file
+# channels of the measures, in the order of the columns of the data file
+DATA_CHANNELS = ["Rayonnement solaire total", "Température", "Température globe", "Humidité", "Vitesse du vent"]
+# names of the channels in the SQLite database
+DATA_CHANNEL_COLUMNS = ["radiation", "temperature", "globe_temperature", "humidity", "wind_speed"]
+# add the min, max, standard deviation and percentiles of each channel to the data file
+DATA_FILE_EXTRA_STATISTICS = False
+DATA_FILE_EXTRA_STATISTICS_NAMES = ["min", "max", "std"]
+STATISTICS_PERCENTILES = [50, 95]
+# resolutions of the statistics kept in memory (seconds of a bucket: number of closed buckets kept)
+ROLLUP_TIERS = {1: 300, 60: 1440, 300: 288, 3600: 168}
+# number of raw samples kept in memory for the archive of the raw samples, it must hold the samples measured
+# between two saves (SECONDS_TO_DATA_LOG, one minute of ticks). The buffer is not written when RAW_ARCHIVE_ENABLED is False
+SAMPLE_BUFFER_CAPACITY = 2048
+# compressed archive of the raw samples (read with raw_archive.py), the samples are written in blocks of RAW_ARCHIVE_BLOCK_SEC
+# seconds and the values are rounded to 1/scale (the scales of the LoRa frames)
+RAW_ARCHIVE_ENABLED = True
+RAW_ARCHIVE_FILE = "data/raw.bin"
+RAW_ARCHIVE_BLOCK_SEC = 300
+RAW_ARCHIVE_SCALES = [100, 100, 100, 100, 1000]
\ No newline at end of file
@@ -0,0 +1,123 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This module reads the sensors in parallel. Every sensor has its own 
+ deadline, a sensor that did not answer in time is missing for the tick but does 
+ not delay the other sensors.
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import Configuration
+import metrics
+
+# engine used to read every sensor in its own thread
+class AcquisitionEngine:
+
+    def __init__(self):
+        self._sensors = {}
+        self._running = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self.last_durations = {}
+
+    # add a sensor to the engine
+    # arguments are the name of the sensor, the function reading it and the deadline in seconds
+    def add_sensor(self, name, function, deadline):
+        self._sensors[name] = (function, deadline)
+
+    # return the names of the sensors known by the engine
+    def sensors(self):
+        return list(self._sensors)
+
+    # one worker per sensor (plus one for the background jobs) so a stuck sensor never holds the others
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(self._sensors)+1, thread_name_prefix="sensor")
+        return self._executor
+
+    # run the function of a sensor and keep the time it took
+    def _timed_call(self, name, function):
+        start = time.monotonic()
+        try:
+            return function()
+        finally:
+            self.last_durations[name] = time.monotonic() - start
+            metrics.sensor_seconds.observe(self.last_durations[name], name)
+
+    # start a job in the background without waiting for it (used for the slow calibration jobs).
+    # return False when the previous job with the same name is still running
+    def run_in_background(self, name, function):
+        with self._lock:
+            previous = self._running.get(name)
+            if previous is not None and not previous.done():
+                return False
+            self._running[name] = self._get_executor().submit(self._timed_call, name, function)
+            return True
+
+    # read the sensors in parallel and wait for each of them until its own deadline
+    # arguments are the names of the sensors to read (every sensor when None)
+    # return a dict with the value of each sensor, None when the sensor is missing for this tick
+    def acquire(self, names=None):
+        if names is None:
+            names = self.sensors()
+        start = time.monotonic()
+        futures = {}
+        results = {}
+        for name in names:
+            function, deadline = self._sensors[name]
+            with self._lock:
+                previous = self._running.get(name)
+                if previous is not None and not previous.done():
+                    # the read of the previous tick is still blocked, the sensor is missing again
+                    logging.warning("sensor "+name+" is still busy with a previous read")
+                    metrics.sensor_errors.inc(name, Configuration.SENSOR_BUSES.get(name, "unknown"), "busy")
+                    results[name] = None
+                    continue
+                futures[name] = self._get_executor().submit(self._timed_call, name, function)
+                self._running[name] = futures[name]
+        # wait for the sensors by increasing deadline
+        for name in sorted(futures, key=lambda n: self._sensors[n][1]):
+            remaining = start + self._sensors[name][1] - time.monotonic()
+            try:
+                results[name] = futures[name].result(timeout=max(0, remaining))
+            except TimeoutError:
+                logging.warning("sensor "+name+" did not answer before its deadline")
+                metrics.sensor_errors.inc(name, Configuration.SENSOR_BUSES.get(name, "unknown"), "timeout")
+                results[name] = None
+            except Exception as e:
+                logging.error("error while reading "+name+": "+repr(e))
+                metrics.sensor_errors.inc(name, Configuration.SENSOR_BUSES.get(name, "unknown"), "error")
+                results[name] = None
+        return results
+
+    # stop the workers without waiting for the blocked reads
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,243 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This module runs the measures in an asyncio event loop, in three stages linked 
+ by bounded queues: the sampler reads the sensors due at each tick of the scheduler, the 
+ aggregator adds the samples to the windows and closes them at the times of the sinks 
+ (cron fields as in apscheduler), and each sink writes its closed windows (CSV files, 
+ LoRa frames, ...). The drivers and the sinks are blocking, they run in executors so the 
+ loop is never blocked. The sampler never waits for the next stages: when the aggregator 
+ is late, the oldest samples of the queue are dropped and the ticks stay on time. A slow 
+ sink fills its queue and then slows the aggregator down. stop() ends the sampler and 
+ lets the aggregator and the sinks finish their queues before the loop stops.
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import math
+import time
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from datetime import datetime
+from apscheduler.triggers.cron import CronTrigger
+import Configuration
+
+# item put in the queues to stop the next stage
+_STOP = object()
+
+# time of the first end of window of a cron trigger after a timestamp
+def next_window_end(trigger, timestamp):
+    return trigger.get_next_fire_time(None, datetime.fromtimestamp(math.floor(timestamp) + 1, trigger.timezone)).timestamp()
+
+# sink of the closed windows
+class Sink:
+
+    def __init__(self, name, trigger, write, close_window, queue_size):
+        self.name = name
+        self.trigger = CronTrigger(**trigger)
+        self.write = write
+        self.close_window = close_window
+        self.queue_size = queue_size
+        self.queue = None
+        self.next_time = None
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="sink-"+name)
+        self.windows = 0
+        self.errors = 0
+        self.max_backlog = 0
+        self.max_duration = 0
+
+    # time of the first window end after a timestamp
+    def next_window(self, timestamp):
+        return next_window_end(self.trigger, timestamp)
+
+# pipeline sampler -> aggregator -> sinks
+class AsyncPipeline:
+
+    # arguments are the tick scheduler of the sensors, the function reading the sensors due at a tick (blocking,
+    # it gets the names of the sensors and returns their results), the function adding a sample to the windows
+    # (called in the loop, it must be fast) and the size of the queue of the samples
+    def __init__(self, scheduler, read_function, record_function, queue_size=Configuration.PIPELINE_SAMPLE_QUEUE_SIZE,
+                 shutdown_timeout=Configuration.PIPELINE_SHUTDOWN_TIMEOUT_SEC):
+        self.scheduler = scheduler
+        self.read_function = read_function
+        self.record_function = record_function
+        self.queue_size = queue_size
+        self.shutdown_timeout = shutdown_timeout
+        self.sinks = []
+        self.samples = 0
+        self.dropped_samples = 0
+        self.max_backlog = 0
+        self._loop = None
+        self._running = None
+        self._stopping = None
+        self._start_running = False
+        self._stop_requested = False
+        # the loop is published with the events under this lock, set_running() and stop() may come from other threads
+        self._lock = threading.Lock()
+        self._queue = None
+        self._reader = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="sampler")
+
+    # add a sink
+    # arguments are the name of the sink, the cron fields of the end of its windows (for example {"minute": "*/5"}),
+    # the function writing a window (blocking, it runs in the executor of the sink) and the function closing the
+    # window in the aggregator (its result is given to write, None to call write without argument)
+    def add_sink(self, name, trigger, write, close_window=None, queue_size=Configuration.PIPELINE_SINK_QUEUE_SIZE):
+        self.sinks.append(Sink(name, trigger, write, close_window, queue_size))
+
+    # start or pause the sampler, it can be called from any thread (before run() to start it at once)
+    def set_running(self, running):
+        with self._lock:
+            if self._loop is None:
+                self._start_running = running
+                return
+            self._loop.call_soon_threadsafe(self._running.set if running else self._running.clear)
+
+    # stop the pipeline, it can be called from any thread (before run() to stop it at once)
+    def stop(self):
+        with self._lock:
+            if self._loop is None:
+                self._stop_requested = True
+                return
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    # read the sensors at each tick and queue the samples with the time of the tick
+    async def _sample(self, queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._running.wait()
+            delay = self.scheduler.next_tick() - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if not self._running.is_set():
+                continue
+            timestamp = time.time()
+            sensors = self.scheduler.pop_due(time.monotonic())
+            if not sensors:
+                continue
+            results = await loop.run_in_executor(self._reader, self.read_function, sensors)
+            self.samples += 1
+            if queue.full():
+                # the aggregator is late, the oldest sample is dropped so the ticks are not delayed
+                queue.get_nowait()
+                self.dropped_samples += 1
+                logging.warning("sample queue full, oldest sample dropped")
+            queue.put_nowait((timestamp, results))
+            self.max_backlog = max(self.max_backlog, queue.qsize())
+
+    # add the samples to the windows and give the closed windows to the sinks
+    async def _aggregate(self, queue):
+        while True:
+            item = await queue.get()
+            if item is _STOP:
+                break
+            timestamp, results = item
+            for sink in self.sinks:
+                if sink.next_time is None:
+                    sink.next_time = sink.next_window(timestamp)
+                elif timestamp >= sink.next_time:
+                    # the window is closed before the sample of the next window is added
+                    window = sink.close_window() if sink.close_window is not None else None
+                    sink.next_time = sink.next_window(timestamp)
+                    await sink.queue.put(window)
+                    sink.max_backlog = max(sink.max_backlog, sink.queue.qsize())
+            try:
+                self.record_function(timestamp, results)
+            except Exception as e:
+                logging.error("failed to add the sample: "+repr(e))
+        for sink in self.sinks:
+            await sink.queue.put(_STOP)
+
+    # write the closed windows of a sink one after the other
+    async def _write(self, sink):
+        loop = asyncio.get_running_loop()
+        while True:
+            window = await sink.queue.get()
+            if window is _STOP:
+                return
+            start = time.monotonic()
+            try:
+                if sink.close_window is None:
+                    await loop.run_in_executor(sink.executor, sink.write)
+                else:
+                    await loop.run_in_executor(sink.executor, sink.write, window)
+            except Exception as e:
+                sink.errors += 1
+                logging.error("sink "+sink.name+" failed: "+repr(e))
+            sink.windows += 1
+            sink.max_duration = max(sink.max_duration, time.monotonic() - start)
+
+    # run the pipeline until stop() is called
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._running = asyncio.Event()
+        self._stopping = asyncio.Event()
+        with self._lock:
+            if self._start_running:
+                self._running.set()
+            if self._stop_requested:
+                self._stopping.set()
+            self._loop = loop
+        queue = self._queue = asyncio.Queue(self.queue_size)
+        for sink in self.sinks:
+            sink.queue = asyncio.Queue(sink.queue_size)
+        sampler = asyncio.ensure_future(self._sample(queue))
+        aggregator = asyncio.ensure_future(self._aggregate(queue))
+        writers = [asyncio.ensure_future(self._write(sink)) for sink in self.sinks]
+        await self._stopping.wait()
+        # the sampler is cancelled, the samples already read are added and the windows queued are written
+        sampler.cancel()
+        await asyncio.gather(sampler, return_exceptions=True)
+        if queue.full():
+            queue.get_nowait()
+            self.dropped_samples += 1
+        queue.put_nowait(_STOP)
+        done, pending = await asyncio.wait([aggregator] + writers, timeout=self.shutdown_timeout)
+        for task in pending:
+            logging.warning("pipeline stage not finished after %.0f sec, cancelled" % self.shutdown_timeout)
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._reader.shutdown(wait=False)
+        for sink in self.sinks:
+            sink.executor.shutdown(wait=False)
+        with self._lock:
+            self._loop = None
+            self._stop_requested = False
+
+    # get the statistics of the stages
+    def get_statistics(self):
+        statistics = {"samples": self.samples, "dropped_samples": self.dropped_samples, "max_backlog": self.max_backlog,
+                      "backlog": self._queue.qsize() if self._queue is not None else 0}
+        for sink in self.sinks:
+            statistics[sink.name] = {"windows": sink.windows, "errors": sink.errors, "max_backlog": sink.max_backlog, "max_duration": sink.max_duration,
+                                     "backlog": sink.queue.qsize() if sink.queue is not None else 0}
+        return statistics
+
+    # log the statistics of the stages
+    def log_statistics(self):
+        statistics = self.get_statistics()
+        logging.info("pipeline statistics: %d samples, %d dropped, max backlog %d" % (statistics["samples"], statistics["dropped_samples"], statistics["max_backlog"]))
+        for sink in self.sinks:
+            logging.info("sink %s: %d windows, %d errors, max backlog %d, max duration %.3f sec" % (sink.name, sink.windows, sink.errors, sink.max_backlog, sink.max_duration))
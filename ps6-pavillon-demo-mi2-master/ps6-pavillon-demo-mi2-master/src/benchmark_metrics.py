@@ -0,0 +1,106 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This program measures the cost of the metrics: the time of one update of a 
+ histogram and of a counter, the time added to a measure (read of the sensors with a 
+ simulated backend) by the metrics compared to the same measures without metrics, and 
+ the time to give the metrics in the text format on the HTTP endpoint.
+
+ Usage:   python3 benchmark_metrics.py --ticks 2000
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import time
+import argparse
+import urllib.request
+from statistics import mean, median
+
+from benchmark_pipeline import prepare_working_directory
+
+# time of one call of a function in microseconds
+def time_call(function, count):
+    start = time.perf_counter()
+    for index in range(count):
+        function()
+    return (time.perf_counter() - start) / count * 1e6
+
+# durations of the measures in microseconds
+def time_measures(demo_mi2, ticks):
+    durations = []
+    for tick in range(ticks):
+        start = time.perf_counter()
+        demo_mi2.measure_data()
+        durations.append((time.perf_counter() - start) * 1e6)
+    return durations
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the overhead of the metrics")
+    parser.add_argument("--ticks", type=int, default=2000, help="measures run with and without the metrics")
+    parser.add_argument("--count", type=int, default=200000, help="updates of the metrics of the micro benchmark")
+    args = parser.parse_args()
+
+    working_directory = prepare_working_directory()
+    import Configuration
+    Configuration.SENSOR_BACKEND = "simulated"
+    Configuration.SENSOR_BACKEND_OPTIONS = {"latency": 0, "speed": 1}
+    import metrics
+    import demo_mi2
+
+    histogram = metrics.registry.histogram("benchmark_seconds", "Histogram of the benchmark", ["stage"])
+    counter = metrics.registry.counter("benchmark_total", "Counter of the benchmark", ["stage"])
+    print("histogram observe: %.2f us" % time_call(lambda: histogram.observe(0.003, "benchmark"), args.count))
+    print("counter inc:       %.2f us" % time_call(lambda: counter.inc("benchmark"), args.count))
+    plain = lambda: None
+    timed = metrics.timed_stage("benchmark")(plain)
+    print("timed_stage:       %.2f us (plain call %.2f us)" % (time_call(timed, args.count), time_call(plain, args.count)))
+
+    # the measures are run alternately with and without the metrics so the load of the computer is the same
+    enabled = []
+    disabled = []
+    time_measures(demo_mi2, 50)
+    for block in range(10):
+        metrics.registry.enabled = True
+        enabled += time_measures(demo_mi2, args.ticks // 20)
+        metrics.registry.enabled = False
+        disabled += time_measures(demo_mi2, args.ticks // 20)
+    metrics.registry.enabled = True
+    overhead = median(enabled) - median(disabled)
+    print("measure with metrics:    mean %.1f us, median %.1f us" % (mean(enabled), median(enabled)))
+    print("measure without metrics: mean %.1f us, median %.1f us" % (mean(disabled), median(disabled)))
+    print("overhead of the metrics: %.1f us per measure, %.4f %% of a tick of %d s" % (overhead, overhead / 1e4 / Configuration.SECONDS_BETWEEN_MEASURES, Configuration.SECONDS_BETWEEN_MEASURES))
+
+    server = metrics.MetricsServer(port=0)
+    server.start()
+    start = time.perf_counter()
+    body = urllib.request.urlopen("http://127.0.0.1:%d/metrics" % server.port).read()
+    print("HTTP endpoint: %d bytes, %d lines in %.1f ms" % (len(body), body.count(b"\n"), (time.perf_counter() - start) * 1000))
+    print("render:        %.1f ms" % (time_call(metrics.registry.render, 100) / 1000))
+    server.stop()
+    demo_mi2.acquisition_engine.shutdown()
+    demo_mi2.close_data_files()
+    print("output files in "+working_directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This program measures the throughput of the payload codec: the frames encoded 
+ and decoded one by one and in batches with NumPy, for a number of random frames.
+
+ Usage:   python3 benchmark_payload.py --frames 1000000
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import os
+import sys
+import time
+import argparse
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import payload
+
+# print the throughput of a step
+def print_throughput(name, frames, duration):
+    print("%-24s %9d frames  %8.3f s  %12.0f frames/s" % (name, frames, duration, frames / duration))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the encoding and decoding of the LoRa payloads")
+    parser.add_argument("--frames", type=int, default=1000000, help="frames of the batches")
+    parser.add_argument("--single", type=int, default=100000, help="frames encoded and decoded one by one")
+    args = parser.parse_args()
+
+    generator = numpy.random.RandomState(0)
+    timestamps = 1622540000 + numpy.arange(args.frames) * 300
+    values = numpy.column_stack([generator.uniform(0, 300, args.frames), generator.uniform(-10, 35, args.frames),
+                                 generator.uniform(-10, 45, args.frames), generator.uniform(0, 100, args.frames),
+                                 generator.uniform(0, 20, args.frames)])
+    devices = generator.randint(0, 8, args.frames)
+
+    single = min(args.single, args.frames)
+    start = time.perf_counter()
+    frames = [payload.encode_v1(False, int(timestamps[index]), values[index].tolist(), int(devices[index])) for index in range(single)]
+    print_throughput("encode_v1", single, time.perf_counter() - start)
+    start = time.perf_counter()
+    samples = [payload.decode(frame) for frame in frames]
+    print_throughput("decode", single, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    batch = payload.encode_v1_batch(timestamps, values, devices)
+    print_throughput("encode_v1_batch", args.frames, time.perf_counter() - start)
+    start = time.perf_counter()
+    columns = payload.decode_v1_batch(batch)
+    print_throughput("decode_v1_batch", args.frames, time.perf_counter() - start)
+    frame_list = [batch[index * payload.V1_SIZE:(index + 1) * payload.V1_SIZE] for index in range(args.frames)]
+    start = time.perf_counter()
+    payload.decode_batch(frame_list)
+    print_throughput("decode_batch (list)", args.frames, time.perf_counter() - start)
+
+    # the batch and the single frames must be the same
+    if b"".join(frames) != batch[:single * payload.V1_SIZE]:
+        print("the batch encoding differs from encode_v1")
+    if any(columns["device"][index] != samples[index][0]["device"] for index in range(single)):
+        print("the batch decoding differs from decode")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This module runs the measure -> save -> send pipeline of the application 
+ with a simulated or replay backend, faster than the real time, and prints the time 
+ spent in each step. It runs on any computer, the sensors are not needed.
+
+ Usage:   python3 benchmark_pipeline.py --backend simulated --speed 100 --minutes 10
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from statistics import mean
+
+# the pipeline is run in a temporary directory so the data and logs files of the station are not touched
+def prepare_working_directory():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    working_directory = tempfile.mkdtemp(prefix="demo_mi2_benchmark_")
+    os.makedirs(os.path.join(working_directory, "data"))
+    os.makedirs(os.path.join(working_directory, "logs"))
+    os.chdir(working_directory)
+    return working_directory
+
+# print the statistics of the durations of a step
+def print_durations(name, durations):
+    if not durations:
+        print("%-14s not run" % name)
+        return
+    durations = sorted(durations)
+    print("%-14s runs: %6d  mean: %8.3f ms  p95: %8.3f ms  max: %8.3f ms" % (name, len(durations), mean(durations)*1000, durations[int(len(durations)*0.95)]*1000, durations[-1]*1000))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the measure -> save -> send pipeline without the sensors")
+    parser.add_argument("--backend", choices=["simulated", "replay"], default="simulated")
+    parser.add_argument("--files", help="recorded data files for the replay backend (glob)")
+    parser.add_argument("--speed", type=float, default=100, help="speed compared to the real time")
+    parser.add_argument("--minutes", type=int, default=10, help="simulated minutes to run")
+    parser.add_argument("--latency", type=float, default=0.01, help="latency of a sensor read in seconds (real time)")
+    parser.add_argument("--noise", type=float, default=0.1, help="standard deviation of the simulated noise")
+    args = parser.parse_args()
+
+    options = {"speed": args.speed, "latency": args.latency, "noise": args.noise}
+    if args.backend == "replay":
+        options["files"] = os.path.abspath(args.files) if args.files else os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "data_*.csv"))
+    working_directory = prepare_working_directory()
+
+    import Configuration
+    # the backend is selected by demo_mi2 when it is imported, after the creation of the logs
+    Configuration.SENSOR_BACKEND = args.backend
+    Configuration.SENSOR_BACKEND_OPTIONS = options
+    # the waiting times of the application follow the speed of the simulation
+    Configuration.LORA_SLOT_CYCLE_SEC /= args.speed
+    Configuration.LORA_DUTY_CYCLE = min(1.0, Configuration.LORA_DUTY_CYCLE * args.speed)
+    Configuration.LORA_TIME_BETWEEN_RETRIES_SEC /= args.speed
+    Configuration.LORA_MAX_TIME_BETWEEN_RETRIES_SEC /= args.speed
+    import demo_mi2
+    demo_mi2.outbox.start()
+
+    durations = {"measure_data": [], "save_data": [], "send_to_lora": []}
+    period = Configuration.SECONDS_BETWEEN_MEASURES / args.speed
+    ticks = args.minutes * 60 // Configuration.SECONDS_BETWEEN_MEASURES
+    late_ticks = 0
+    start = time.monotonic()
+    for tick in range(1, ticks+1):
+        step_start = time.monotonic()
+        demo_mi2.measure_data()
+        durations["measure_data"].append(time.monotonic() - step_start)
+        simulated_seconds = tick * Configuration.SECONDS_BETWEEN_MEASURES
+        if simulated_seconds % 60 == 0:
+            step_start = time.monotonic()
+            demo_mi2.save_data()
+            durations["save_data"].append(time.monotonic() - step_start)
+        if simulated_seconds % 300 == 0:
+            step_start = time.monotonic()
+            demo_mi2.send_to_lora()
+            durations["send_to_lora"].append(time.monotonic() - step_start)
+        # wait for the next simulated tick
+        delay = start + tick * period - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            late_ticks += 1
+    elapsed = time.monotonic() - start
+    demo_mi2.acquisition_engine.shutdown()
+    demo_mi2.close_data_files()
+
+    print("backend: %s, simulated time: %d min in %.1f s (%.0fx real time, target %.0fx)" % (args.backend, args.minutes, elapsed, args.minutes*60/elapsed, args.speed))
+    print("late ticks: %d / %d" % (late_ticks, ticks))
+    for name in durations:
+        print_durations(name, durations[name])
+    print("LoRa outbox     sent: %d  failed: %d  dropped: %d  waiting: %d" % (demo_mi2.outbox.sent, demo_mi2.outbox.failed, demo_mi2.outbox.dropped, len(demo_mi2.outbox)))
+    print("LoRa session    joins: %s  sends: %s" % (demo_mi2.send_lora.session.joins, demo_mi2.send_lora.session.sends))
+    print("output files in "+working_directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This program measures the size and the speed of the archive of the raw samples. 
+ It generates samples at 1 Hz with the simulated backend or replays recorded data files, 
+ writes them in a raw archive, reads them back and compares the bytes per sample with 
+ the CSV text and the fixed size records of the binary archive.
+
+ Usage:   python3 benchmark_raw_archive.py --backend replay --files "data/data_*.csv" --hours 24
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import Configuration
+import raw_archive
+import binary_archive
+from device import backend
+
+# generate the samples of a backend at 1 Hz, with a small jitter of the timestamps like the measure ticks
+def generate_samples(sensors, start, seconds):
+    jitter = random.Random(0)
+    readers = [sensors.radiation, sensors.temperature, sensors.globe_temperature, sensors.humidity, sensors.wind_speed]
+    samples = []
+    for second in range(seconds):
+        timestamp = start + second + jitter.uniform(0, 0.005)
+        sensors.now = lambda: timestamp
+        samples.append((timestamp, [reader() for reader in readers]))
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the archive of the raw samples")
+    parser.add_argument("--backend", choices=["simulated", "replay"], default="simulated")
+    parser.add_argument("--files", help="recorded data files for the replay backend (glob)")
+    parser.add_argument("--hours", type=float, default=24, help="hours of samples at 1 Hz")
+    parser.add_argument("--noise", type=float, default=0.1, help="standard deviation of the noise added to the values")
+    parser.add_argument("--block", type=int, default=Configuration.RAW_ARCHIVE_BLOCK_SEC, help="duration of a block in seconds")
+    args = parser.parse_args()
+
+    if args.backend == "replay":
+        sensors = backend.ReplayBackend(args.files or Configuration.DATA_FILE_BEGINNING+"*.csv", noise=args.noise, seed=0)
+        start = sensors._simulated_start
+    else:
+        sensors = backend.SimulatedBackend(latency=0, noise=args.noise, seed=0)
+        start = time.time()
+    samples = generate_samples(sensors, start, int(args.hours * 3600))
+    csv_bytes = sum(len(time.strftime("%d/%m/%Y %H:%M:%S", time.localtime(timestamp)) + "".join(",%.1f" % value for value in values) + "\n") for timestamp, values in samples)
+    print("%d samples, %d blocks of %d s" % (len(samples), (len(samples) + args.block - 1) // args.block, args.block))
+    print("%-22s %8.2f bytes/sample" % ("CSV text", csv_bytes / len(samples)))
+    print("%-22s %8.2f bytes/sample" % ("binary archive", binary_archive.RECORD_SIZE))
+
+    directory = tempfile.mkdtemp(prefix="demo_mi2_raw_archive_")
+    for name, flags in [("raw archive (varint)", 0), ("raw archive (zlib)", raw_archive.FLAG_ZLIB)]:
+        path = os.path.join(directory, "raw_%d.bin" % flags)
+        encode_start = time.perf_counter()
+        writer = raw_archive.RawArchiveWriter(path, args.block, flags=flags)
+        for timestamp, values in samples:
+            writer.append(timestamp, values)
+        writer.close()
+        encode_duration = time.perf_counter() - encode_start
+        decode_start = time.perf_counter()
+        decoded = 0
+        max_error = [0.0] * len(Configuration.RAW_ARCHIVE_SCALES)
+        for (timestamp, values), (original_timestamp, original_values) in zip(raw_archive.iter_samples(path), samples):
+            decoded += 1
+            for channel, (value, original) in enumerate(zip(values, original_values)):
+                max_error[channel] = max(max_error[channel], abs(value - original))
+        decode_duration = time.perf_counter() - decode_start
+        if decoded != len(samples):
+            print("%s: %d samples decoded instead of %d" % (name, decoded, len(samples)))
+        print("%-22s %8.2f bytes/sample  encode: %9.0f samples/s  decode: %9.0f samples/s  max error: %s"
+              % (name, os.path.getsize(path) / len(samples), len(samples) / encode_duration, len(samples) / decode_duration,
+                 " ".join("%.4f" % error for error in max_error)))
+    print("archives in "+directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This program runs the LoRa path of the application end to end without the hat: 
+ send_to_lora() queues the frames and the outbox sends them to the RAK811 emulator (python 
+ hat) or to the fake send_lora executable (LMIC), with random join and send failures, 
+ latencies and a scripted outage. It reports the uplinks delivered, the time the caller of 
+ send_to_lora() was blocked, the time spent in the sends and the delivery latencies. The 
+ times are simulated: the program runs --speed times faster than the real time.
+
+ Usage:   python3 benchmark_uplink.py --path rak --frames 48 --outage 3600:7200
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import os
+import time
+import argparse
+import threading
+from statistics import mean
+
+from benchmark_pipeline import prepare_working_directory, print_durations
+
+# percentile of sorted values
+def percentile(values, percent):
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+# parse an outage "start:end" in simulated seconds
+def outage(text):
+    start, end = text.split(":")
+    return float(start), float(end)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the LoRa uplinks end to end with an emulated LoRa hat")
+    parser.add_argument("--path", choices=["rak", "lmic"], default="rak", help="python hat (RAK811 emulator) or LMIC executable (fake send_lora)")
+    parser.add_argument("--frames", type=int, default=24, help="frames queued by send_to_lora()")
+    parser.add_argument("--period", type=float, default=300, help="simulated seconds between two calls of send_to_lora()")
+    parser.add_argument("--speed", type=float, default=60, help="speed compared to the real time")
+    parser.add_argument("--join-failure-rate", type=float, default=0.1)
+    parser.add_argument("--send-failure-rate", type=float, default=0.1)
+    parser.add_argument("--join-latency", type=float, default=6, help="simulated seconds of a join")
+    parser.add_argument("--send-latency", type=float, default=2, help="simulated seconds of a send")
+    parser.add_argument("--outage", type=outage, action="append", default=[], help="simulated start:end of an outage (seconds from the start)")
+    parser.add_argument("--outage-mode", choices=["error", "silent"], default="error", help="the RAK811 answers errors or does not answer during an outage")
+    parser.add_argument("--drain", type=float, default=3600, help="simulated seconds given to the outbox to send the last frames")
+    args = parser.parse_args()
+
+    source_directory = os.path.dirname(os.path.abspath(__file__))
+    working_directory = prepare_working_directory()
+    real_outages = [(start / args.speed, end / args.speed) for start, end in args.outage]
+
+    import Configuration
+    import rak811_emulator
+    emulator = None
+    options = {"speed": args.speed, "latency": 0}
+    if args.path == "rak":
+        emulator = rak811_emulator.Rak811Emulator(args.join_failure_rate, args.send_failure_rate, args.join_latency / args.speed,
+                                                  args.send_latency / args.speed, real_outages, args.outage_mode, seed=0)
+        options["rak811_port"] = emulator.port
+    else:
+        Configuration.SEND_LORA_EXE_PATH = os.path.join(source_directory, "lora", "fake_send_lora")
+        Configuration.SEND_LORA_SUDO = False
+        Configuration.LORA_USE_DAEMON = False
+        os.environ.update({"FAKE_SEND_LORA_JOIN_LATENCY_SEC": str(args.join_latency / args.speed),
+                           "FAKE_SEND_LORA_SEND_LATENCY_SEC": str(args.send_latency / args.speed),
+                           "FAKE_SEND_LORA_JOIN_FAILURE_RATE": str(args.join_failure_rate),
+                           "FAKE_SEND_LORA_SEND_FAILURE_RATE": str(args.send_failure_rate),
+                           "FAKE_SEND_LORA_OUTAGE_FILE": os.path.join(working_directory, "outage"),
+                           "FAKE_SEND_LORA_LOG": os.path.join(working_directory, "uplinks.log")})
+    Configuration.SENSOR_BACKEND = "simulated"
+    Configuration.SENSOR_BACKEND_OPTIONS = options
+    # the waiting times of the LoRa path follow the speed of the simulation
+    Configuration.LORA_SLOT_CYCLE_SEC /= args.speed
+    Configuration.LORA_DUTY_CYCLE = min(1.0, Configuration.LORA_DUTY_CYCLE * args.speed)
+    Configuration.LORA_TIME_BETWEEN_RETRIES_SEC /= args.speed
+    Configuration.LORA_MAX_TIME_BETWEEN_RETRIES_SEC /= args.speed
+    Configuration.LORA_REJOIN_AFTER_SEC /= args.speed
+    import demo_mi2
+    demo_mi2.python_hat = args.path == "rak"
+
+    # time when each frame is queued and duration of each send of the outbox
+    queued = {}
+    sends = []
+    put = demo_mi2.outbox.put
+    def timed_put(frame):
+        queued[frame] = time.monotonic()
+        put(frame)
+    demo_mi2.outbox.put = timed_put
+    send_function = demo_mi2.outbox.send_function
+    def timed_send(frame):
+        start = time.monotonic()
+        try:
+            return send_function(frame)
+        finally:
+            sends.append(time.monotonic() - start)
+    demo_mi2.outbox.send_function = timed_send
+
+    # the outage of the fake send_lora is a file created and removed at the times of the outages
+    stop = threading.Event()
+    def outage_file():
+        while not stop.wait(0.01):
+            active = any(start <= time.monotonic() - start_time < end for start, end in real_outages)
+            if active and not os.path.exists(os.environ["FAKE_SEND_LORA_OUTAGE_FILE"]):
+                open(os.environ["FAKE_SEND_LORA_OUTAGE_FILE"], "w").close()
+            elif not active and os.path.exists(os.environ["FAKE_SEND_LORA_OUTAGE_FILE"]):
+                os.remove(os.environ["FAKE_SEND_LORA_OUTAGE_FILE"])
+
+    blocked = []
+    period = args.period / args.speed
+    start_time = time.monotonic()
+    if emulator is not None:
+        emulator.reset_clock()
+    else:
+        threading.Thread(target=outage_file, daemon=True).start()
+    demo_mi2.outbox.start()
+    for index in range(args.frames):
+        demo_mi2.measure_data()
+        step_start = time.monotonic()
+        demo_mi2.send_to_lora()
+        blocked.append(time.monotonic() - step_start)
+        delay = start_time + (index + 1) * period - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    # the outbox sends the last frames
+    drain_end = time.monotonic() + args.drain / args.speed
+    while len(demo_mi2.outbox) > 0 and time.monotonic() < drain_end:
+        time.sleep(0.05)
+    elapsed = time.monotonic() - start_time
+    stop.set()
+    demo_mi2.acquisition_engine.shutdown()
+    demo_mi2.close_data_files()
+
+    # frames delivered and their latency since they were queued
+    if emulator is not None:
+        delivered = emulator.received
+        emulator.close()
+    else:
+        delivered = []
+        if os.path.exists(os.environ["FAKE_SEND_LORA_LOG"]):
+            with open(os.environ["FAKE_SEND_LORA_LOG"]) as log:
+                delivered = [(float(line.split()[0]), bytes.fromhex(line.split()[1])) for line in log]
+    latencies = {}
+    for delivered_at, frame in delivered:
+        if frame in queued and frame not in latencies:
+            latencies[frame] = (delivered_at - queued[frame]) * args.speed
+    latencies = sorted(latencies.values())
+
+    print("path: %s, %d frames every %.0f s, simulated time: %.0f s in %.1f s (%.0fx real time)" % (args.path, args.frames, args.period, elapsed * args.speed, elapsed, args.speed))
+    print("outages: %s (%s)" % (", ".join("%.0f-%.0f s" % outage for outage in args.outage) or "none", args.outage_mode))
+    print("uplinks delivered: %d / %d (%.1f %%), waiting in the outbox: %d" % (len(latencies), len(queued), 100 * len(latencies) / max(1, len(queued)), len(demo_mi2.outbox)))
+    print_durations("send_to_lora", blocked)
+    print_durations("send attempts", sends)
+    print("time blocked in send_to_lora: %.3f s, in the sends of the outbox: %.1f s (real time)" % (sum(blocked), sum(sends)))
+    if latencies:
+        print("delivery latency (simulated s)  p50: %.0f  p90: %.0f  p99: %.0f  max: %.0f  mean: %.0f"
+              % (percentile(latencies, 50), percentile(latencies, 90), percentile(latencies, 99), latencies[-1], mean(latencies)))
+    if emulator is not None:
+        print("RAK811 emulator  joins: %d (%d failed)  sends: %d (%d failed)" % (emulator.joins, emulator.join_failures, emulator.sends, emulator.send_failures))
+    print("LoRa outbox     sent: %d  failed: %d  dropped: %d" % (demo_mi2.outbox.sent, demo_mi2.outbox.failed, demo_mi2.outbox.dropped))
+    print("output files in "+working_directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This module writes and reads the binary archive of the measures. The archive 
+ is a small header followed by fixed size records (timestamp and the five channels), 
+ appended in time order. The reader maps the file in memory and gives NumPy arrays 
+ of any time range without copying them, the exporter writes the records back in the 
+ CSV format of the data files.
+
+ Usage:   python3 binary_archive.py data/archive.bin export.csv [--start dd/mm/YYYY] [--end dd/mm/YYYY]
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import os
+import math
+import struct
+import argparse
+import threading
+from datetime import datetime
+import Configuration
+
+# header of the file: magic, version of the format, size of a record and number of channels
+MAGIC = b"DMI2ARCH"
+VERSION = 1
+HEADER_FORMAT = "<8sHHH6x"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+# record: timestamp (seconds, double) and one float for each channel (NaN when missing)
+RECORD_FORMAT = "<d" + "f" * len(Configuration.DATA_CHANNELS)
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+FIELDS = ["timestamp"] + Configuration.DATA_CHANNELS
+
+# check the header of an archive file
+def check_header(header):
+    magic, version, record_size, channels = struct.unpack(HEADER_FORMAT, header)
+    if magic != MAGIC:
+        raise ValueError("not a binary archive of the measures")
+    if version != VERSION or record_size != RECORD_SIZE or channels != len(Configuration.DATA_CHANNELS):
+        raise ValueError("unsupported archive version %d (record of %d bytes, %d channels)" % (version, record_size, channels))
+
+# writer appending the records at the end of the archive
+class BinaryArchiveWriter:
+
+    # arguments are the path of the archive, the size of the write buffer and the number of records
+    # between two writes of the buffer
+    def __init__(self, path, buffer_size=8192, flush_every_records=1):
+        self.path = path
+        self.flush_every_records = flush_every_records
+        self._records_not_flushed = 0
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new_file:
+            with open(path, "rb") as archive:
+                check_header(archive.read(HEADER_SIZE))
+            # a record cut by a power loss is dropped so the next records stay aligned
+            size = os.path.getsize(path)
+            complete = HEADER_SIZE + (size - HEADER_SIZE) // RECORD_SIZE * RECORD_SIZE
+            if complete != size:
+                os.truncate(path, complete)
+        self._file = open(path, "ab", buffering=buffer_size)
+        if new_file:
+            self._file.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, RECORD_SIZE, len(Configuration.DATA_CHANNELS)))
+        self._lock = threading.Lock()
+
+    # append a record
+    # arguments are the timestamp and the values of the channels (None when missing)
+    def append(self, timestamp, values):
+        record = struct.pack(RECORD_FORMAT, timestamp, *[math.nan if value is None else value for value in values])
+        with self._lock:
+            self._file.write(record)
+            self._records_not_flushed += 1
+            if self._records_not_flushed >= self.flush_every_records:
+                self._file.flush()
+                self._records_not_flushed = 0
+
+    # write the buffer and synchronize the file on the disk
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+
+# NumPy type of a record
+def record_dtype():
+    import numpy
+    return numpy.dtype([(field, "<f8" if field == "timestamp" else "<f4") for field in FIELDS])
+
+# reader mapping the archive in memory
+class BinaryArchiveReader:
+
+    def __init__(self, path):
+        import numpy
+        self.path = path
+        with open(path, "rb") as archive:
+            check_header(archive.read(HEADER_SIZE))
+        count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_SIZE
+        if count > 0:
+            self.records = numpy.memmap(path, dtype=record_dtype(), mode="r", offset=HEADER_SIZE, shape=(count,))
+        else:
+            self.records = numpy.zeros(0, dtype=record_dtype())
+
+    def __len__(self):
+        return len(self.records)
+
+    # get the records between two timestamps (start included, end excluded) as a view of the mapped file
+    def range(self, start=-math.inf, end=math.inf):
+        import numpy
+        timestamps = self.records["timestamp"]
+        first = numpy.searchsorted(timestamps, start, side="left")
+        last = numpy.searchsorted(timestamps, end, side="left")
+        return self.records[first:last]
+
+    # get the records between two timestamps as a dict of arrays (one for each field), without copying them
+    def columns(self, start=-math.inf, end=math.inf):
+        records = self.range(start, end)
+        return {field: records[field] for field in FIELDS}
+
+# read the records of an archive one by one, without NumPy
+# return an iterator of tuples (timestamp, values of the channels)
+def iter_records(path, chunk_records=4096):
+    with open(path, "rb") as archive:
+        check_header(archive.read(HEADER_SIZE))
+        while True:
+            chunk = archive.read(chunk_records * RECORD_SIZE)
+            chunk = chunk[:len(chunk) // RECORD_SIZE * RECORD_SIZE]
+            if not chunk:
+                return
+            for record in struct.iter_unpack(RECORD_FORMAT, chunk):
+                yield record
+
+# write the records of an archive between two timestamps in the CSV format of the data files
+def export_csv(path, output, start=-math.inf, end=math.inf):
+    count = 0
+    with open(output, "w") as csv_file:
+        csv_file.write(Configuration.DATA_FILE_FIRST_LINE)
+        for record in iter_records(path):
+            if not start <= record[0] < end:
+                continue
+            line = datetime.fromtimestamp(record[0]).strftime("%d/%m/%Y %H:%M:%S")
+            for value in record[1:]:
+                line += ',' + ('' if math.isnan(value) else "%.1f" % value)
+            csv_file.write(line + "\n")
+            count += 1
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the binary archive of the measures in the CSV format of the data files")
+    parser.add_argument("archive")
+    parser.add_argument("output")
+    parser.add_argument("--start", help="first day exported (dd/mm/YYYY)")
+    parser.add_argument("--end", help="first day not exported (dd/mm/YYYY)")
+    args = parser.parse_args()
+    start = datetime.strptime(args.start, "%d/%m/%Y").timestamp() if args.start else -math.inf
+    end = datetime.strptime(args.end, "%d/%m/%Y").timestamp() if args.end else math.inf
+    print("%d records exported" % export_csv(args.archive, args.output, start, end))
+
+if __name__ == "__main__":
+    main()
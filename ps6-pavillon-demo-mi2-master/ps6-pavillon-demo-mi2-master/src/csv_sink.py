@@ -0,0 +1,123 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This module writes the lines of the CSV data files. The file is kept open 
+ with a write buffer, it is flushed and synchronized on the SD card according to a 
+ policy and a new file is started every day or when the file is too big.
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+
+# rotation policies of the files
+DAILY = "daily"
+SIZE = "size"
+
+# CSV file kept open between the writes
+class CsvSink:
+
+    # arguments are the beginning of the file names, the first line of every file, the rotation policy ("daily",
+    # "size" or None), the maximum size of a file, the size of the write buffer, the number of lines between two
+    # flushes and the time between two synchronizations on the disk
+    def __init__(self, beginning, first_line, rotation=DAILY, max_bytes=10000000, buffer_size=8192, flush_every_lines=1, fsync_interval=0):
+        self.beginning = beginning
+        self.first_line = first_line
+        self.rotation = rotation
+        self.max_bytes = max_bytes
+        self.buffer_size = buffer_size
+        self.flush_every_lines = flush_every_lines
+        self.fsync_interval = fsync_interval
+        self.filename = None
+        self._file = None
+        self._file_date = None
+        self._lines_not_flushed = 0
+        self._last_fsync = time.monotonic()
+        self._lock = threading.Lock()
+
+    # open a new file named with the current time (the caller must hold the lock)
+    def _open(self, now):
+        self._close()
+        self.filename = self.beginning+now.strftime("%d-%m-%Y_%H-%M-%S")+".csv"
+        new_file = not os.path.exists(self.filename)
+        self._file = open(self.filename, "a", buffering=self.buffer_size)
+        self._file_date = now.date()
+        if new_file:
+            self._file.write(self.first_line)
+        logging.info("writing data in "+self.filename)
+
+    # check if a new file must be started (the caller must hold the lock)
+    def _must_rotate(self, now):
+        if self._file is None:
+            return True
+        if self.rotation == DAILY:
+            return now.date() != self._file_date
+        if self.rotation == SIZE:
+            return self._file.tell() >= self.max_bytes
+        return False
+
+    # write the buffer to the operating system and, when asked, synchronize the file on the disk
+    # (the caller must hold the lock)
+    def _flush(self, fsync):
+        if self._file is None:
+            return
+        self._file.flush()
+        self._lines_not_flushed = 0
+        if fsync:
+            os.fsync(self._file.fileno())
+            self._last_fsync = time.monotonic()
+
+    # close the file after writing its buffer on the disk (the caller must hold the lock)
+    def _close(self):
+        if self._file is not None:
+            self._flush(True)
+            self._file.close()
+            self._file = None
+
+    # write a line (without its end of line) in the current file
+    def write_line(self, line, now=None):
+        if now is None:
+            now = datetime.now()
+        with self._lock:
+            if self._must_rotate(now):
+                self._open(now)
+            self._file.write(line+"\n")
+            self._lines_not_flushed += 1
+            fsync = self.fsync_interval is not None and time.monotonic() - self._last_fsync >= self.fsync_interval
+            if self._lines_not_flushed >= self.flush_every_lines or fsync:
+                self._flush(fsync)
+
+    # write the buffer to the operating system and synchronize the file on the disk
+    def flush(self):
+        with self._lock:
+            self._flush(True)
+
+    # close the file, the next write opens a new one
+    def close(self):
+        with self._lock:
+            self._close()
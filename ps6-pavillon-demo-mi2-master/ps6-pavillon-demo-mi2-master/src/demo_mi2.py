@@ -30,17 +30,34 @@
  Date:    Mai 2021
 '''
 
-import logging
 import time
+# time of the start of the application, used to measure the startup time
+startup_time = time.monotonic()
+import logging
+import os
 import sys
+import math
+import atexit
+import signal
 import Configuration
 from datetime import datetime
 import threading
 import send_lora
-import numpy
-import traceback
-from statistics import mean
-import RPi.GPIO as GPIO # Import Raspberry Pi GPIO library
+import payload
+import acquisition
+import tick_scheduler
+import status_led
+import sample_buffer
+import window_statistics
+import rollups
+import csv_sink
+import binary_archive
+import raw_archive
+import sqlite_store
+import lora_outbox
+import uplink_scheduler
+import metrics
+from device import backend
 from apscheduler.schedulers.blocking import BlockingScheduler
 # logging system creation to allow to log the import of the other python files
 logging.basicConfig(filename=Configuration.LOG_FILE_NAME+str(datetime.now().strftime("%d-%m-%Y_%H-%M-%S"))+".log",format='%(name)-30s: %(levelname)-8s %(asctime)s %(message)s', level=logging.INFO)
@@ -51,6 +68,8 @@ formatter = logging.Formatter('%(name)-30s: %(levelname)-8s %(message)s')
 console.setFormatter(formatter)
 logging.getLogger('').addHandler(console)
 
+# the sensors are connected the first time they are used, so a missing sensor does not
+# prevent the others to be used
 try:
     from device import mcp9808
     from device import pyrano
@@ -60,231 +79,578 @@ try:
 except Exception as e:
     # log when as exception as occured in the import 
     logging.error(repr(e))
-    logging.error("Failed to get every sensors, verify i2c connection !")
+    logging.error("Failed to import the sensors modules, verify the installed libraries !")
+
+# method used to log the time elapsed since the start of the application (and since the start
+# of the process when psutil is available, to include the start of the python interpreter)
+def log_startup_step(step):
+    message = step+" %.3f s after the start of the application" % (time.monotonic() - startup_time)
+    try:
+        import psutil
+        message += " (%.3f s after the start of the process)" % (time.time() - psutil.Process().create_time())
+    except Exception:
+        pass
+    logging.info(message)
+
+log_startup_step("imports done")
 
 
+# Raspberry Pi GPIO library (or its simulation)
+GPIO = backend.get_backend().gpio()
+
 # global variables instantiation
-t0 = time.time()
-sem_values_to_log = threading.Semaphore()
-sem_values_to_send = threading.Semaphore()
-sem_led_interval = threading.Semaphore()
-time_before_sending_data = 0
-jobs_running = False
-led_interval = 1
+led = status_led.StatusLed(GPIO, Configuration.RASPBERRY_PI_LED_GPIO, Configuration.LED_INTERVAL_MEASURE)
+# set while the switch is on and the measures are running
+measures_running = threading.Event()
 device_id = 0
 python_hat = True
-logs_filename = str(datetime.now().strftime("%d-%m-%Y_%H-%M-%S"))
-values_to_log = Configuration.CONSTANT_DATA_STRUCTURE_INIT_VALUES
-values_to_send = Configuration.CONSTANT_DATA_STRUCTURE_INIT_VALUES
-measures_counter = Configuration.SECONDS_BETWEEN_PRESSURE_UPDATE*Configuration.SECONDS_BETWEEN_MEASURES
-
-# method used to get data from every sensors and store it in "values_to_log" and "values_to_send"
-def measure_data():
-    global measures_counter
-    measures_counter+=1
+# last measures kept in memory for the archive of the raw samples, its only consumer. They are not
+# kept when the archive is disabled or in a process that does not write it
+samples = sample_buffer.SampleRingBuffer(Configuration.DATA_CHANNELS, Configuration.SAMPLE_BUFFER_CAPACITY)
+keep_raw_samples = Configuration.RAW_ARCHIVE_ENABLED
+# statistics of the CSV file ("log") and LoRa ("send") windows, updated at each measure
+log_statistics = window_statistics.WindowStatistics(Configuration.DATA_CHANNELS, Configuration.STATISTICS_PERCENTILES)
+send_statistics = window_statistics.WindowStatistics(Configuration.DATA_CHANNELS, Configuration.STATISTICS_PERCENTILES)
+# statistics of the measures by second, minute, 5 minutes and hour
+measures_rollups = rollups.Rollups(Configuration.DATA_CHANNELS, Configuration.ROLLUP_TIERS)
+last_hourly_summary = None
+first_measure_done = False
+
+# method used to read the wind speed with the deadline of the acquisition engine
+def read_wind_speed():
+    return anemometer.session.read_wind_speed(Configuration.SENSOR_DEADLINES_SEC["anemometer"])
+
+# method used to read the sun intensity level (there is no pyranometer on the exterior device)
+def read_radiation():
+    if Configuration.RASPBERRY_PI_ID == 1:
+        return 0
+    return pyrano.getRadiationFluxDensity()
+
+# method used to start or stop the background reader of the pyranometer (continuous mode) with the
+# measures, so the I2C bus is not used and the CPU not woken up while the station is stopped
+def set_pyranometer_sampling(running):
+    if not Configuration.PYRANOMETER_CONTINUOUS_MODE or Configuration.RASPBERRY_PI_ID == 1:
+        return
     try:
-        #set the pressure to the anemometer
-        if(measures_counter>Configuration.SECONDS_BETWEEN_PRESSURE_UPDATE*Configuration.SECONDS_BETWEEN_MEASURES):
-            measures_counter=0
-            pressure, altitude = bmp280.getPressureAndAltitude()
-            if anemometer.setPressure(str(pressure)):
-                logging.info("pressure set to anemometer")
-            else:
-                logging.error("problem while setting pressure to anemometer")
+        if running:
+            pyrano.sampler.start()
+        else:
+            pyrano.sampler.stop()
+    except Exception as e:
+        logging.error("failed to start or stop the pyranometer sampler: "+repr(e))
 
-        # get temperature from mcp and temperature and humidity from sht31      
-        temp_radiante = mcp9808.getRadiantTemperature()
-        temp, humidity = sht31_d.getTemperatureAndHumidity()
+# method used to calibrate the anemometer with the pressure measured by the bmp280
+def update_anemometer_pressure():
+    pressure, altitude = bmp280.getPressureAndAltitude()
+    if anemometer.setPressure(str(pressure)):
+        logging.info("pressure set to anemometer")
+    else:
+        logging.error("problem while setting pressure to anemometer")
+
+# acquisition engine reading every sensors in parallel, each one with its own deadline
+acquisition_engine = acquisition.AcquisitionEngine()
+acquisition_engine.add_sensor("mcp9808", lambda: mcp9808.getRadiantTemperature(), Configuration.SENSOR_DEADLINES_SEC["mcp9808"])
+acquisition_engine.add_sensor("sht31_d", lambda: sht31_d.getTemperatureAndHumidity(), Configuration.SENSOR_DEADLINES_SEC["sht31_d"])
+acquisition_engine.add_sensor("anemometer", read_wind_speed, Configuration.SENSOR_DEADLINES_SEC["anemometer"])
+acquisition_engine.add_sensor("pyrano", read_radiation, Configuration.SENSOR_DEADLINES_SEC["pyrano"])
+
+# scheduler giving the sensors to read at each tick, every sensor has its own period
+measures_scheduler = tick_scheduler.TickScheduler()
+for sensor_name in Configuration.SENSOR_PERIODS_SEC:
+    measures_scheduler.add_task(sensor_name, Configuration.SENSOR_PERIODS_SEC[sensor_name], Configuration.TICK_MISSED_POLICY)
+
+# method used to get data from the sensors and store it in the samples buffer
+# arguments are the names of the sensors due for this measure (every sensors when None)
+def measure_data(sensors=None):
+    results = read_sensors(sensors)
+    record_sample(time.time(), results)
+
+# method used to read the sensors, it returns the results of the sensors
+# a sensor that did not answer before its deadline is missing for this measure
+@metrics.timed_stage("read_sensors")
+def read_sensors(sensors=None):
+    if sensors is None:
+        sensors = acquisition_engine.sensors()
+    #set the pressure to the anemometer, the calibration is slow so it runs in the background. The serial
+    # port is left to the calibration: the wind speed is missing for this tick
+    if "bmp280" in sensors and acquisition_engine.run_in_background("bmp280", update_anemometer_pressure):
+        sensors = [name for name in sensors if name != "anemometer"]
+
+    results = acquisition_engine.acquire([name for name in sensors if name in acquisition_engine.sensors()])
+    if None in results.values():
+        logging.error("error while reading data, maybe a I2C or RS-485 device is disconnected")
+        set_led_interval(Configuration.LED_INTERVAL_SENSOR_ERROR)
+    elif led.interval == Configuration.LED_INTERVAL_SENSOR_ERROR:
+        # every sensor answered again
+        set_led_interval(Configuration.LED_INTERVAL_MEASURE)
+    return results
+
+# method used to store the results of the sensors as a sample in the samples buffer and the windows
+def record_sample(timestamp, results):
+    add_sample(timestamp, make_sample(results))
+
+# method used to get the value of each channel from the results of the sensors (None when missing)
+def make_sample(results):
+    temp, humidity = results.get("sht31_d") or (None, None)
+    return {"Rayonnement solaire total": results.get("pyrano"),
+            "Température": temp,
+            "Température globe": results.get("mcp9808"),
+            "Humidité": humidity,
+            "Vitesse du vent": results.get("anemometer")}
+
+# method used to store a sample in the samples buffer and the windows
+def add_sample(timestamp, sample):
+    global first_measure_done
+    # store the sample for the archive of the raw samples, the missing values are stored as NaN
+    if keep_raw_samples:
+        samples.append(timestamp, sample)
+    measures_rollups.add_sample(timestamp, sample)
+    log_statistics.update(sample)
+    send_statistics.update(sample)
+
+    if not first_measure_done:
+        first_measure_done = True
+        log_startup_step("first measure done")
+
+# method used to get the names of the extra statistics of the data file
+def extra_statistics_names():
+    return Configuration.DATA_FILE_EXTRA_STATISTICS_NAMES + ["p%g" % percentile for percentile in Configuration.STATISTICS_PERCENTILES]
+
+# method used to get the first line of the data file, with the columns of the extra statistics when they are enabled
+def data_file_first_line():
+    first_line = Configuration.DATA_FILE_FIRST_LINE
+    if Configuration.DATA_FILE_EXTRA_STATISTICS:
+        columns = [data_type+" "+name for data_type in Configuration.DATA_CHANNELS for name in extra_statistics_names()]
+        first_line = first_line.rstrip('\n')+','+','.join(columns)+'\n'
+    return first_line
+
+# method used to format a value of the data file (empty when the value is missing)
+def format_value(value):
+    if value is None:
+        return ''
+    return str("%.1f" % value)
+
+# method used to get the first line of the hourly summaries file
+def hourly_file_first_line():
+    columns = [data_type+" "+name for data_type in Configuration.DATA_CHANNELS for name in ["mean", "min", "max"]]
+    return "heure de la mesure,"+','.join(columns)+'\n'
+
+# data files, kept open between the writes
+data_file = csv_sink.CsvSink(Configuration.DATA_FILE_BEGINNING, data_file_first_line(), Configuration.DATA_FILE_ROTATION, Configuration.DATA_FILE_MAX_BYTES,
+                             Configuration.DATA_FILE_BUFFER_SIZE, Configuration.DATA_FILE_FLUSH_EVERY_LINES, Configuration.DATA_FILE_FSYNC_INTERVAL_SEC)
+hourly_file = csv_sink.CsvSink(Configuration.DATA_FILE_HOURLY_BEGINNING, hourly_file_first_line(), Configuration.DATA_FILE_ROTATION, Configuration.DATA_FILE_MAX_BYTES,
+                               Configuration.DATA_FILE_BUFFER_SIZE, 1, 0)
+
+# binary archive of the measures, opened with the first record
+archive = None
+
+# method used to append the means of a window to the binary archive
+def archive_data(timestamp, statistics):
+    global archive
+    if not Configuration.BINARY_ARCHIVE_ENABLED:
+        return
+    try:
+        if archive is None:
+            archive = binary_archive.BinaryArchiveWriter(Configuration.BINARY_ARCHIVE_FILE, Configuration.DATA_FILE_BUFFER_SIZE, Configuration.DATA_FILE_FLUSH_EVERY_LINES)
+        archive.append(timestamp, [statistics[data_type]["mean"] for data_type in Configuration.DATA_CHANNELS])
     except Exception as e:
-        logging.error(repr(e))
-        logging.error("error while reading data from i2c, maybe a I2C or RS-485 device is disconnected")
-        set_led_interval(20)
+        logging.error("failed to write the binary archive: "+repr(e))
+
+# compressed archive of the raw samples, opened with the first write
+raw_samples_archive = None
+samples.register_cursor("raw_archive")
+
+# method used to append the samples measured since the last call to the archive of the raw samples
+def archive_raw_samples():
+    global raw_samples_archive
+    if not Configuration.RAW_ARCHIVE_ENABLED:
         return
+    window = samples.read_window("raw_archive")
+    try:
+        if raw_samples_archive is None:
+            raw_samples_archive = raw_archive.RawArchiveWriter(Configuration.RAW_ARCHIVE_FILE, Configuration.RAW_ARCHIVE_BLOCK_SEC)
+        for index, timestamp in enumerate(window["timestamps"]):
+            raw_samples_archive.append(timestamp, [window[data_type][index] for data_type in Configuration.DATA_CHANNELS])
+    except Exception as e:
+        logging.error("failed to write the archive of the raw samples: "+repr(e))
+
+# SQLite database of the measures, opened with the first save
+store = None
+last_second_stored = None
 
+# method used to add the measures of a resolution to the SQLite database
+# arguments are the resolution in seconds and a list of (timestamp, dict with the mean of each channel)
+def store_data(resolution, rows):
+    global store
+    if not Configuration.SQLITE_STORE_ENABLED:
+        return
     try:
-        # get wind speed
-        wind_speed = anemometer.getMeasure()
+        if store is None:
+            store = sqlite_store.SqliteStore(Configuration.SQLITE_STORE_FILE, list(Configuration.SQLITE_RETENTION_SEC))
+        for timestamp, means in rows:
+            store.add(resolution, timestamp, [means[data_type] for data_type in Configuration.DATA_CHANNELS])
     except Exception as e:
-        logging.error("problem while reading wind anemometer")
-        wind_speed = -1
-    if Configuration.RASPBERRY_PI_ID == 1:
-        radiation = 0
-    else:
-        # get sun intensity level
-        radiation = pyrano.getRadiationFluxDensity()
-
-    # update both data structures and store them 
-    values_mesured = getValuesToLog()
-    values_mesured["Rayonnement solaire total"].append(radiation)
-    values_mesured["Température"].append(temp)
-    values_mesured["Température globe"].append(temp_radiante)
-    values_mesured["Humidité"].append(humidity)
-    values_mesured["Vitesse du vent"].append(wind_speed)
-    setValuesToLog(values_mesured)
-
-    values_mesured = getValuesToSend()
-    values_mesured["Rayonnement solaire total"].append(radiation)
-    values_mesured["Température"].append(temp)
-    values_mesured["Température globe"].append(temp_radiante)
-    values_mesured["Humidité"].append(humidity)
-    values_mesured["Vitesse du vent"].append(wind_speed)
-    setValuesToSend(values_mesured)
+        logging.error("failed to store the measures in the database: "+repr(e))
+
+# method used to add the seconds rolled up since the last call to the SQLite database and write the pending rows
+def flush_store():
+    global last_second_stored
+    if not Configuration.SQLITE_STORE_ENABLED:
+        return
+    start = -math.inf if last_second_stored is None else last_second_stored + 1
+    seconds = measures_rollups.query(1, start)
+    store_data(1, [(summary["start"], {data_type: summary[data_type]["mean"] for data_type in Configuration.DATA_CHANNELS}) for summary in seconds])
+    if seconds:
+        last_second_stored = seconds[-1]["start"]
+    try:
+        if store is not None:
+            store.flush()
+    except Exception as e:
+        logging.error("failed to write the measures in the database: "+repr(e))
+
+# method used to write the hourly summaries closed since the last call in the hourly summaries file
+def save_hourly_summaries():
+    global last_hourly_summary
+    measures_rollups.advance(time.time())
+    start = -math.inf if last_hourly_summary is None else last_hourly_summary + 1
+    summaries = measures_rollups.query(3600, start)
+    if not summaries:
+        return
+    for summary in summaries:
+        line = datetime.fromtimestamp(summary["start"]).strftime("%d/%m/%Y %H:%M:%S")
+        for data_type in Configuration.DATA_CHANNELS:
+            for name in ["mean", "min", "max"]:
+                line += ','+format_value(summary[data_type][name])
+        hourly_file.write_line(line)
+    store_data(3600, [(summary["start"], {data_type: summary[data_type]["mean"] for data_type in Configuration.DATA_CHANNELS}) for summary in summaries])
+    last_hourly_summary = summaries[-1]["start"]
+    # the old rows of the database are deleted once an hour
+    try:
+        if store is not None:
+            store.prune(Configuration.SQLITE_RETENTION_SEC)
+    except Exception as e:
+        logging.error("failed to delete the old measures from the database: "+repr(e))
+    logging.info("hourly summaries logged")
 
 # method called by the scheduler to save the data in a local CSV file
-def save_data():
+# arguments are the statistics of the window (the window since the last save is closed when None)
+@metrics.timed_stage("save_data")
+def save_data(statistics=None):
     line = ""
-    # getting the values
-    temp_values_to_log = getValuesToLog()
-    # resetting the data structure
-    innitValuesToLog()
-    # for each value, add the data to the line
-    for data_type in temp_values_to_log:
-        try:
-            line += ','+str("%.1f" % mean(temp_values_to_log[data_type]))
-        except:
-            logging.warning("No data to write into file")
-            return
+    archive_raw_samples()
+    # getting the statistics of the window since the last save
+    if statistics is None:
+        statistics = log_statistics.close()
+    if all(statistics[data_type]["count"] == 0 for data_type in Configuration.DATA_CHANNELS):
+        logging.warning("No data to write into file")
+        return
+    # for each value, add the data to the line (empty when the sensor was missing for the whole window)
+    for data_type in Configuration.DATA_CHANNELS:
+        if statistics[data_type]["mean"] is None:
+            logging.warning("No "+data_type+" data to write into file")
+        line += ','+format_value(statistics[data_type]["mean"])
+    if Configuration.DATA_FILE_EXTRA_STATISTICS:
+        for data_type in Configuration.DATA_CHANNELS:
+            for name in extra_statistics_names():
+                line += ','+format_value(statistics[data_type][name])
     # write values to the file
-    log_file = open(Configuration.DATA_FILE_BEGINNING+logs_filename+".csv", "a")
-    log_file.write(datetime.now().strftime("%d/%m/%Y %H:%M:%S")+line+"\n")
-    log_file.close
+    now = datetime.now()
+    data_file.write_line(now.strftime("%d/%m/%Y %H:%M:%S")+line, now)
+    archive_data(now.timestamp(), statistics)
+    store_data(60, [(now.timestamp(), {data_type: statistics[data_type]["mean"] for data_type in Configuration.DATA_CHANNELS})])
     logging.info("measures logged")
+    save_hourly_summaries()
+    flush_store()
 
 # method called by the scheduler to send the data on LoRa
-def send_to_lora():
+# arguments are the statistics of the window (the window since the last send is closed when None)
+@metrics.timed_stage("send_to_lora")
+def send_to_lora(statistics=None):
     logging.info("Sending to LoRa...")
-    # getting the values
-    values = getValuesToSend()
+    # getting the statistics of the window since the last send
+    if statistics is None:
+        statistics = send_statistics.close()
+    if all(statistics[data_type]["count"] == 0 for data_type in Configuration.DATA_CHANNELS):
+        logging.warning("No data to send to LoRa")
+        return
+    if Configuration.LORA_PAYLOAD_VERSION == payload.VERSION_BATCH:
+        queue_batch_frames()
+        return
+    # a sensor missing for the whole window is sent as -1
+    means = {}
+    for data_type in Configuration.DATA_CHANNELS:
+        means[data_type] = statistics[data_type]["mean"]
+        if means[data_type] is None:
+            logging.warning("No "+data_type+" data to send to LoRa")
+            means[data_type] = -1
+    radiation = means["Rayonnement solaire total"]
+    temp = means["Température"]
+    temp_radiante = means["Température globe"]
+    humidity = means["Humidité"]
+    vitesse_vent = means["Vitesse du vent"]
+    timestamp = int(datetime.now().timestamp())
+    # the frame is queued and sent by the outbox thread, the frames not sent are kept on the disk
     try:
-        radiation = mean(values["Rayonnement solaire total"])
-        temp = mean(values["Température"])
-        temp_radiante = mean(values["Température globe"])
-        humidity = mean(values["Humidité"])
-        vitesse_vent = mean(values["Vitesse du vent"])
+        outbox.put(send_lora.build_frame(False, timestamp, radiation, temp, temp_radiante, humidity, vitesse_vent, device_id))
     except Exception as e:
+        logging.error("failed to queue the LoRa frame: "+repr(e))
+
+# start of the last bucket sent in a version 2 frame
+last_batch_sent = None
+
+# method used to queue the means of the buckets of LORA_BATCH_INTERVAL_SEC closed since the last send in version 2 frames.
+# Each run of consecutive buckets is sent in as few frames as possible
+def queue_batch_frames():
+    global last_batch_sent
+    interval = Configuration.LORA_BATCH_INTERVAL_SEC
+    start = -math.inf if last_batch_sent is None else last_batch_sent + interval
+    summaries = measures_rollups.query(interval, start)
+    if not summaries:
         logging.warning("No data to send to LoRa")
-        print(e)
         return
-    # reset the data structure
-    innitValuesToSend()
-    timestamp = int(datetime.now().timestamp())
-    # if the device is 0, the process will wait a certain amount of time so that the two LoRa cards are not sending at the same time
-    if device_id==0:
-        time.sleep(Configuration.LORA_TIME_BETWEEN_INTERIOR_AND_EXTERIOR_SEC)
+    runs = [[summaries[0]]]
+    for summary in summaries[1:]:
+        if summary["start"] == runs[-1][-1]["start"] + interval:
+            runs[-1].append(summary)
+        else:
+            runs.append([summary])
     try:
-        # try sending to lora
-        if send_lora.send_data(False, timestamp, radiation, temp, temp_radiante, humidity, vitesse_vent, device_id, python_hat) is not 0:
-            raise CustomError
+        for run in runs:
+            means = [[summary[data_type]["mean"] for data_type in Configuration.DATA_CHANNELS] for summary in run]
+            for frame in payload.encode_batches(False, int(run[0]["start"]), interval, means, device_id, Configuration.LORA_MAX_PAYLOAD_BYTES):
+                outbox.put(frame)
+        last_batch_sent = summaries[-1]["start"]
     except Exception as e:
-        logging.error("send failed... trying again in 20 sec")
-        counter = 0
-        failed = True
-        # try sending again to LoRa when the first one failed
-        while(counter<Configuration.LORA_MAX_RETRIES_WHEN_FAILED):
-            # wait before sending again
-            time.sleep(Configuration.LORA_TIME_BETWEEN_RETRIES_SEC)
-            try:
-                if send_lora.send_data(False, timestamp, radiation, temp, temp_radiante, humidity, vitesse_vent, device_id, python_hat) is 0:
-                    failed = False
-                    break
-                else:
-                    logging.error("red hat failed")
-                    raise CustomError
-            except Exception as e:
-                counter += 1
-                logging.error("send failed again... trying again in 20 sec")
-        if failed:
-            logging.error("send failed, giving up sending to LoRa")
-
-# method used to change the led state
-def change_led_state(state):
-    if(state):
-        GPIO.output(Configuration.RASPBERRY_PI_LED_GPIO, GPIO.HIGH)
-    else:
-        GPIO.output(Configuration.RASPBERRY_PI_LED_GPIO, GPIO.LOW)
-
-# method used to innitialise a new data structure to log
-def innitValuesToLog():
-    setValuesToLog(Configuration.CONSTANT_DATA_STRUCTURE_INIT_VALUES)
-
-# method used to get the values. It uses a semaphore so there is no concurrency problem
-def getValuesToLog():
-    sem_values_to_log.acquire()
-    res = values_to_log
-    sem_values_to_log.release()
-    return res
-
-# method used to set the values. It uses a semaphore so there is no concurrency problem
-def setValuesToLog(values):
-    global values_to_log
-    sem_values_to_log.acquire()
-    values_to_log = values
-    sem_values_to_log.release()
-
-# method used to innitialise a new data structure to send
-def innitValuesToSend():
-    setValuesToSend(Configuration.CONSTANT_DATA_STRUCTURE_INIT_VALUES)
-
-# method used to get the values. It uses a semaphore so there is no concurrency problem
-def getValuesToSend():
-    sem_values_to_send.acquire()
-    res = values_to_send
-    sem_values_to_send.release()
-    return res
-
-# method used to set the values. It uses a semaphore so there is no concurrency problem
-def setValuesToSend(values):
-    global values_to_send
-    sem_values_to_send.acquire()
-    values_to_send = values
-    sem_values_to_send.release()
-
-# method used to prepare the led and call the send_to_lora() and set back the led interval when the send is done
-def send_data():
+        logging.error("failed to queue the LoRa frames: "+repr(e))
+
+# method called by the outbox thread to send a frame, the led blinks faster during the send
+def send_frame(frame):
+    interval = led.interval
     set_led_interval(0.1)
-    send_to_lora()
-    set_led_interval(1)
+    try:
+        return send_lora.send_payload(frame, python_hat)
+    finally:
+        # the interval is not set back when the state changed during the send
+        if led.interval == 0.1:
+            set_led_interval(interval)
+
+# method called by the outbox thread before the wait for the slot of a frame, the RAK811 joins the network
+def prepare_frame():
+    send_lora.prepare_send(python_hat)
+
+# slots of the devices and duty cycle budget, so that the LoRa cards of the stations are not sending at the same time
+# (the id of the device is set by set_device_id when the application starts)
+uplinks = uplink_scheduler.UplinkScheduler(device_id)
+# queue of the LoRa frames
+outbox = lora_outbox.LoraOutbox(Configuration.LORA_OUTBOX_DIRECTORY, send_frame,
+                                Configuration.LORA_TIME_BETWEEN_RETRIES_SEC, Configuration.LORA_MAX_TIME_BETWEEN_RETRIES_SEC,
+                                max_frames=Configuration.LORA_OUTBOX_MAX_FRAMES, scheduler=uplinks, prepare_function=prepare_frame)
+
+# metrics read from the objects of the application when the metrics are given
+def tick_metrics(field):
+    return lambda: {(name,): statistics[field] for name, statistics in measures_scheduler.get_statistics().items()}
+
+def pipeline_metrics():
+    if pipeline is None:
+        return {}
+    statistics = pipeline.get_statistics()
+    backlogs = {("samples",): statistics["backlog"]}
+    for sink in pipeline.sinks:
+        backlogs[(sink.name,)] = statistics[sink.name]["backlog"]
+    return backlogs
+
+metrics.registry.callback("demo_mi2_ticks_total", "Ticks of the measures", ["task"], tick_metrics("runs"), "counter")
+metrics.registry.callback("demo_mi2_tick_overruns_total", "Ticks missed because a measure took too long", ["task"], tick_metrics("overruns"), "counter")
+metrics.registry.callback("demo_mi2_ticks_skipped_total", "Missed ticks not caught up", ["task"], tick_metrics("skipped"), "counter")
+metrics.registry.callback("demo_mi2_outbox_frames", "LoRa frames waiting in the outbox", [], lambda: {(): len(outbox)})
+metrics.registry.callback("demo_mi2_outbox_sends_total", "Sends of the outbox by result", ["result"],
+                          lambda: {("sent",): outbox.sent, ("failed",): outbox.failed, ("dropped",): outbox.dropped}, "counter")
+metrics.registry.callback("demo_mi2_uplinks_delayed_total", "LoRa frames delayed by the duty cycle budget", [], lambda: {(): uplinks.delayed_frames}, "counter")
+metrics.registry.callback("demo_mi2_samples_pending", "Samples not yet written in the raw archive", [], lambda: {(): samples.pending("raw_archive")})
+metrics.registry.callback("demo_mi2_pipeline_backlog", "Items waiting in the queues of the asyncio pipeline", ["queue"], pipeline_metrics)
+
+# endpoint and file of the metrics
+metrics_server = None
+metrics_file = None
+
+# method used to start the endpoint and the file of the metrics
+# arguments are the name of the process in the processes mode (None otherwise)
+def start_metrics(process=None):
+    global metrics_server, metrics_file
+    if not Configuration.METRICS_ENABLED:
+        return
+    if process is not None:
+        metrics.registry.const_labels["process"] = process
+    elif Configuration.METRICS_HTTP_PORT is not None:
+        try:
+            metrics_server = metrics.MetricsServer()
+            metrics_server.start()
+        except Exception as e:
+            logging.error("failed to start the metrics endpoint: "+repr(e))
+    if Configuration.METRICS_TEXTFILE is not None:
+        path = Configuration.METRICS_TEXTFILE
+        if process is not None:
+            root, extension = os.path.splitext(path)
+            path = root+"_"+process+extension
+        metrics_file = metrics.TextfileWriter(path)
+        metrics_file.start()
 
 # method used to set the led interval
 def set_led_interval(interval):
-    sem_led_interval.acquire()
-    global led_interval
-    led_interval = interval
-    sem_led_interval.release()
-
-# method used to make the led blink
-def blink_led():
-    while(True):
-        sem_led_interval.acquire()
-        interval = led_interval
-        sem_led_interval.release()
-        time.sleep(led_interval/2)
-        change_led_state(True)
-        time.sleep(led_interval/2)
-        change_led_state(False)
+    led.set_interval(interval)
 
 # method to start the scheduler with the jobs so that he create a new process for each jobs based on the timings 
 # defined in the configuraiton file
 def start_jobs():
     global sched
+    global data_jobs
     # creating the scheduler and setting the jobs and the timing
     sched = BlockingScheduler()
-    send_job = sched.add_job(send_data, 'cron', minute=Configuration.MINUTES_TO_DATA_SEND, max_instances=5)
-    save_job = sched.add_job(save_data, 'cron', second=Configuration.SECONDS_TO_DATA_LOG, max_instances=5)
-    # start the led blinking thread
-    led_thread = threading.Thread(target=blink_led, args=())
-    led_thread.daemon = True
-    led_thread.start()
+    # the jobs are paused until the switch is on
+    send_job = sched.add_job(send_to_lora, 'cron', minute=Configuration.MINUTES_TO_DATA_SEND, max_instances=5, next_run_time=None)
+    save_job = sched.add_job(save_data, 'cron', second=Configuration.SECONDS_TO_DATA_LOG, max_instances=5, next_run_time=None)
+    data_jobs = [send_job, save_job]
+    statistics_job = sched.add_job(measures_scheduler.log_statistics, 'cron', minute=0)
+    lora_statistics_job = sched.add_job(send_lora.session.log_statistics, 'cron', minute=0)
+    uplinks_statistics_job = sched.add_job(uplinks.log_statistics, 'cron', minute=0)
+    # start the led blinking
+    led.start()
+    # start sending the frames of the outbox (the frames not sent before the last stop are sent first)
+    outbox.start()
     # start the values measurement thread
     measure_thread = threading.Thread(target=sched.start, args=())
     measure_thread.daemon = True
     measure_thread.start()
-    jobs_running = True
 
-# method used to wait for the beginning of the second to start the measure to precisely each beginning of second so there is no time shift
+# pipeline of the asyncio mode (PIPELINE_MODE), the windows are closed by the aggregator at the times of the jobs
+pipeline = None
+
+# method used to create the asyncio pipeline, with the same windows as the jobs of start_jobs()
+def create_pipeline():
+    global pipeline
+    # the modules of the pipelines are only imported in their mode (PIPELINE_MODE) so the start stays short
+    import async_pipeline
+    pipeline = async_pipeline.AsyncPipeline(measures_scheduler, read_sensors, record_sample)
+    pipeline.add_sink("csv", {"second": Configuration.SECONDS_TO_DATA_LOG}, save_data, log_statistics.close)
+    pipeline.add_sink("lora", {"minute": Configuration.MINUTES_TO_DATA_SEND}, send_to_lora, send_statistics.close)
+    pipeline.add_sink("statistics", {"minute": "0"}, log_pipeline_statistics)
+
+# coroutine running the asyncio pipeline, SIGTERM stops it
+async def run_pipeline_until_sigterm():
+    import asyncio
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, pipeline.stop)
+    await pipeline.run()
+
+# method used to run the asyncio pipeline until SIGTERM, the queues are finished before it returns
+def run_pipeline():
+    led.start()
+    outbox.start()
+    import asyncio
+    asyncio.run(run_pipeline_until_sigterm())
+    logging.info("application stopped")
+
+# method used to log the statistics of the scheduler of the measures, of the LoRa uplinks and of the pipeline
+def log_pipeline_statistics():
+    measures_scheduler.log_statistics()
+    send_lora.session.log_statistics()
+    uplinks.log_statistics()
+    pipeline.log_statistics()
+
+# supervisor and shared ring of the processes mode (PIPELINE_MODE)
+supervisor = None
+shared_ring = None
+acquisition_running = None
+# positions of the storage and uplink processes in the shared ring
+STORAGE_CONSUMER = 0
+UPLINK_CONSUMER = 1
+
+# method used to create the acquisition, storage and uplink processes, they are started by run_processes()
+def create_processes():
+    global supervisor, shared_ring, acquisition_running
+    import process_pipeline
+    import shared_sample_ring
+    shared_ring = shared_sample_ring.SharedSampleRing(Configuration.DATA_CHANNELS, Configuration.SHARED_RING_CAPACITY)
+    supervisor = process_pipeline.ProcessSupervisor()
+    acquisition_running = process_pipeline.SharedFlag()
+    supervisor.add_process("acquisition", run_acquisition_process, (shared_ring, acquisition_running))
+    supervisor.add_process("storage", run_storage_process, (shared_ring,))
+    supervisor.add_process("uplink", run_uplink_process, (shared_ring,))
+
+# method used to run the processes until SIGTERM, the supervisor restarts a process that stopped
+def run_processes():
+    led.start()
+    signal.signal(signal.SIGTERM, lambda signum, frame: supervisor.stop_event.set())
+    supervisor.start()
+    try:
+        supervisor.run()
+    finally:
+        supervisor.stop()
+        shared_ring.close()
+    logging.info("application stopped")
+
+# acquisition process: the sensors due at each tick are read and the samples written in the shared ring
+def run_acquisition_process(stop_event, ring, running):
+    start_metrics("acquisition")
+    hour = None
+    paused = True
+    while not stop_event.is_set():
+        if not running.wait(0.5):
+            if not paused:
+                set_pyranometer_sampling(False)
+            paused = True
+            continue
+        # the ticks start again at the next second after a stop of the measures
+        if paused:
+            set_pyranometer_sampling(True)
+            measures_scheduler.start()
+            paused = False
+        sensors = measures_scheduler.wait_next()
+        if sensors:
+            results = read_sensors(sensors)
+            ring.append(time.time(), make_sample(results))
+        if hour != int(time.time() // 3600):
+            if hour is not None:
+                measures_scheduler.log_statistics()
+            hour = int(time.time() // 3600)
+    set_pyranometer_sampling(False)
+
+# storage process: the windows of the data files are closed at the times of the save job
+def run_storage_process(stop_event, ring):
+    import process_pipeline
+    start_metrics("storage")
+    try:
+        process_pipeline.run_consumer(ring, STORAGE_CONSUMER, add_sample, [({"second": Configuration.SECONDS_TO_DATA_LOG}, save_data, log_statistics.close)], stop_event)
+    finally:
+        close_data_files()
+
+# uplink process: the LoRa windows are closed at the times of the send job and the frames sent by the outbox
+def run_uplink_process(stop_event, ring):
+    global keep_raw_samples
+    keep_raw_samples = False
+    import process_pipeline
+    start_metrics("uplink")
+    try:
+        if try_lora_connection():
+            logging.info("Connection with LoRa Sucessful")
+        else:
+            logging.error("Failed LoRa Connexion, continuing...")
+        outbox.start()
+        process_pipeline.run_consumer(ring, UPLINK_CONSUMER, add_sample, [({"minute": Configuration.MINUTES_TO_DATA_SEND}, send_to_lora, send_statistics.close),
+                                                                           ({"minute": "0"}, log_uplink_statistics, None)], stop_event)
+    finally:
+        close_data_files()
+
+# method used to log the statistics of the LoRa uplinks
+def log_uplink_statistics():
+    send_lora.session.log_statistics()
+    uplinks.log_statistics()
+
+# method used to wait for the next tick of the scheduler and measure the sensors due at this tick.
+# The ticks come from a monotonic clock so there is no time shift
 def run_measures():
-    time.sleep(Configuration.SECONDS_BETWEEN_MEASURES - ((time.time() - t0) % Configuration.SECONDS_BETWEEN_MEASURES))
-    measure_data()
+    sensors = measures_scheduler.wait_next()
+    if sensors:
+        measure_data(sensors)
 
 # method used at the start of the application to try to connect to the LoRa gateway
 def try_lora_connection():
@@ -294,7 +660,7 @@ def try_lora_connection():
         logging.info("Device ID (0 is interior and 1 is exterior) "+str(device_id))
         logging.info("Hat used (True = python library and False = C library) "+str(python_hat))
         # trying to send data to LoRa and handeling errors
-        if -1 == send_lora.send_data(True, int(datetime.now().timestamp()), -1, -1, -1, -1, -1, device_id, python_hat):
+        if -1 == send_lora.send_payload(send_lora.build_frame(True, int(datetime.now().timestamp()), -1, -1, -1, -1, -1, device_id), python_hat):
             if not python_hat:
                 logging.error("LoRa send error")
             else:
@@ -306,45 +672,125 @@ def try_lora_connection():
     finally:
         set_led_interval(1)
 
-# class used to throw custom exceptions
-class CustomError(Exception):
-    pass
+# method used to start the measures (state running)
+def start_measures():
+    if measures_running.is_set():
+        return
+    logging.info("button pushed, starting measures...")
+    set_led_interval(Configuration.LED_INTERVAL_MEASURE)
+    measures_scheduler.start()
+    measures_running.set()
+    if supervisor is not None:
+        # the sensors are only used by the acquisition process, it starts the pyranometer sampler
+        acquisition_running.set()
+        return
+    set_pyranometer_sampling(True)
+    if pipeline is not None:
+        pipeline.set_running(True)
+        return
+    for job in data_jobs:
+        job.resume()
+
+# method used to stop the measures (state idle), a measure waiting for its tick is interrupted
+def stop_measures():
+    if not measures_running.is_set():
+        return
+    logging.warning("button is not pushed...")
+    measures_running.clear()
+    measures_scheduler.wake()
+    set_led_interval(Configuration.LED_INTERVA_STOPPED)
+    if supervisor is not None:
+        acquisition_running.clear()
+        return
+    set_pyranometer_sampling(False)
+    if pipeline is not None:
+        pipeline.set_running(False)
+        return
+    # the jobs are paused so there is no wake up while the station is stopped
+    for job in data_jobs:
+        job.pause()
+
+# method called by the GPIO library when the switch changes
+def on_switch_change(channel):
+    if GPIO.input(Configuration.RASPBERRY_PI_SWITCH_GPIO) == GPIO.HIGH:
+        start_measures()
+    else:
+        stop_measures()
+
+# method used to close the data files, their buffers are written on the SD card
+def close_data_files():
+    set_pyranometer_sampling(False)
+    data_file.close()
+    hourly_file.close()
+    if archive is not None:
+        archive.close()
+    if store is not None:
+        store.close()
+    if raw_samples_archive is not None:
+        raw_samples_archive.close()
+    outbox.stop(timeout=1)
+    send_lora.session.close()
+    send_lora.daemon.close()
+    if metrics_file is not None:
+        metrics_file.stop()
+
+# method called when the application is stopped by the system (SIGTERM)
+def stop_application(signum, frame):
+    logging.info("application stopped")
+    sys.exit(0)
+
+# method used to set the id of the device of the frames and of the slot of its uplinks
+def set_device_id(new_device_id):
+    global device_id
+    device_id = new_device_id
+    uplinks.device_id = new_device_id
 
 # main method used to instantiate devices and GPIOS. it then try the LoRa connection, log the output 
 # and start measuring data from devices
 def main():
-    global device_id
-    device_id = Configuration.RASPBERRY_PI_ID
+    set_device_id(Configuration.RASPBERRY_PI_ID)
     global python_hat
     python_hat = Configuration.RASPBERRY_PI_IS_PYTHON_HAT
     GPIO.setwarnings(False)
     GPIO.setup(Configuration.RASPBERRY_PI_SWITCH_GPIO, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
     GPIO.setup(Configuration.RASPBERRY_PI_LED_GPIO, GPIO.OUT)
-    # writing the first line of the CSV file
-    log_file = open(Configuration.DATA_FILE_BEGINNING+logs_filename+".csv", "a")
-    log_file.write(Configuration.DATA_FILE_FIRST_LINE)
-    log_file.close()
-    t0 = time.time()
-    if try_lora_connection():
-        logging.info("Connection with LoRa Sucessful")
+    # the data files are written on the SD card when the application stops
+    atexit.register(close_data_files)
+    signal.signal(signal.SIGTERM, stop_application)
+    log_startup_step("GPIO ready")
+    if Configuration.PIPELINE_MODE != "processes":
+        start_metrics()
+    if Configuration.PIPELINE_MODE == "processes":
+        # the LoRa hat is only used by the uplink process, it tries the connection when it starts
+        create_processes()
     else:
-        logging.error("Failed LoRa Connexion, continuing...")
-    start_jobs()
-    button_is_pushed = False
-    # main while for the program, it nevers stops. It logs a warning when the button is not pushed
-    while True:
-        if GPIO.input(Configuration.RASPBERRY_PI_SWITCH_GPIO) == GPIO.HIGH:
-            if not button_is_pushed:
-                set_led_interval(1)
-                logging.info("button pushed, starting measures...")
-                button_is_pushed=True
-            # measure data from devices
-            run_measures()
+        if try_lora_connection():
+            logging.info("Connection with LoRa Sucessful")
+        else:
+            logging.error("Failed LoRa Connexion, continuing...")
+        if Configuration.PIPELINE_MODE == "asyncio":
+            create_pipeline()
         else:
-            button_is_pushed = False
-            logging.warning("button is not pushed...")
-            set_led_interval(Configuration.LED_INTERVA_STOPPED)
-            time.sleep(5)
+            start_jobs()
+    # the switch is followed with the edges detected by the GPIO library, the measures start and stop
+    # as soon as it changes. The state is read once at the start because there is no edge yet
+    GPIO.add_event_detect(Configuration.RASPBERRY_PI_SWITCH_GPIO, GPIO.BOTH, callback=on_switch_change, bouncetime=Configuration.SWITCH_BOUNCE_TIME_MS)
+    if GPIO.input(Configuration.RASPBERRY_PI_SWITCH_GPIO) == GPIO.HIGH:
+        start_measures()
+    else:
+        logging.warning("button is not pushed...")
+        set_led_interval(Configuration.LED_INTERVA_STOPPED)
+    if pipeline is not None:
+        run_pipeline()
+        return
+    if supervisor is not None:
+        run_processes()
+        return
+    # main while for the program, it nevers stops. It sleeps without waking up while the switch is off
+    while True:
+        measures_running.wait()
+        # measure data from devices
+        run_measures()
 
 # call the main function as entry point of program
 if __name__ == "__main__":
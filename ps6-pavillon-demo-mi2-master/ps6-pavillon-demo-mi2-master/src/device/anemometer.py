@@ -30,67 +30,160 @@
 
 import serial
 import time
+import logging
+import threading
 import Configuration
+from device import backend
 
-# method used to set the pressure
-# arguments are an integer for the pressure 
-def setPressure(pressure):
-    try:
-        # instantiate the serial communication
-        ser = serial.Serial(
-            Configuration.ANEMOMETER_SERIAL_PORT,
+# long-lived session with the anemometer. The serial port is opened once and kept open
+# between the readings, it is only reopened after an error (USB / RS-485 disconnected)
+class AnemometerSession:
+
+    def __init__(self, port=Configuration.ANEMOMETER_SERIAL_PORT, read_timeout=Configuration.ANEMOMETER_READ_TIMEOUT_SEC):
+        self.port = port
+        self.read_timeout = read_timeout
+        self.last_read_duration = None
+        self._ser = None
+        self._last_connection_attempt = None
+        self._lock = threading.Lock()
+
+    # open the serial port if it is not already open. A reconnection is only tried
+    # every ANEMOMETER_RECONNECT_DELAY_SEC so an unplugged anemometer does not slow every tick
+    def _connect(self):
+        if self._ser is not None:
+            return self._ser
+        now = time.monotonic()
+        if self._last_connection_attempt is not None and now - self._last_connection_attempt < Configuration.ANEMOMETER_RECONNECT_DELAY_SEC:
+            raise serial.SerialException("anemometer disconnected, waiting before reconnecting")
+        self._last_connection_attempt = now
+        self._ser = backend.get_backend().serial(
+            self.port,
             baudrate=9600,
             parity=serial.PARITY_NONE,
             stopbits=serial.STOPBITS_ONE,
             bytesize=serial.EIGHTBITS,
             xonxoff=0,
-            timeout=5)
-        # sending char B to let the anemometer know that we want to calibrate pressure value
-        ser.write(b'B')
-        while (ser.inWaiting() == 0):
-            time.sleep(0.1)
-        # read until we can write the value
-        serdata = ser.read_until(':')
-        # write the value to the anemometer
-        ser.write(pressure.encode('utf-8'))
-        while (ser.inWaiting() == 0):
-            time.sleep(0.1)
-        # send a carriage return to validate the calibation
-        ser.write('\r'.encode())
-        while (ser.inWaiting() == 0):
-            time.sleep(0.1)
-            time.sleep(0.1)
-        ser.close()
+            timeout=self.read_timeout)
+        logging.info("anemometer connected on "+self.port)
+        return self._ser
+
+    # close the serial port so the next request reconnects
+    def _disconnect(self):
+        if self._ser is not None:
+            try:
+                self._ser.close()
+            except Exception:
+                pass
+        self._ser = None
+
+    # the port is broken (device unplugged...), it will be reopened on the next request. A slow answer
+    # (TimeoutError is an OSError) is not a broken port, the late bytes are flushed on the next request
+    def _handle_error(self, error):
+        if not isinstance(error, TimeoutError):
+            self._disconnect()
+
+    # close the session
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+    # send a command and read the answer until the terminator (or the first bytes when there is no
+    # terminator) or until the deadline is reached. The read blocks in the driver (no polling) and the
+    # timeout is the time left before the deadline
+    def _request(self, command, terminator, deadline):
+        ser = self._connect()
+        ser.reset_input_buffer()
+        ser.write(command)
+        answer = b''
+        while not answer or (terminator is not None and not answer.endswith(terminator)):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("anemometer did not answer before the deadline")
+            ser.timeout = remaining
+            if terminator is None:
+                data = ser.read(max(1, ser.in_waiting))
+            else:
+                data = ser.read_until(terminator)
+            if not data:
+                raise TimeoutError("anemometer did not answer before the deadline")
+            answer += data
+        return answer
+
+    # get the wind speed value from the anemometer, the wait for the port (pressure calibration) is part of the timeout
+    # return the wind speed (float) or raise an exception when the read failed
+    def read_wind_speed(self, timeout=None):
+        if timeout is None:
+            timeout = self.read_timeout
+        start = time.monotonic()
+        if not self._lock.acquire(timeout=timeout):
+            raise TimeoutError("anemometer busy with the pressure calibration")
+        try:
+            try:
+                # sending char ' ' (space) to let the anemometer know that we want to get the values
+                serdata = self._request(b' ', b'\n', start + timeout)
+                # decoding the wind speed value as a float
+                return float(serdata.split()[0].decode('UTF-8'))
+            except (serial.SerialException, OSError) as e:
+                self._handle_error(e)
+                raise
+            finally:
+                self.last_read_duration = time.monotonic() - start
+                logging.debug("anemometer read took %.1f ms" % (self.last_read_duration*1000))
+                if self.last_read_duration > Configuration.SECONDS_BETWEEN_MEASURES:
+                    logging.warning("anemometer read took %.1f ms, longer than the measure period" % (self.last_read_duration*1000))
+        finally:
+            self._lock.release()
+
+    # set the pressure used by the anemometer for its calibration
+    # arguments are a string for the pressure
+    # the dialog keeps the port from the command to the last answer, a wind speed read sent in the middle
+    # would be taken as the pressure. The wind speed is not read at the tick of the calibration
+    def set_pressure(self, pressure, timeout=Configuration.ANEMOMETER_PRESSURE_TIMEOUT_SEC):
+        with self._lock:
+            deadline = time.monotonic() + timeout
+            try:
+                # sending char B to let the anemometer know that we want to calibrate pressure value
+                self._request(b'B', b':', deadline)
+                # write the value to the anemometer
+                self._request(pressure.encode('utf-8'), None, deadline)
+                # send a carriage return to validate the calibation
+                self._request(b'\r', None, deadline)
+            except (serial.SerialException, OSError) as e:
+                self._leave_prompt()
+                self._handle_error(e)
+                raise
+
+    # send a carriage return after a failed calibration so the anemometer leaves its pressure prompt and does
+    # not take the next command as the pressure (the caller must hold the lock)
+    def _leave_prompt(self):
+        if self._ser is None:
+            return
+        try:
+            self._ser.write(b'\r')
+        except Exception as e:
+            logging.warning("failed to leave the pressure prompt of the anemometer: "+repr(e))
+
+# session shared by the application
+session = AnemometerSession()
+
+# method used to set the pressure
+# arguments are a string for the pressure 
+def setPressure(pressure):
+    try:
+        session.set_pressure(pressure)
         return True
     except Exception as e:
-        print(e)
-        ser.close()
+        logging.error("anemometer pressure calibration failed: "+repr(e))
         return False
 
 # method used to get the wind speed value from the anemometer
 def getMeasure():
     try:
-        # instantiate the serial communication
-        ser = serial.Serial(
-            Configuration.ANEMOMETER_SERIAL_PORT,
-            baudrate=9600,
-            parity=serial.PARITY_NONE,
-            stopbits=serial.STOPBITS_ONE,
-            bytesize=serial.EIGHTBITS,
-            xonxoff=0,
-            timeout=5)
-        
-        # sending char ' ' (space) to let the anemometer know that we want to get the values
-        ser.write(b' ')
-        while (ser.inWaiting() == 0):
-            time.sleep(0.01)
-        serdata = ser.readline()
-        # decoding the wind speed value as a float
-        result = float(serdata.split()[0].decode('UTF-8'))
-        ser.close()
-        return result
+        return session.read_wind_speed()
     except Exception as e:
-        print(e)
-        time.sleep(0.01)
-        ser.close()
-        return False
\ No newline at end of file
+        logging.error("anemometer read failed: "+repr(e))
+        return False
+
+# return the duration of the last read in seconds (None when there was no read yet)
+def getLastReadDuration():
+    return session.last_read_duration
@@ -0,0 +1,482 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This module is the registry of the hardware backends used by the devices. 
+ The "blinka" backend talks to the real sensors, the "simulated" backend generates 
+ values with a configurable latency and noise and the "replay" backend plays back 
+ recorded data files. The simulated backends allow to run the application on a 
+ computer without the sensors.
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import csv
+import glob
+import math
+import time
+import random
+import bisect
+import logging
+import threading
+from datetime import datetime
+import Configuration
+
+# lock protecting the I2C bus shared by every sensors, a sensor must hold it while talking on the bus
+i2c_lock = threading.Lock()
+
+# backend talking to the real hardware (Blinka for the I2C sensors, pyserial for the anemometer,
+# RPi.GPIO for the switch and the led and rak811 for the LoRa hat)
+class BlinkaBackend:
+
+    def __init__(self):
+        self._i2c = None
+        self._i2c_creation_lock = threading.Lock()
+
+    # get the I2C bus, it is created once and shared by every sensors
+    def i2c(self):
+        with self._i2c_creation_lock:
+            if self._i2c is None:
+                import board
+                import busio
+                self._i2c = busio.I2C(board.SCL, board.SDA)
+            return self._i2c
+
+    def mcp9808(self):
+        import adafruit_mcp9808
+        return adafruit_mcp9808.MCP9808(self.i2c())
+
+    def sht31d(self):
+        import adafruit_sht31d
+        return adafruit_sht31d.SHT31D(self.i2c())
+
+    def bmp280(self):
+        import adafruit_bmp280
+        return adafruit_bmp280.Adafruit_BMP280_I2C(self.i2c())
+
+    def ads1115(self):
+        import adafruit_ads1x15.ads1115 as ADS
+        return ADS.ADS1115(self.i2c())
+
+    # let the ads1115 convert continuously at the given data rate (samples per second)
+    def set_continuous_mode(self, ads, data_rate):
+        from adafruit_ads1x15.ads1x15 import Mode
+        ads.mode = Mode.CONTINUOUS
+        ads.data_rate = data_rate
+
+    # get the delta between P0 and P1 connected wires of the ads1115
+    def differential_channel(self, ads):
+        import adafruit_ads1x15.ads1115 as ADS
+        from adafruit_ads1x15.analog_in import AnalogIn
+        return AnalogIn(ads, ADS.P0, ADS.P1)
+
+    def serial(self, port, **kwargs):
+        import serial
+        return serial.Serial(port, **kwargs)
+
+    def gpio(self):
+        import RPi.GPIO as GPIO
+        return GPIO
+
+    def rak811(self):
+        from rak811.rak811_v3 import Rak811
+        return Rak811()
+
+# sensor returned by the simulated backends. Every attribute is read with the function
+# given for it, after waiting the latency of the backend
+class SimulatedSensor:
+
+    def __init__(self, backend, **readers):
+        self._backend = backend
+        self._readers = readers
+
+    def __getattr__(self, name):
+        readers = self.__dict__.get("_readers", {})
+        if name not in readers:
+            raise AttributeError(name)
+        self._backend.wait()
+        return readers[name]()
+
+# serial port returned by the simulated backends. It answers like the anemometer: the wind speed
+# for a ' ' and the calibration prompt for a 'B'
+class SimulatedSerial:
+
+    def __init__(self, backend, timeout=None, **kwargs):
+        self._backend = backend
+        self._buffer = b''
+        self._ready_at = 0
+        self.timeout = timeout
+        self.is_open = True
+
+    def write(self, data):
+        if data == b' ':
+            self._buffer += ("%.2f m/s\r\n" % self._backend.wind_speed()).encode()
+        elif data == b'B':
+            self._buffer += b'Pressure:'
+        else:
+            self._buffer += data + b'\r\n'
+        self._ready_at = time.monotonic() + self._backend.scaled_latency()
+        return len(data)
+
+    @property
+    def in_waiting(self):
+        return len(self._buffer) if time.monotonic() >= self._ready_at else 0
+
+    def inWaiting(self):
+        return self.in_waiting
+
+    def reset_input_buffer(self):
+        self._buffer = b''
+
+    # wait until the answer is available or the timeout is reached
+    def _wait(self):
+        delay = self._ready_at - time.monotonic()
+        if delay > 0:
+            if self.timeout is not None and self.timeout < delay:
+                time.sleep(self.timeout)
+                return False
+            time.sleep(delay)
+        return True
+
+    def read(self, size=1):
+        if not self._wait():
+            return b''
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def read_until(self, expected=b'\n', size=None):
+        if not self._wait() or expected not in self._buffer:
+            return b''
+        end = self._buffer.index(expected) + len(expected)
+        data, self._buffer = self._buffer[:end], self._buffer[end:]
+        return data
+
+    def readline(self):
+        return self.read_until(b'\n')
+
+    def close(self):
+        self.is_open = False
+
+# PWM returned by the simulated GPIO
+class SimulatedPWM:
+
+    def __init__(self, channel, frequency):
+        self.frequency = frequency
+        self.duty_cycle = 0
+
+    def start(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+
+    def ChangeFrequency(self, frequency):
+        self.frequency = frequency
+
+    def ChangeDutyCycle(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+
+    def stop(self):
+        self.duty_cycle = 0
+
+# GPIO returned by the simulated backends, the switch is on until set_input() changes it
+class SimulatedGPIO:
+    BCM = 11
+    IN = 1
+    OUT = 0
+    HIGH = 1
+    LOW = 0
+    PUD_DOWN = 21
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        self.states = {}
+        self.callbacks = {}
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, channel, direction, pull_up_down=None):
+        self.states.setdefault(channel, self.HIGH if direction == self.IN else self.LOW)
+
+    def input(self, channel):
+        return self.states.get(channel, self.HIGH)
+
+    def output(self, channel, state):
+        self.states[channel] = state
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        self.callbacks[channel] = callback
+
+    def remove_event_detect(self, channel):
+        self.callbacks.pop(channel, None)
+
+    def PWM(self, channel, frequency):
+        return SimulatedPWM(channel, frequency)
+
+    # change the state of an input (the switch) and call its edge callback
+    def set_input(self, channel, state):
+        self.states[channel] = state
+        if self.callbacks.get(channel) is not None:
+            self.callbacks[channel](channel)
+
+    def cleanup(self):
+        pass
+
+# LoRa hat returned by the simulated backends
+class SimulatedRak811:
+
+    def __init__(self, backend):
+        self._backend = backend
+        self.sent = []
+
+    def set_config(self, config):
+        pass
+
+    def join(self):
+        self._backend.wait()
+
+    def send(self, data):
+        self._backend.wait()
+        self.sent.append(bytes(data))
+
+    def close(self):
+        pass
+
+# RAK811 driven with the AT commands of the v3 firmware on a serial port, used with the emulator
+# (rak811_emulator.py) when the rak811 library can not be imported (it needs RPi.GPIO)
+class SerialRak811:
+
+    def __init__(self, port, response_timeout=5, join_timeout=15):
+        import serial
+        self._serial = serial.Serial(port, 115200, timeout=0.1)
+        self.response_timeout = response_timeout
+        self.join_timeout = join_timeout
+
+    # send a command and wait for the "OK" or "ERROR:" answer
+    def _command(self, command, timeout):
+        self._serial.reset_input_buffer()
+        self._serial.write(("at+"+command+"\r\n").encode())
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            line = self._serial.readline().decode("ascii", "replace").strip()
+            if line.startswith("OK"):
+                return line[2:].strip()
+            if line.startswith("ERROR:"):
+                raise IOError("RAK811 error "+line[6:].strip())
+        raise TimeoutError("no answer of the RAK811 to "+command)
+
+    def set_config(self, config):
+        self._command("set_config="+config, self.response_timeout)
+
+    def join(self):
+        self._command("join", self.join_timeout)
+
+    def send(self, data, port=1):
+        self._command("send=lora:%d:%s" % (port, bytes(data).hex()), self.response_timeout)
+
+    def close(self):
+        self._serial.close()
+
+# backend generating the values of the sensors. The values follow a daily cycle with a gaussian noise.
+# arguments are the latency of every read in seconds, the standard deviation of the noise and
+# the speed of the simulated time compared to the real time (100 = 100 times faster). The RAK811 is
+# simulated, or is the RAK811 (emulator) on the serial port rak811_port when it is given
+class SimulatedBackend:
+
+    def __init__(self, latency=0.01, noise=0.1, speed=1, seed=None, rak811_port=None):
+        self.latency = latency
+        self.noise = noise
+        self.speed = speed
+        self.rak811_port = rak811_port
+        self._random = random.Random(seed)
+        self._real_start = time.monotonic()
+        self._simulated_start = time.time()
+
+    # simulated time as a timestamp
+    def now(self):
+        return self._simulated_start + (time.monotonic() - self._real_start) * self.speed
+
+    # latency of a read, shortened by the speed of the simulation
+    def scaled_latency(self):
+        return self.latency / self.speed
+
+    def wait(self):
+        if self.latency > 0:
+            time.sleep(self.scaled_latency())
+
+    # value between 0 (midnight) and 1 (noon) following the sun
+    def _daylight(self):
+        now = datetime.fromtimestamp(self.now())
+        hours = now.hour + now.minute / 60
+        return max(0.0, math.sin((hours - 6) / 12 * math.pi))
+
+    def _noisy(self, value):
+        return value + self._random.gauss(0, self.noise)
+
+    def radiation(self):
+        return max(0.0, self._noisy(300 * self._daylight()))
+
+    def temperature(self):
+        return self._noisy(12 + 10 * self._daylight())
+
+    def globe_temperature(self):
+        return self._noisy(14 + 14 * self._daylight())
+
+    def humidity(self):
+        return min(100.0, max(0.0, self._noisy(70 - 30 * self._daylight())))
+
+    def wind_speed(self):
+        return max(0.0, self._noisy(2 + 1.5 * self._daylight()))
+
+    def pressure(self):
+        return self._noisy(1013.25)
+
+    def i2c(self):
+        return None
+
+    def mcp9808(self):
+        return SimulatedSensor(self, temperature=self.globe_temperature)
+
+    def sht31d(self):
+        return SimulatedSensor(self, temperature=self.temperature, relative_humidity=self.humidity)
+
+    def bmp280(self):
+        return SimulatedSensor(self, pressure=self.pressure, altitude=lambda: 600.0)
+
+    # the ads1115 is simulated with its gain, the voltage of the channel is the inverse of the
+    # conversion done in pyrano.getRadiationFluxDensity()
+    def ads1115(self):
+        ads = SimulatedSensor(self)
+        ads.gain = 1
+        return ads
+
+    def set_continuous_mode(self, ads, data_rate):
+        ads.mode = "continuous"
+        ads.data_rate = data_rate
+
+    def differential_channel(self, ads):
+        return SimulatedSensor(self, voltage=lambda: self.radiation() * ads.gain * Configuration.PYRANOMETER_DIVIDE_NUMBER)
+
+    def serial(self, port, **kwargs):
+        return SimulatedSerial(self, **kwargs)
+
+    def gpio(self):
+        return SimulatedGPIO()
+
+    def rak811(self):
+        if self.rak811_port is None:
+            return SimulatedRak811(self)
+        try:
+            from rak811.rak811_v3 import Rak811
+            return Rak811(port=self.rak811_port)
+        except ImportError:
+            return SerialRak811(self.rak811_port)
+
+# backend playing back recorded data files (DATA_FILE_BEGINNING*.csv). The recorded time is
+# followed at the given speed, the files are played again from the beginning when they are finished
+class ReplayBackend(SimulatedBackend):
+
+    def __init__(self, files=Configuration.DATA_FILE_BEGINNING+"*.csv", speed=1, latency=0, noise=0, seed=None, rak811_port=None):
+        super().__init__(latency=latency, noise=noise, speed=speed, seed=seed, rak811_port=rak811_port)
+        self._timestamps = []
+        self._rows = []
+        for filename in sorted(glob.glob(files)):
+            with open(filename, newline='') as data_file:
+                for row in csv.reader(data_file):
+                    try:
+                        timestamp = datetime.strptime(row[0], "%d/%m/%Y %H:%M:%S").timestamp()
+                        values = [float(value) for value in row[1:6]]
+                    except (ValueError, IndexError):
+                        # header line or corrupted line
+                        continue
+                    self._timestamps.append(timestamp)
+                    self._rows.append(values)
+        if not self._rows:
+            raise ValueError("no recorded data found in "+files)
+        # the rows must be sorted by time to find the current one
+        order = sorted(range(len(self._timestamps)), key=lambda i: self._timestamps[i])
+        self._timestamps = [self._timestamps[i] for i in order]
+        self._rows = [self._rows[i] for i in order]
+        self._simulated_start = self._timestamps[0]
+        logging.info("replaying "+str(len(self._rows))+" recorded measures")
+
+    # get the recorded value of the column for the current simulated time
+    def _recorded(self, column):
+        duration = self._timestamps[-1] - self._timestamps[0] + 1
+        now = self._timestamps[0] + (self.now() - self._timestamps[0]) % duration
+        index = max(0, bisect.bisect_right(self._timestamps, now) - 1)
+        return self._noisy(self._rows[index][column])
+
+    def radiation(self):
+        return self._recorded(0)
+
+    def temperature(self):
+        return self._recorded(1)
+
+    def globe_temperature(self):
+        return self._recorded(2)
+
+    def humidity(self):
+        return self._recorded(3)
+
+    def wind_speed(self):
+        return self._recorded(4)
+
+# registry of the backends
+backends = {"blinka": BlinkaBackend, "simulated": SimulatedBackend, "replay": ReplayBackend}
+current_backend = None
+
+# add a backend to the registry
+# arguments are the name of the backend and the class (or function) creating it
+def register_backend(name, factory):
+    backends[name] = factory
+
+# select the backend used by the devices, it must be called before the devices are imported
+# arguments are the name of the backend and its options
+def use_backend(name, **options):
+    global current_backend
+    current_backend = backends[name](**options)
+    logging.info("using the "+name+" sensor backend")
+    return current_backend
+
+# get the backend used by the devices (the one of the configuration when none was selected)
+def get_backend():
+    if current_backend is None:
+        use_backend(Configuration.SENSOR_BACKEND, **Configuration.SENSOR_BACKEND_OPTIONS)
+    return current_backend
+
+# create a sensor with the backend and log the time it took. The caller must hold i2c_lock
+# arguments are the name of the method of the backend creating the sensor
+# return the sensor or raise an exception when it is not connected
+def create_sensor(name):
+    start = time.monotonic()
+    try:
+        sensor = getattr(get_backend(), name)()
+    except Exception as e:
+        logging.error(name+" not found on the bus: "+repr(e))
+        raise e
+    logging.info(name+" initialized in %.1f ms" % ((time.monotonic() - start)*1000))
+    return sensor
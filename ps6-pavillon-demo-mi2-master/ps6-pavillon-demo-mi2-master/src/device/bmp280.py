@@ -27,19 +27,25 @@
  Date:    Mai 2021
 '''
 
-import board
-import busio
-import adafruit_bmp280
 import time
+from device import backend
 
-# connect to the sensor via I2C
-i2c = busio.I2C(board.SCL, board.SDA)
-sensor = adafruit_bmp280.Adafruit_BMP280_I2C(i2c)
+# the sensor is connected via I2C the first time it is used
+sensor = None
+
+# get the sensor, it is created on the first call (the caller must hold the I2C lock)
+def getSensor():
+    global sensor
+    if sensor is None:
+        sensor = backend.create_sensor("bmp280")
+    return sensor
 
 # set the pressure (not used in this project atm)
 def setPressure(pressure):
-    sensor.sea_level_pressure = pressure
+    with backend.i2c_lock:
+        getSensor().sea_level_pressure = pressure
 
 # get the pressure and the altitude (only the pressure is used in the project atm)
 def getPressureAndAltitude():
-    return sensor.pressure, sensor.altitude
\ No newline at end of file
+    with backend.i2c_lock:
+        return getSensor().pressure, getSensor().altitude
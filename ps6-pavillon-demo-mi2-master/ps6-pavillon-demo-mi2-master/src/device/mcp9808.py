@@ -27,15 +27,20 @@
  Date:    Mai 2021
 '''
 
-import board
-import busio
-import adafruit_mcp9808
 import time
+from device import backend
 
-# connect to the sensor via I2C
-i2c = busio.I2C(board.SCL, board.SDA)
-mcp = adafruit_mcp9808.MCP9808(i2c)
+# the sensor is connected via I2C the first time it is used
+mcp = None
+
+# get the sensor, it is created on the first call (the caller must hold the I2C lock)
+def getSensor():
+    global mcp
+    if mcp is None:
+        mcp = backend.create_sensor("mcp9808")
+    return mcp
 
 # get the temperature from the chip
 def getRadiantTemperature():
-    return mcp.temperature
+    with backend.i2c_lock:
+        return getSensor().temperature
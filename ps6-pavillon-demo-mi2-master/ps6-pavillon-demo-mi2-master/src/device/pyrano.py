@@ -29,24 +29,103 @@
 '''
 
 
-import board
-import busio
-import adafruit_ads1x15.ads1115 as ADS
-from adafruit_ads1x15.analog_in import AnalogIn
+import time
+import logging
+import threading
+import collections
+from statistics import mean, median
 import Configuration
+from device import backend
 
-# connect to the sensor via I2C
-i2c = busio.I2C(board.SCL, board.SDA)
-ads = ADS.ADS1115(i2c)
-# set gain value
-ads.gain = 16
+# the converter is connected via I2C the first time it is used
+ads = None
+
+# get the converter, it is created on the first call (the caller must hold the I2C lock)
+def getConverter():
+    global ads
+    if ads is None:
+        converter = backend.create_sensor("ads1115")
+        # set gain value
+        converter.gain = 16
+        ads = converter
+    return ads
+
+# background reader of the ads1115 in continuous conversion mode. The last conversions are kept
+# in a fixed size ring buffer so a measure gets an oversampled value without waiting for a conversion
+class ContinuousSampler:
+
+    def __init__(self, size=Configuration.PYRANOMETER_OVERSAMPLING, interval=Configuration.PYRANOMETER_SAMPLE_INTERVAL_SEC):
+        self.interval = interval
+        self._samples = collections.deque(maxlen=size)
+        self._stop = threading.Event()
+        self._thread = None
+
+    # start the background reader
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="pyrano-sampler", daemon=True)
+        self._thread.start()
+
+    # stop the background reader, the conversions kept are dropped so they are not used after a restart
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._samples.clear()
+
+    # read the conversions until stopped, the buffer is cleared when the converter fails so
+    # old values are never used
+    def _run(self):
+        channel = None
+        while not self._stop.is_set():
+            try:
+                with backend.i2c_lock:
+                    if channel is None:
+                        converter = getConverter()
+                        backend.get_backend().set_continuous_mode(converter, Configuration.PYRANOMETER_DATA_RATE)
+                        channel = backend.get_backend().differential_channel(converter)
+                    self._samples.append(channel.voltage)
+                wait = self.interval
+            except Exception as e:
+                logging.error("pyranometer continuous read failed: "+repr(e))
+                self._samples.clear()
+                channel = None
+                wait = 1
+            self._stop.wait(wait)
+
+    # get the aggregated voltage of the buffered conversions ("mean" or "median")
+    # return None when there is no conversion yet
+    def voltage(self, aggregate=Configuration.PYRANOMETER_AGGREGATE):
+        samples = list(self._samples)
+        if not samples:
+            return None
+        if aggregate == "median":
+            return median(samples)
+        return mean(samples)
+
+sampler = ContinuousSampler()
+
+# get the voltage with a single conversion
+def getSingleVoltage():
+    with backend.i2c_lock:
+        # get delta between P0 and P1 connected wires
+        chan_delta = backend.get_backend().differential_channel(getConverter())
+        return chan_delta.voltage
 
 # get AC / DC conversion values from the pyranometer via the ads1115 chip
 def getRadiationFluxDensity():
-    # get delta between P0 and P1 connected wires
-    chan_delta = AnalogIn(ads, ADS.P0, ADS.P1)
+    voltage = None
+    if Configuration.PYRANOMETER_CONTINUOUS_MODE:
+        # the sampler is started and stopped with the measures (sampler.start() and sampler.stop())
+        voltage = sampler.voltage()
+    if voltage is None:
+        # no buffered conversion yet (sampler stopped or continuous mode disabled)
+        voltage = getSingleVoltage()
     # calculate result in watt by square meter 
-    result = ((chan_delta.voltage)/ Configuration.PYRANOMETER_DIVIDE_NUMBER)
+    result = (voltage / Configuration.PYRANOMETER_DIVIDE_NUMBER)
     # values seems to be not very stable so we clear every values under 0 to be 0
     if result <0:
         result = 0
@@ -29,14 +29,19 @@
 '''
 
 import time
-import board
-import busio
-import adafruit_sht31d
+from device import backend
  
-# Create library object using our Bus I2C port
-i2c = busio.I2C(board.SCL, board.SDA)
-sensor = adafruit_sht31d.SHT31D(i2c)
+# library object using our Bus I2C port, it is created the first time it is used
+sensor = None
+
+# get the sensor, it is created on the first call (the caller must hold the I2C lock)
+def getSensor():
+    global sensor
+    if sensor is None:
+        sensor = backend.create_sensor("sht31d")
+    return sensor
  
 # get the temperature and humidity valeus
 def getTemperatureAndHumidity():
-    return sensor.temperature, sensor.relative_humidity
\ No newline at end of file
+    with backend.i2c_lock:
+        return getSensor().temperature, getSensor().relative_humidity
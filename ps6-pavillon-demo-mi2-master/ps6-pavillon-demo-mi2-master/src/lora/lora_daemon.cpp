@@ -0,0 +1,428 @@
+/*******************************************************************************
+ * Copyright (c) 2015 Thomas Telkamp and Matthijs Kooijman
+ *
+ * Permission is hereby granted, free of charge, to anyone
+ * obtaining a copy of this document and accompanying files,
+ * to do whatever they want with them without any restriction,
+ * including, but not limited to, copying, modification and redistribution.
+ * NO WARRANTY OF ANY KIND IS PROVIDED.
+ *
+ * Long running version of send_lora: the LMIC session is joined once (OTAA)
+ * and kept, the frames are received on a local Unix socket and the result of
+ * each transmission is sent back to the client.
+ *
+ * Protocol (stream socket, one request at a time, all sizes in bytes):
+ *   request : command (1), port (1), length (1), payload (length)
+ *             command 0x01 send, 0x02 send confirmed, 0x03 status
+ *   response: status (1), length (1), downlink payload (length)
+ *             status 0x00 sent, 0x01 ack received, 0x02 no ack,
+ *             0x03 busy, 0x04 join failed, 0x05 bad request,
+ *             0x06 timeout, 0x07 link dead, 0x08 joined, 0x09 not joined
+ *
+ * Usage: sudo ./lora_daemon [socket path, default /run/lora_daemon.sock]
+ *
+ * Note: LoRaWAN per sub-band duty-cycle limitation is enforced (1% in
+ * g1, 0.1% in g2), but not the TTN fair usage policy.
+ *
+ *******************************************************************************/
+
+#include <stdio.h>
+#include <signal.h>
+#include <unistd.h>
+#include <time.h>
+#include <errno.h>
+#include <poll.h>
+#include <string.h>
+#include <sys/socket.h>
+#include <sys/stat.h>
+#include <sys/un.h>
+
+#include <lmic.h>
+#include <hal/hal.h>
+
+// This EUI must be in little-endian format, so least-significant-byte
+// first. When copying an EUI from ttnctl output, this means to reverse
+// the bytes. For TTN issued EUIs the last bytes should be 0xD5, 0xB3,0x70.
+static const u1_t PROGMEM APPEUI[8]= { 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00 };
+void os_getArtEui (u1_t* buf) { memcpy_P(buf, APPEUI, 8);}
+
+// This should also be in little endian format, see above.
+static const u1_t PROGMEM DEVEUI[8]= { 0xb4, 0xef, 0x44, 0xf7, 0x57, 0xc4, 0xf9, 0xee };
+void os_getDevEui (u1_t* buf) { memcpy_P(buf, DEVEUI, 8);}
+
+// This key should be in big endian format (or, since it is not really a
+// number but a block of memory, endianness does not really apply). In
+// practice, a key taken from ttnctl can be copied as-is.
+static const u1_t PROGMEM APPKEY[16] = { 0x68, 0x24, 0xc9, 0xe7, 0x31, 0x1a, 0x2a, 0xc8, 0x5d, 0xb1, 0x9b, 0x06, 0x5f, 0x06, 0x18, 0x55 };
+void os_getDevKey (u1_t* buf) {  memcpy_P(buf, APPKEY, 16);}
+
+#define CMD_SEND            0x01
+#define CMD_SEND_CONFIRMED  0x02
+#define CMD_STATUS          0x03
+
+#define STATUS_SENT         0x00
+#define STATUS_ACK          0x01
+#define STATUS_NO_ACK       0x02
+#define STATUS_BUSY         0x03
+#define STATUS_JOIN_FAILED  0x04
+#define STATUS_BAD_REQUEST  0x05
+#define STATUS_TIMEOUT      0x06
+#define STATUS_LINK_DEAD    0x07
+#define STATUS_JOINED       0x08
+#define STATUS_NOT_JOINED   0x09
+
+// Maximum payload of a frame (EU868, DR0)
+#define MAX_PAYLOAD 51
+
+// A join must succeed in this many seconds and a frame must be sent in
+// this many seconds (the duty-cycle can delay it)
+const unsigned JOIN_TIMEOUT = 15;
+const unsigned TX_TIMEOUT = 120;
+
+//Flag for Ctrl-C
+volatile sig_atomic_t force_exit = 0;
+
+// State of the LMIC session
+int is_joined = 0;
+int is_joining = 0;
+
+// Client connected and client waiting for the end of a transmission
+int client_fd = -1;
+int pending_fd = -1;
+int pending_confirmed = 0;
+ostime_t pending_start;
+
+// Dragino Raspberry PI hat (no onboard led)
+// see https://github.com/dragino/Lora
+#define RF_CS_PIN  RPI_V2_GPIO_P1_22 // Slave Select on GPIO25 so P1 connector pin #22
+#define RF_IRQ_PIN RPI_V2_GPIO_P1_07 // IRQ on GPIO4 so P1 connector pin #7
+#define RF_RST_PIN RPI_V2_GPIO_P1_11 // Reset on GPIO17 so P1 connector pin #11
+
+// Pin mapping
+const lmic_pinmap lmic_pins = { 
+    .nss  = RF_CS_PIN,
+    .rxtx = LMIC_UNUSED_PIN,
+    .rst  = RF_RST_PIN,
+    .dio  = {LMIC_UNUSED_PIN, LMIC_UNUSED_PIN, LMIC_UNUSED_PIN},
+};
+
+#ifndef RF_LED_PIN
+#define RF_LED_PIN NOT_A_PIN  
+#endif
+
+void log_time() {
+    char strTime[16];
+    getSystemTime(strTime , sizeof(strTime));
+    printf("%s: ", strTime);
+}
+
+/* ======================================================================
+Function: write_all / read_all
+Purpose : Write or read exactly length bytes on the socket
+Input   : socket, buffer, length
+Output  : 0 on success, -1 on error or closed socket
+Comments: -
+====================================================================== */
+int write_all(int fd, const u1_t* buf, size_t length) {
+    while (length > 0) {
+        ssize_t done = send(fd, buf, length, MSG_NOSIGNAL);
+        if (done < 0 && errno == EINTR)
+            continue;
+        if (done <= 0)
+            return -1;
+        buf += done;
+        length -= done;
+    }
+    return 0;
+}
+
+int read_all(int fd, u1_t* buf, size_t length) {
+    while (length > 0) {
+        ssize_t done = recv(fd, buf, length, 0);
+        if (done < 0 && errno == EINTR)
+            continue;
+        if (done <= 0)
+            return -1;
+        buf += done;
+        length -= done;
+    }
+    return 0;
+}
+
+/* ======================================================================
+Function: reply
+Purpose : Send a response to a client
+Input   : socket, status, downlink payload and its length
+Output  : -
+Comments: a client that went away is ignored
+====================================================================== */
+void reply(int fd, u1_t status, const u1_t* data, u1_t length) {
+    u1_t response[2 + 255];
+    response[0] = status;
+    response[1] = length;
+    if (length)
+        memcpy(response + 2, data, length);
+    if (write_all(fd, response, 2 + length) < 0) {
+        log_time();
+        printf("Client gone before the response\n");
+    }
+}
+
+// Answer the client waiting for the current transmission
+void finish(u1_t status) {
+    if (pending_fd < 0)
+        return;
+    if (status == STATUS_SENT || status == STATUS_ACK || status == STATUS_NO_ACK)
+        reply(pending_fd, status, LMIC.frame + LMIC.dataBeg, LMIC.dataLen);
+    else
+        reply(pending_fd, status, NULL, 0);
+    pending_fd = -1;
+}
+
+// Forget the session, the next frame joins again
+void reset_session() {
+    LMIC_reset();
+    is_joined = false;
+    is_joining = false;
+}
+
+void onEvent (ev_t ev) {
+    log_time();
+ 
+    switch(ev) {
+        case EV_JOINING:
+            printf("EV_JOINING\n");
+            is_joining=true;
+        break;
+        case EV_JOINED:
+            printf("EV_JOINED\n");
+            is_joining=false;
+            is_joined=true;
+            // Disable link check validation (automatically enabled
+            // during join, but not supported by TTN at this time).
+            LMIC_setLinkCheckMode(0);
+        break;
+        case EV_JOIN_FAILED:
+            printf("EV_JOIN_FAILED\n");
+            finish(STATUS_JOIN_FAILED);
+            reset_session();
+        break;
+        case EV_REJOIN_FAILED:
+            printf("EV_REJOIN_FAILED\n");
+            finish(STATUS_JOIN_FAILED);
+            reset_session();
+        break;
+        case EV_TXCOMPLETE:
+            printf("EV_TXCOMPLETE (includes waiting for RX windows)\n");
+            digitalWrite(RF_LED_PIN, LOW);
+            if (LMIC.dataLen)
+                printf("Received %d bytes of payload\n", LMIC.dataLen);
+            if (!pending_confirmed)
+                finish(STATUS_SENT);
+            else if (LMIC.txrxFlags & TXRX_ACK)
+                finish(STATUS_ACK);
+            else
+                finish(STATUS_NO_ACK);
+        break;
+        case EV_LOST_TSYNC:
+            printf("EV_LOST_TSYNC\n");
+        break;
+        case EV_RESET:
+            printf("EV_RESET\n");
+        break;
+        case EV_RXCOMPLETE:
+            // data received in ping slot
+            printf("EV_RXCOMPLETE\n");
+        break;
+        case EV_LINK_DEAD:
+            printf("EV_LINK_DEAD\n");
+            finish(STATUS_LINK_DEAD);
+            reset_session();
+        break;
+        case EV_LINK_ALIVE:
+            printf("EV_LINK_ALIVE\n");
+        break;
+        default:
+            printf("Event %d\n", ev);
+        break;
+    }
+    fflush(stdout);
+}
+
+/* ======================================================================
+Function: handle_request
+Purpose : Read a request of a client and start the transmission
+Input   : socket of the client
+Output  : 0, or -1 when the client closed the socket
+Comments: the response of a send is sent at the end of the transmission
+====================================================================== */
+int handle_request(int fd) {
+    u1_t header[3];
+    u1_t payload[255];
+    if (read_all(fd, header, 3) < 0)
+        return -1;
+    if (header[2] && read_all(fd, payload, header[2]) < 0)
+        return -1;
+
+    switch(header[0]) {
+        case CMD_STATUS:
+            reply(fd, is_joined ? STATUS_JOINED : STATUS_NOT_JOINED, NULL, 0);
+        break;
+        case CMD_SEND:
+        case CMD_SEND_CONFIRMED:
+            if (header[2] == 0 || header[2] > MAX_PAYLOAD || header[1] == 0 || header[1] > 223) {
+                reply(fd, STATUS_BAD_REQUEST, NULL, 0);
+            } else if (pending_fd >= 0 || (LMIC.opmode & OP_TXRXPEND)) {
+                reply(fd, STATUS_BUSY, NULL, 0);
+            } else {
+                log_time();
+                printf("Packet of %d bytes queued\n", header[2]);
+                digitalWrite(RF_LED_PIN, HIGH);
+                pending_fd = fd;
+                pending_confirmed = header[0] == CMD_SEND_CONFIRMED;
+                pending_start = os_getTime();
+                // Prepare upstream data transmission at the next possible time,
+                // the first one starts the OTAA join
+                LMIC_setTxData2(header[1], payload, header[2], pending_confirmed);
+            }
+        break;
+        default:
+            reply(fd, STATUS_BAD_REQUEST, NULL, 0);
+        break;
+    }
+    fflush(stdout);
+    return 0;
+}
+
+/* ======================================================================
+Function: open_socket
+Purpose : Create the Unix socket of the daemon
+Input   : path of the socket
+Output  : socket or -1
+Comments: the socket can be used by the application without sudo
+====================================================================== */
+int open_socket(const char* path) {
+    struct sockaddr_un address;
+    int fd = socket(AF_UNIX, SOCK_STREAM, 0);
+    if (fd < 0)
+        return -1;
+    memset(&address, 0, sizeof(address));
+    address.sun_family = AF_UNIX;
+    strncpy(address.sun_path, path, sizeof(address.sun_path) - 1);
+    unlink(path);
+    if (bind(fd, (struct sockaddr*)&address, sizeof(address)) < 0 || listen(fd, 4) < 0) {
+        close(fd);
+        return -1;
+    }
+    chmod(path, 0666);
+    return fd;
+}
+
+void sig_handler(int sig)
+{
+  printf("\nBreak received, exiting!\n");
+  force_exit=true;
+}
+
+/* ======================================================================
+Function: main
+Purpose : Keep the LoRa session and send the frames of the clients
+Input   : command line parameters
+Output  : -
+Comments: -
+====================================================================== */
+int main(int argc, char **argv) 
+{
+    const char* path = argc > 1 ? argv[1] : "/run/lora_daemon.sock";
+
+    // caught CTRL-C and the stop of the service to do clean-up
+    signal(SIGINT, sig_handler);
+    signal(SIGTERM, sig_handler);
+    
+    printf("%s Starting\n", __BASEFILE__);
+
+    int listen_fd = open_socket(path);
+    if (listen_fd < 0) {
+        fprintf( stderr, "Failed to open the socket %s: %s\n", path, strerror(errno) );
+        return 1;
+    }
+    
+      // Init GPIO bcm
+    if (!bcm2835_init()) {
+        fprintf( stderr, "bcm2835_init() Failed\n\n" );
+        return 1;
+    }
+
+	// Show board config
+    printConfig(RF_LED_PIN);
+    printKeys();
+
+    // Light off on board LED
+    pinMode(RF_LED_PIN, OUTPUT);
+    digitalWrite(RF_LED_PIN, LOW);
+
+    // LMIC init
+    os_init();
+    // Reset the MAC state. Session and pending data transfers will be discarded.
+    LMIC_reset();
+    printf("Listening on %s\n", path);
+    fflush(stdout);
+
+    while(!force_exit) {
+        os_runloop_once();
+
+        // Wait 1 ms for the clients, we're on a multitasking OS let some time for others
+        struct pollfd fds[2] = {{listen_fd, POLLIN, 0}, {client_fd, POLLIN, 0}};
+        if (poll(fds, client_fd >= 0 ? 2 : 1, 1) > 0) {
+            if (fds[0].revents & POLLIN) {
+                // one client at a time, a new client replaces the previous one
+                int fd = accept(listen_fd, NULL, NULL);
+                if (fd >= 0) {
+                    if (client_fd >= 0) {
+                        if (pending_fd == client_fd)
+                            pending_fd = -1;
+                        close(client_fd);
+                    }
+                    client_fd = fd;
+                }
+            } else if (client_fd >= 0 && fds[1].revents) {
+                if (handle_request(client_fd) < 0) {
+                    if (pending_fd == client_fd)
+                        pending_fd = -1;
+                    close(client_fd);
+                    client_fd = -1;
+                }
+            }
+        }
+
+        if (pending_fd >= 0) {
+            if (is_joining && pending_start + sec2osticks(JOIN_TIMEOUT) < os_getTime()) {
+                log_time();
+                printf("EV_JOIN_TIMEOUT\n");
+                finish(STATUS_JOIN_FAILED);
+                reset_session();
+            } else if (pending_start + sec2osticks(TX_TIMEOUT) < os_getTime()) {
+                log_time();
+                printf("EV_TX_TIMEOUT\n");
+                finish(STATUS_TIMEOUT);
+                LMIC_clrTxData();
+            }
+        }
+    }
+
+    // We're here because we need to exit, do it clean
+    finish(STATUS_TIMEOUT);
+    if (client_fd >= 0)
+        close(client_fd);
+    close(listen_fd);
+    unlink(path);
+
+    // Light off on board LED
+    digitalWrite(RF_LED_PIN, LOW);
+    
+    // module CS line High
+    digitalWrite(lmic_pins.nss, HIGH);
+    printf( "\n%s, done my job!\n", __BASEFILE__ );
+    bcm2835_close();
+    return 0;
+}
@@ -0,0 +1,171 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This module keeps the LoRa frames to send in a queue on the disk (one file per 
+ frame) and sends them from a separate thread. A frame that can not be sent stays in the 
+ queue and is sent again later with an exponential backoff, so the frames are kept when 
+ the gateway is not reachable or the device reboots, and the measures are never blocked. 
+ The uplink scheduler gives the time when each frame can be sent.
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import os
+import time
+import logging
+import threading
+
+FRAME_EXTENSION = ".frame"
+
+# queue of the LoRa frames stored in a directory and sent by a background thread
+class LoraOutbox:
+
+    # arguments are the directory of the queue, the function sending a frame (return 0 when the frame is sent),
+    # the first and the maximum time to wait after a failed send, the maximum number of frames kept (the oldest
+    # are dropped), the uplink scheduler (None to send the frames without waiting) and the function preparing
+    # the radio before the wait for the slot (join of the network, None when there is nothing to prepare)
+    def __init__(self, directory, send_function, backoff_min, backoff_max, max_frames=None, scheduler=None, prepare_function=None):
+        self.directory = directory
+        self.send_function = send_function
+        self.prepare_function = prepare_function
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.max_frames = max_frames
+        self.scheduler = scheduler
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self._backoff = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        os.makedirs(directory, exist_ok=True)
+        frames = self._frames()
+        self._next_id = int(frames[-1][:-len(FRAME_EXTENSION)]) + 1 if frames else 0
+        if frames:
+            logging.info(str(len(frames))+" LoRa frames waiting in the outbox")
+
+    # names of the frames in the queue, the oldest first
+    def _frames(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(FRAME_EXTENSION))
+
+    # number of frames waiting to be sent
+    def __len__(self):
+        with self._lock:
+            return len(self._frames())
+
+    # add a frame to the queue. The frame is written to a temporary file and renamed so a reboot during the
+    # write does not leave a partial frame in the queue
+    def put(self, frame):
+        with self._lock:
+            name = "%012d" % self._next_id + FRAME_EXTENSION
+            self._next_id += 1
+            temporary = os.path.join(self.directory, name+".tmp")
+            with open(temporary, "wb") as file:
+                file.write(frame)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, os.path.join(self.directory, name))
+            if self.max_frames is not None:
+                frames = self._frames()
+                for old in frames[:max(0, len(frames) - self.max_frames)]:
+                    os.remove(os.path.join(self.directory, old))
+                    self.dropped += 1
+                    logging.warning("LoRa outbox full, frame "+old+" dropped")
+        self._wake.set()
+
+    # oldest frame of the queue, None when the queue is empty
+    def _oldest(self):
+        with self._lock:
+            for name in self._frames():
+                try:
+                    with open(os.path.join(self.directory, name), "rb") as file:
+                        return name, file.read()
+                except OSError as e:
+                    logging.error("failed to read the LoRa frame "+name+": "+repr(e))
+                    os.remove(os.path.join(self.directory, name))
+        return None
+
+    def _remove(self, name):
+        with self._lock:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                # the frame was dropped because the outbox was full
+                pass
+
+    # send the oldest frame, return the time to wait before the next send or None when the queue is empty
+    def send_next(self):
+        oldest = self._oldest()
+        if oldest is None:
+            return None
+        name, frame = oldest
+        result = -1
+        try:
+            # the radio is ready before the slot (the join does not use the time of the slot)
+            if self.prepare_function is not None:
+                self.prepare_function()
+            # wait for the slot of the device and the duty cycle budget
+            if self.scheduler is not None and self._stop.wait(self.scheduler.delay(len(frame))):
+                return None
+            result = self.send_function(frame)
+        except Exception as e:
+            logging.error("LoRa send failed: "+repr(e))
+        if result == 0:
+            # only the frames sent use the duty cycle budget
+            if self.scheduler is not None:
+                self.scheduler.sent(len(frame))
+            self._remove(name)
+            self.sent += 1
+            self._backoff = 0
+            return 0
+        self.failed += 1
+        self._backoff = self.backoff_min if self._backoff == 0 else min(self._backoff * 2, self.backoff_max)
+        logging.error("LoRa send of the frame "+name+" failed, trying again in "+str(self._backoff)+" sec")
+        return self._backoff
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            if len(self) == 0:
+                self._wake.wait()
+                continue
+            delay = self.send_next()
+            if delay:
+                self._stop.wait(delay)
+
+    # start the sender thread
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="lora-outbox", daemon=True)
+            self._thread.start()
+
+    # stop the sender thread, the frames not sent stay in the queue
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,317 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This module keeps the metrics of the station (latency histograms of the sensors 
+ and of the steps, errors of the sensors and of the buses, ticks, queues, LoRa uplinks) and 
+ gives them in the Prometheus text format, on a local HTTP endpoint (/metrics) or in a text 
+ file written periodically (for the textfile collector of node_exporter). The metrics are 
+ updated in memory only (a lock and a few additions), the text is built when it is read. 
+ The values kept by the other modules (tick scheduler, outbox, ...) are read at that time 
+ with callbacks.
+
+ Usage:   curl http://127.0.0.1:9101/metrics
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import os
+import time
+import bisect
+import logging
+import threading
+import functools
+import Configuration
+
+# escape a label value of the text format
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+# format the labels of a sample
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join('%s="%s"' % (name, _escape(value)) for name, value in zip(names, values)) + "}"
+
+# format a value of the text format
+def _value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# set of metrics given together
+class Registry:
+
+    # arguments are the labels added to every sample (for example {"process": "storage"})
+    def __init__(self, const_labels=None, enabled=True):
+        self.const_labels = dict(const_labels or {})
+        self.enabled = enabled
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    # get a metric by its name, it is created the first time
+    def _get(self, cls, name, help, labels, **options):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(self, name, help, labels, **options)
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=Configuration.METRICS_LATENCY_BUCKETS_SEC):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    # metric read from a function when the metrics are given, the function returns a dict
+    # {tuple of the label values: value}
+    def callback(self, name, help, labels, function, type="gauge"):
+        return self._get(Callback, name, help, labels, function=function, type=type)
+
+    # give every metric in the Prometheus text format
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                logging.error("failed to read the metric "+metric.name+": "+repr(e))
+                continue
+            lines.append("# HELP %s %s" % (metric.name, metric.help))
+            lines.append("# TYPE %s %s" % (metric.name, metric.type))
+            const_names = list(self.const_labels)
+            const_values = list(self.const_labels.values())
+            for suffix, names, values, value in samples:
+                lines.append("%s%s%s %s" % (metric.name, suffix, _labels(const_names + list(names), const_values + list(values)), _value(value)))
+        return "\n".join(lines) + "\n"
+
+# base of the metrics: name, help, names of the labels and values by label values
+class Metric:
+
+    type = "untyped"
+
+    def __init__(self, registry, name, help, labels):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def samples(self):
+        with self._lock:
+            return [("", self.labels, key, value) for key, value in sorted(self._values.items())]
+
+class Counter(Metric):
+
+    type = "counter"
+
+    # add an amount to the counter of the label values
+    def inc(self, *labels, amount=1):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+class Gauge(Metric):
+
+    type = "gauge"
+
+    def set(self, value, *labels):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+class Histogram(Metric):
+
+    type = "histogram"
+
+    def __init__(self, registry, name, help, labels, buckets):
+        Metric.__init__(self, registry, name, help, labels)
+        self.buckets = sorted(buckets)
+
+    # add an observation to the histogram of the label values
+    def observe(self, value, *labels):
+        if not self.registry.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # counts of each bucket (and of the values above the last bucket), sum of the values
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    # context manager measuring the time of a block
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + [float("inf")], counts):
+                    cumulative += count
+                    samples.append(("_bucket", self.labels + ("le",), key + (_value(bound),), cumulative))
+                samples.append(("_sum", self.labels, key, total))
+                samples.append(("_count", self.labels, key, cumulative))
+        return samples
+
+class _Timer:
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exception):
+        self.histogram.observe(time.monotonic() - self.start, *self.labels)
+        return False
+
+class Callback(Metric):
+
+    def __init__(self, registry, name, help, labels, function, type):
+        Metric.__init__(self, registry, name, help, labels)
+        self.function = function
+        self.type = type
+
+    def samples(self):
+        return [("", self.labels, key, value) for key, value in sorted(self.function().items())]
+
+# metrics of the application
+registry = Registry(enabled=Configuration.METRICS_ENABLED)
+
+# metrics of the steps of the application and of the hardware
+stage_seconds = registry.histogram("demo_mi2_stage_duration_seconds", "Duration of the steps of the application", ["stage"])
+stage_errors = registry.counter("demo_mi2_stage_errors_total", "Exceptions raised by the steps of the application", ["stage"])
+sensor_seconds = registry.histogram("demo_mi2_sensor_read_duration_seconds", "Duration of the reads of the sensors", ["sensor"])
+sensor_errors = registry.counter("demo_mi2_sensor_errors_total", "Reads of the sensors without value (error, timeout or still busy)", ["sensor", "bus", "kind"])
+lora_joins = registry.counter("demo_mi2_lora_joins_total", "Joins of the RAK811 by result", ["result"])
+lora_join_seconds = registry.histogram("demo_mi2_lora_join_duration_seconds", "Duration of the joins of the RAK811", buckets=Configuration.METRICS_LORA_BUCKETS_SEC)
+lora_send_seconds = registry.histogram("demo_mi2_lora_send_duration_seconds", "Duration of the sends of the LoRa frames", ["path"], buckets=Configuration.METRICS_LORA_BUCKETS_SEC)
+lora_uplinks = registry.counter("demo_mi2_lora_uplinks_total", "Sends of the LoRa frames by result", ["path", "result"])
+
+# decorator measuring the duration and counting the exceptions of a step of the application
+def timed_stage(stage):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.monotonic()
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                stage_errors.inc(stage)
+                raise
+            finally:
+                stage_seconds.observe(time.monotonic() - start, stage)
+        return wrapper
+    return decorator
+
+# handler of the HTTP requests of the endpoint
+def _handler(metrics_registry):
+    import http.server
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = metrics_registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        # the requests are not written in the logs of the station
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+# local HTTP endpoint of the metrics, served by a daemon thread
+class MetricsServer:
+
+    def __init__(self, metrics_registry=registry, address=Configuration.METRICS_HTTP_ADDRESS, port=Configuration.METRICS_HTTP_PORT):
+        import http.server
+        self._server = http.server.ThreadingHTTPServer((address, port), _handler(metrics_registry))
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        logging.info("metrics served on http://%s:%d/metrics" % self._server.server_address)
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+# writer of the metrics in a text file, the file is replaced at once so it is never read half written
+class TextfileWriter:
+
+    def __init__(self, path, metrics_registry=registry, interval=Configuration.METRICS_TEXTFILE_INTERVAL_SEC):
+        self.path = path
+        self.registry = metrics_registry
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-textfile", daemon=True)
+
+    def write(self):
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as output:
+            output.write(self.registry.render())
+        os.replace(temporary, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except Exception as e:
+                logging.error("failed to write the metrics: "+repr(e))
+
+    def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._thread.start()
+
+    # stop the writer, the metrics are written a last time
+    def stop(self):
+        self._stop.set()
+        try:
+            self.write()
+        except Exception as e:
+            logging.error("failed to write the metrics: "+repr(e))
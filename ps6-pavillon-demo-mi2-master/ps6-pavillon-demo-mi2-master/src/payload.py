@@ -0,0 +1,209 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This module encodes and decodes the payloads of the LoRa frames. The first byte 
+ of a frame is the control byte: version of the payload (bits 0 to 3), device (bits 4 to 
+ 6) and test flag (bit 7).
+   version 1: one sample, '>cIhhhhh' (control, timestamp, the five values as int16)
+   version 2: several samples at a regular interval. Control, base timestamp (uint32), 
+              number of samples (uint8) and interval in seconds (varint), then for each 
+              channel the first value and the deltas to the previous value as zigzag 
+              varints (0 is a missing value, the other codes are shifted by one)
+ The values are scaled to integers with the same scales in both versions. The batch 
+ functions encode and decode many version 1 frames at once with NumPy.
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import struct
+import Configuration
+from varint import write_varint, read_varints
+
+VERSION_SINGLE = 1
+VERSION_BATCH = 2
+# the values are sent as integers: value * scale (radiation, temperature, globe temperature, humidity, wind speed)
+SCALES = [100, 100, 100, 100, 1000]
+V1_FORMAT = '>cIhhhhh'
+V1_SIZE = struct.calcsize(V1_FORMAT)
+V2_HEADER_FORMAT = '>BIB'
+V2_HEADER_SIZE = struct.calcsize(V2_HEADER_FORMAT)
+# code of a missing value in version 2
+MISSING = 0
+
+# Create the control byte of a frame
+# Input: version (int), isTest (bool), device (int between 0 and 7)
+# Return: control (int)
+def control_byte(version, isTest, device):
+    if not 0 <= device <= 7:
+        raise ValueError("the device id must be between 0 and 7")
+    return version | device << 4 | (0x80 if isTest else 0)
+
+# Read the control byte of a frame
+# Return: version (int), isTest (bool), device (int)
+def read_control_byte(control):
+    return control & 0x0f, bool(control & 0x80), (control >> 4) & 0x07
+
+# Encode one sample in a version 1 frame, the missing values must be replaced (by -1) before
+# Input: isTest (bool), timestamp (int), values (list of 5 floats), device (int)
+# Return: frame (bytes)
+def encode_v1(isTest, timestamp, values, device=0):
+    integers = [int(value * scale) for value, scale in zip(values, SCALES)]
+    return struct.pack(V1_FORMAT, bytes([control_byte(VERSION_SINGLE, isTest, device)]), timestamp, *integers)
+
+# Encode samples at a regular interval in a version 2 frame
+# Input: isTest (bool), timestamp of the first sample (int), interval in seconds (int), samples (list of lists of
+#        5 floats, None when missing), device (int)
+# Return: frame (bytes)
+def encode_v2(isTest, timestamp, interval, samples, device=0):
+    if not 0 < len(samples) < 256:
+        raise ValueError("a version 2 frame holds 1 to 255 samples")
+    frame = bytearray(struct.pack(V2_HEADER_FORMAT, control_byte(VERSION_BATCH, isTest, device), timestamp, len(samples)))
+    write_varint(frame, interval)
+    for channel, scale in enumerate(SCALES):
+        previous = 0
+        for sample in samples:
+            value = sample[channel]
+            if value is None:
+                write_varint(frame, MISSING)
+                continue
+            value = int(value * scale)
+            delta = value - previous
+            write_varint(frame, delta + 1 if delta >= 0 else delta)
+            previous = value
+    return bytes(frame)
+
+# Encode samples at a regular interval in as few version 2 frames as possible
+# Input: isTest (bool), timestamp of the first sample (int), interval in seconds (int), samples (list of lists of
+#        5 floats, None when missing), device (int), maximum size of a frame in bytes
+# Return: frames (list of bytes)
+def encode_batches(isTest, timestamp, interval, samples, device=0, max_size=51):
+    frames = []
+    first = 0
+    while first < len(samples):
+        # the biggest frame of the next samples that is not too big (at least one sample per frame)
+        count = min(len(samples) - first, 255)
+        frame = encode_v2(isTest, timestamp + first * interval, interval, samples[first:first + count], device)
+        while len(frame) > max_size and count > 1:
+            count -= 1
+            frame = encode_v2(isTest, timestamp + first * interval, interval, samples[first:first + count], device)
+        frames.append(frame)
+        first += count
+    return frames
+
+# Decode a frame of any version
+# Input: frame (bytes)
+# Return: list of samples, dicts with the timestamp, the test flag, the device and the values (None when missing)
+def decode(frame):
+    version, isTest, device = read_control_byte(frame[0])
+    if version == VERSION_SINGLE:
+        if len(frame) != V1_SIZE:
+            raise ValueError("a version 1 frame has %d bytes" % V1_SIZE)
+        fields = struct.unpack(V1_FORMAT, frame)
+        return [{"timestamp": fields[1], "test": isTest, "device": device,
+                 "values": [integer / scale for integer, scale in zip(fields[2:], SCALES)]}]
+    if version == VERSION_BATCH:
+        control, timestamp, count = struct.unpack_from(V2_HEADER_FORMAT, frame)
+        codes = read_varints(frame[V2_HEADER_SIZE:])
+        if len(codes) != 1 + count * len(SCALES):
+            raise ValueError("corrupted version 2 frame")
+        interval = codes[0]
+        columns = []
+        for channel, scale in enumerate(SCALES):
+            column = []
+            previous = 0
+            for code in codes[1 + channel * count:1 + (channel + 1) * count]:
+                if code == MISSING:
+                    column.append(None)
+                    continue
+                previous += code - 1 if code > 0 else code
+                column.append(previous / scale)
+            columns.append(column)
+        return [{"timestamp": timestamp + index * interval, "test": isTest, "device": device,
+                 "values": [column[index] for column in columns]} for index in range(count)]
+    raise ValueError("unknown payload version %d" % version)
+
+# NumPy type of a version 1 frame, the channels are named as the columns of the SQLite database
+def v1_dtype():
+    import numpy
+    return numpy.dtype([("control", "u1"), ("timestamp", ">u4")] + [(column, ">i2") for column in Configuration.DATA_CHANNEL_COLUMNS])
+
+# Encode many samples in version 1 frames at once
+# Input: timestamps (N ints), values (N x 5 floats), devices (int or N ints), isTest (bool or N bools)
+# Return: frames (bytes, the N frames of 15 bytes one after the other)
+def encode_v1_batch(timestamps, values, devices=0, isTest=False):
+    import numpy
+    values = numpy.asarray(values, dtype=numpy.float64)
+    devices = numpy.broadcast_to(numpy.asarray(devices, dtype=numpy.int64), (len(values),))
+    if numpy.any((devices < 0) | (devices > 7)):
+        raise ValueError("the device id must be between 0 and 7")
+    frames = numpy.empty(len(values), dtype=v1_dtype())
+    frames["control"] = VERSION_SINGLE | devices << 4 | numpy.where(isTest, 0x80, 0)
+    frames["timestamp"] = timestamps
+    for index, (column, scale) in enumerate(zip(Configuration.DATA_CHANNEL_COLUMNS, SCALES)):
+        # truncated toward zero like int() in encode_v1
+        integers = numpy.trunc(values[:, index] * scale)
+        if numpy.any((integers < -32768) | (integers > 32767)):
+            raise ValueError(column+" out of the range of a version 1 frame")
+        frames[column] = integers
+    return frames.tobytes()
+
+# Decode many version 1 frames at once
+# Input: frames (bytes of frames one after the other, or list of frames)
+# Return: dict of NumPy arrays: "timestamp", "version", "test", "device" and the values of each channel
+def decode_v1_batch(frames):
+    import numpy
+    if not isinstance(frames, (bytes, bytearray, memoryview)):
+        frames = b"".join(frames)
+    if len(frames) % V1_SIZE:
+        raise ValueError("the frames are not %d bytes long" % V1_SIZE)
+    records = numpy.frombuffer(frames, dtype=v1_dtype())
+    control = records["control"]
+    if numpy.any(control & 0x0f != VERSION_SINGLE):
+        raise ValueError("not only version 1 frames")
+    columns = {"timestamp": records["timestamp"].astype(numpy.int64),
+               "version": control & 0x0f,
+               "test": (control & 0x80) != 0,
+               "device": (control >> 4) & 0x07}
+    for column, scale in zip(Configuration.DATA_CHANNEL_COLUMNS, SCALES):
+        columns[column] = records[column] / scale
+    return columns
+
+# Decode frames of any version at once, the version 1 frames are decoded together with NumPy
+# Input: frames (list of frames)
+# Return: dict of NumPy arrays as decode_v1_batch (the missing values are NaN), the samples of the
+#         version 1 frames first
+def decode_batch(frames):
+    import numpy
+    single = [frame for frame in frames if frame[0] & 0x0f == VERSION_SINGLE]
+    columns = decode_v1_batch(single)
+    samples = [sample for frame in frames if frame[0] & 0x0f != VERSION_SINGLE for sample in decode(frame)]
+    if samples:
+        others = {"timestamp": numpy.array([sample["timestamp"] for sample in samples], dtype=numpy.int64),
+                  "version": numpy.full(len(samples), VERSION_BATCH, dtype=numpy.uint8),
+                  "test": numpy.array([sample["test"] for sample in samples]),
+                  "device": numpy.array([sample["device"] for sample in samples], dtype=numpy.uint8)}
+        for index, column in enumerate(Configuration.DATA_CHANNEL_COLUMNS):
+            others[column] = numpy.array([numpy.nan if sample["values"][index] is None else sample["values"][index] for sample in samples])
+        columns = {name: numpy.concatenate([columns[name], others[name]]) for name in columns}
+    return columns
@@ -0,0 +1,184 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This module runs the application in several processes: the acquisition process 
+ only reads the sensors and writes the samples in the shared ring (shared_sample_ring.py), 
+ the storage and uplink processes read the ring and close their windows at the times of 
+ their sinks. The slow calls (files, SQLite, LoRa, logging) of a process do not delay the 
+ ticks of the acquisition. The supervisor starts the processes and restarts a process 
+ that stopped, after a delay doubled at each crash, without stopping the others. The 
+ processes are forked from the supervisor, so they get the state of the application at 
+ the time of the fork (the supervisor must not use the sensors nor the LoRa hat).
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import time
+import signal
+import logging
+import multiprocessing
+from apscheduler.triggers.cron import CronTrigger
+import Configuration
+from async_pipeline import next_window_end
+
+# the processes are forked so they get the objects of the supervisor (the shared ring, the configuration)
+context = multiprocessing.get_context("fork")
+
+# flag shared by the processes, like multiprocessing.Event but without lock: the Event of multiprocessing
+# blocks the process calling set() when a process waiting on it was killed, the flag is only read and written
+class SharedFlag:
+
+    def __init__(self, poll_interval=0.05):
+        self.poll_interval = poll_interval
+        self._value = context.Value('b', 0, lock=False)
+
+    def set(self):
+        self._value.value = 1
+
+    def clear(self):
+        self._value.value = 0
+
+    def is_set(self):
+        return self._value.value == 1
+
+    # wait until the flag is set or the timeout, return True when the flag is set
+    def wait(self, timeout):
+        end = time.monotonic() + timeout
+        while not self.is_set():
+            delay = end - time.monotonic()
+            if delay <= 0:
+                return False
+            time.sleep(min(self.poll_interval, delay))
+        return True
+
+# first function of a child process
+def _run_child(name, target, stop_event, args):
+    # the supervisor stops the children with the stop event so they close their files. SIGINT (Ctrl-C of the
+    # terminal) and SIGTERM (sent by systemd to every process of the service) are for the supervisor
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    logging.info("process %s started (pid %d)" % (name, multiprocessing.current_process().pid))
+    target(stop_event, *args)
+
+# supervisor of the processes of the application
+class ProcessSupervisor:
+
+    # arguments are the delay before the restart of a stopped process (doubled at each stop up to max_restart_delay,
+    # set back when the process ran longer than max_restart_delay) and the time between two checks of the processes
+    def __init__(self, restart_delay=Configuration.PROCESS_RESTART_DELAY_SEC, max_restart_delay=Configuration.PROCESS_MAX_RESTART_DELAY_SEC,
+                 poll_interval=Configuration.PROCESS_POLL_INTERVAL_SEC):
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.poll_interval = poll_interval
+        self.stop_event = SharedFlag()
+        self._children = {}
+
+    # add a process, target is called with the stop event and the arguments in the child process
+    def add_process(self, name, target, args=()):
+        self._children[name] = {"target": target, "args": args, "process": None, "started": None,
+                                "restarts": 0, "delay": self.restart_delay, "restart_at": None}
+
+    def _start(self, name):
+        child = self._children[name]
+        child["process"] = context.Process(target=_run_child, name=name, args=(name, child["target"], self.stop_event, child["args"]), daemon=True)
+        child["process"].start()
+        child["started"] = time.monotonic()
+        child["restart_at"] = None
+
+    # start every process
+    def start(self):
+        for name in self._children:
+            self._start(name)
+
+    # restart the processes that stopped, after their delay
+    def check(self):
+        now = time.monotonic()
+        for name, child in self._children.items():
+            process = child["process"]
+            if process.is_alive():
+                if now - child["started"] > self.max_restart_delay:
+                    child["delay"] = self.restart_delay
+                continue
+            if child["restart_at"] is None:
+                logging.error("process %s stopped (exit code %s), restarted in %.0f sec" % (name, process.exitcode, child["delay"]))
+                process.join()
+                child["restart_at"] = now + child["delay"]
+                child["delay"] = min(child["delay"] * 2, self.max_restart_delay)
+            elif now >= child["restart_at"]:
+                child["restarts"] += 1
+                self._start(name)
+
+    # supervise the processes until the stop event is set
+    def run(self):
+        while not self.stop_event.wait(self.poll_interval):
+            self.check()
+
+    # stop every process, the processes still running after the timeout are killed (they ignore SIGTERM)
+    def stop(self, timeout=Configuration.PIPELINE_SHUTDOWN_TIMEOUT_SEC):
+        self.stop_event.set()
+        end = time.monotonic() + timeout
+        for name, child in self._children.items():
+            process = child["process"]
+            if process is None:
+                continue
+            process.join(max(0, end - time.monotonic()))
+            if process.is_alive():
+                logging.warning("process %s not stopped after %.0f sec, killed" % (name, timeout))
+                process.kill()
+                process.join()
+
+    # number of restarts of each process
+    def get_statistics(self):
+        return {name: child["restarts"] for name, child in self._children.items()}
+
+# read the samples of the shared ring and close the windows of the sinks, until the stop event is set.
+# The position of the consumer is saved in the ring at the start of the oldest open window, so a restarted
+# process reads again the samples of its open windows
+# arguments are the ring, the index of the consumer, the function adding a sample to the windows (it gets the
+# timestamp and a dict of the values, None when missing) and the sinks (cron fields, function writing a
+# window and function closing the window, None to call the write function without argument)
+def run_consumer(ring, consumer, add_sample, sinks, stop_event, poll_interval=Configuration.PROCESS_POLL_INTERVAL_SEC):
+    sinks = [{"trigger": CronTrigger(**trigger), "write": write, "close_window": close_window, "next": None, "start": None}
+             for trigger, write, close_window in sinks]
+    position = ring.cursor(consumer)
+    while not stop_event.wait(poll_interval):
+        position, samples = ring.read(position)
+        for sample_position, timestamp, values in samples:
+            for sink in sinks:
+                if sink["next"] is None:
+                    sink["next"] = next_window_end(sink["trigger"], timestamp)
+                    sink["start"] = sample_position
+                elif timestamp >= sink["next"]:
+                    try:
+                        if sink["close_window"] is None:
+                            sink["write"]()
+                        else:
+                            sink["write"](sink["close_window"]())
+                    except Exception as e:
+                        logging.error("failed to write a window: "+repr(e))
+                    sink["next"] = next_window_end(sink["trigger"], timestamp)
+                    sink["start"] = sample_position
+            add_sample(timestamp, {channel: None if value != value else value for channel, value in zip(ring.channels, values)})
+        starts = [sink["start"] for sink in sinks if sink["close_window"] is not None and sink["start"] is not None]
+        ring.set_cursor(consumer, min(starts) if starts else position)
@@ -0,0 +1,156 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This module emulates a RAK811 (v3 firmware) on a pseudo terminal, so the LoRa 
+ path of the application can be run without the hat. It answers the AT commands used by 
+ send_lora (set_config, join, send) with a configurable latency, random join and send 
+ failures and outages during which the module answers with errors or does not answer.
+
+ Usage:   emulator = Rak811Emulator(join_failure_rate=0.1); Rak811(port=emulator.port)
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import os
+import tty
+import time
+import random
+import select
+import logging
+import threading
+
+# error codes of the v3 firmware
+ERROR_NOT_JOINED = 86
+ERROR_TRANSMIT_TIMEOUT = 94
+ERROR_JOIN_FAILED = 99
+ERROR_UNKNOWN_COMMAND = 2
+
+# RAK811 answering on a pseudo terminal
+class Rak811Emulator:
+
+    # arguments are the probabilities of a failed join and of a failed send, the latencies of a join and of a
+    # send in seconds, the outages as (start, end) in seconds since the start of the emulator and the behavior
+    # of the module during an outage ("error": the join and send fail, "silent": the module does not answer)
+    def __init__(self, join_failure_rate=0, send_failure_rate=0, join_latency=0, send_latency=0,
+                 outages=(), outage_mode="error", seed=None):
+        self.join_failure_rate = join_failure_rate
+        self.send_failure_rate = send_failure_rate
+        self.join_latency = join_latency
+        self.send_latency = send_latency
+        self.outages = list(outages)
+        self.outage_mode = outage_mode
+        self.joined = False
+        self.joins = 0
+        self.join_failures = 0
+        self.sends = 0
+        self.send_failures = 0
+        # frames received: (time.monotonic(), payload)
+        self.received = []
+        self._random = random.Random(seed)
+        self._start = time.monotonic()
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rak811-emulator", daemon=True)
+        self._thread.start()
+
+    # the times of the outages start from now
+    def reset_clock(self):
+        self._start = time.monotonic()
+
+    # True during an outage
+    def in_outage(self):
+        now = time.monotonic() - self._start
+        return any(start <= now < end for start, end in self.outages)
+
+    def _answer(self, line):
+        os.write(self._master, (line+"\r\n").encode())
+
+    def _error(self, code):
+        self._answer("ERROR: %d" % code)
+
+    def _handle(self, line):
+        if not line.startswith("at+"):
+            return
+        command = line[3:]
+        if command.startswith("set_config="):
+            self._answer("OK ")
+        elif command == "join":
+            self.joins += 1
+            time.sleep(self.join_latency)
+            if self.in_outage():
+                self.join_failures += 1
+                self.joined = False
+                if self.outage_mode == "error":
+                    self._error(ERROR_JOIN_FAILED)
+            elif self._random.random() < self.join_failure_rate:
+                self.join_failures += 1
+                self.joined = False
+                self._error(ERROR_JOIN_FAILED)
+            else:
+                self.joined = True
+                self._answer("OK Join Success")
+        elif command.startswith("send=lora:"):
+            self.sends += 1
+            if not self.joined:
+                self.send_failures += 1
+                self._error(ERROR_NOT_JOINED)
+                return
+            time.sleep(self.send_latency)
+            if self.in_outage():
+                self.send_failures += 1
+                if self.outage_mode == "error":
+                    self._error(ERROR_TRANSMIT_TIMEOUT)
+            elif self._random.random() < self.send_failure_rate:
+                self.send_failures += 1
+                self._error(ERROR_TRANSMIT_TIMEOUT)
+            else:
+                self.received.append((time.monotonic(), bytes.fromhex(command.split(":")[2])))
+                self._answer("OK ")
+        else:
+            self._error(ERROR_UNKNOWN_COMMAND)
+
+    def _run(self):
+        buffer = b""
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._master], [], [], 0.1)
+            if not readable:
+                continue
+            try:
+                buffer += os.read(self._master, 1024)
+            except OSError:
+                return
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                try:
+                    self._handle(line.decode("ascii").strip())
+                except Exception as e:
+                    logging.error("RAK811 emulator failed: "+repr(e))
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        os.close(self._master)
+        os.close(self._slave)
@@ -0,0 +1,271 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This module writes and reads the compressed archive of the raw samples (one 
+ sample per second). The samples are grouped in blocks of a few minutes. In a block the 
+ timestamps (milliseconds) are stored as delta of delta and the values of each channel, 
+ rounded to the resolution of the LoRa frames, as deltas, all written as zigzag varints 
+ and compressed with zlib. A block is written when it is sealed, with a CRC, so a power 
+ loss only loses the open block. The reader decodes the blocks one by one.
+
+ Usage:   python3 raw_archive.py data/raw.bin export.csv [--start dd/mm/YYYY] [--end dd/mm/YYYY]
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import os
+import math
+import zlib
+import struct
+import logging
+import argparse
+import threading
+from datetime import datetime
+import Configuration
+from varint import write_varint, read_varints
+
+# header of a block: magic, version of the format, flags, number of channels, number of samples, first
+# timestamp and duration of the block in milliseconds, size and CRC of the payload
+MAGIC = b"DMRW"
+VERSION = 1
+FLAG_ZLIB = 1
+BLOCK_HEADER_FORMAT = "<4sBBHIqIII"
+BLOCK_HEADER_SIZE = struct.calcsize(BLOCK_HEADER_FORMAT)
+# code of a missing value in the stream of a channel
+MISSING = 0
+
+# encode the samples of a block
+# arguments are the timestamps in milliseconds, the values of each channel as integers (None when missing)
+# and the flags of the block
+# return the payload of the block
+def encode_block(timestamps, columns, flags=FLAG_ZLIB):
+    payload = bytearray()
+    previous = timestamps[0]
+    previous_delta = 0
+    for timestamp in timestamps[1:]:
+        delta = timestamp - previous
+        write_varint(payload, delta - previous_delta)
+        previous = timestamp
+        previous_delta = delta
+    for column in columns:
+        # the codes are shifted by one so 0 is kept for the missing values
+        previous = 0
+        for value in column:
+            if value is None:
+                write_varint(payload, MISSING)
+                continue
+            delta = value - previous
+            write_varint(payload, delta + 1 if delta >= 0 else delta)
+            previous = value
+    payload = bytes(payload)
+    if flags & FLAG_ZLIB:
+        payload = zlib.compress(payload, 6)
+    return payload
+
+# decode the payload of a block
+# return the timestamps in milliseconds and the values of each channel as integers (None when missing)
+def decode_block(payload, flags, count, first_timestamp, channels):
+    if flags & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    codes = read_varints(payload)
+    if len(codes) != count - 1 + count * channels:
+        raise ValueError("corrupted block")
+    timestamps = [first_timestamp]
+    delta = 0
+    for delta_of_delta in codes[:count - 1]:
+        delta += delta_of_delta
+        timestamps.append(timestamps[-1] + delta)
+    columns = []
+    for channel in range(channels):
+        column = []
+        previous = 0
+        for code in codes[count - 1 + channel * count:count - 1 + (channel + 1) * count]:
+            if code == MISSING:
+                column.append(None)
+                continue
+            previous += code - 1 if code > 0 else code
+            column.append(previous)
+        columns.append(column)
+    return timestamps, columns
+
+# find the next block header after an offset
+# return the offset of the next magic or None when there is none until the end of the file
+def find_next_block(file, offset, chunk_size=65536):
+    file.seek(offset)
+    position = offset
+    tail = b""
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            return None
+        data = tail + chunk
+        index = data.find(MAGIC)
+        if index >= 0:
+            return position - len(tail) + index
+        tail = data[-(len(MAGIC) - 1):]
+        position += len(chunk)
+
+# read every complete block of an archive file. A block cut by a power loss (its header or its payload runs
+# past the end of the file, or its header is unreadable and no block follows, a tail of zeros for example)
+# ends the archive, an unreadable header followed by other blocks is skipped
+# return an iterator of tuples (offset of the block, header fields, payload, True when the CRC is right)
+def read_blocks(file):
+    while True:
+        offset = file.tell()
+        header = file.read(BLOCK_HEADER_SIZE)
+        if len(header) < BLOCK_HEADER_SIZE:
+            return
+        fields = struct.unpack(BLOCK_HEADER_FORMAT, header)
+        magic, version, flags, channels, count, first_timestamp, duration, size, crc = fields
+        if offset == 0 and magic == MAGIC and version != VERSION:
+            raise ValueError("unsupported raw archive version %d" % version)
+        if magic != MAGIC or version != VERSION:
+            following = find_next_block(file, offset + 1)
+            if following is None:
+                return
+            logging.error("unreadable raw archive header at offset %d, %d bytes skipped" % (offset, following - offset))
+            file.seek(following)
+            continue
+        payload = file.read(size)
+        if len(payload) < size:
+            return
+        yield offset, fields, payload, zlib.crc32(payload) == crc
+
+# read the valid blocks of an archive file, a corrupted block is logged and skipped
+# return an iterator of tuples (offset of the block, header fields, payload)
+def iter_blocks(file):
+    for offset, fields, payload, valid in read_blocks(file):
+        if not valid:
+            logging.error("corrupted raw archive block at offset %d skipped" % offset)
+            continue
+        yield offset, fields, payload
+
+# writer grouping the samples in blocks and appending the sealed blocks at the end of the archive
+class RawArchiveWriter:
+
+    # arguments are the path of the archive, the duration of a block in seconds, the scale of each channel
+    # (the values are rounded to 1/scale) and the flags of the blocks
+    def __init__(self, path, block_seconds=300, scales=Configuration.RAW_ARCHIVE_SCALES, flags=FLAG_ZLIB):
+        self.path = path
+        self.block_seconds = block_seconds
+        self.scales = list(scales)
+        self.flags = flags
+        self.blocks = 0
+        self.samples = 0
+        self.bytes = 0
+        self._timestamps = []
+        self._columns = [[] for scale in self.scales]
+        self._lock = threading.Lock()
+        # a block cut by a power loss is dropped so the next blocks can be read. The corrupted blocks
+        # before it are kept (the readers skip them) so the valid blocks after them are not lost
+        if os.path.exists(path):
+            with open(path, "rb") as archive:
+                end = 0
+                for offset, fields, payload, valid in read_blocks(archive):
+                    end = offset + BLOCK_HEADER_SIZE + len(payload)
+                    if not valid:
+                        logging.error("corrupted raw archive block at offset %d in %s" % (offset, path))
+            if end != os.path.getsize(path):
+                logging.warning("raw archive %s cut at offset %d, the last block was not complete" % (path, end))
+                os.truncate(path, end)
+        self._file = open(path, "ab")
+
+    # add a sample to the open block, the block is sealed when it is longer than the block duration
+    # arguments are the timestamp in seconds and the values of the channels (None or NaN when missing)
+    def append(self, timestamp, values):
+        with self._lock:
+            timestamp = int(round(timestamp * 1000))
+            # a block is sealed when it is full or when the clock went back (time set by NTP after the boot)
+            if self._timestamps and (timestamp - self._timestamps[0] >= self.block_seconds * 1000 or timestamp < self._timestamps[-1]):
+                self._seal()
+            self._timestamps.append(timestamp)
+            for column, scale, value in zip(self._columns, self.scales, values):
+                column.append(None if value is None or math.isnan(value) else int(round(value * scale)))
+
+    # write the open block at the end of the archive (the caller must hold the lock)
+    def _seal(self):
+        if not self._timestamps:
+            return
+        payload = encode_block(self._timestamps, self._columns, self.flags)
+        header = struct.pack(BLOCK_HEADER_FORMAT, MAGIC, VERSION, self.flags, len(self._columns), len(self._timestamps),
+                             self._timestamps[0], self._timestamps[-1] - self._timestamps[0], len(payload), zlib.crc32(payload))
+        self._file.write(header + payload)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.blocks += 1
+        self.samples += len(self._timestamps)
+        self.bytes += len(header) + len(payload)
+        self._timestamps = []
+        self._columns = [[] for scale in self.scales]
+
+    # seal the open block
+    def flush(self):
+        with self._lock:
+            self._seal()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._seal()
+                self._file.close()
+
+# read the samples of an archive block by block, the blocks outside of the time range are not decoded
+# return an iterator of tuples (timestamp in seconds, values of the channels with None when missing)
+def iter_samples(path, start=-math.inf, end=math.inf, scales=Configuration.RAW_ARCHIVE_SCALES):
+    with open(path, "rb") as archive:
+        for offset, fields, payload in iter_blocks(archive):
+            magic, version, flags, channels, count, first_timestamp, duration, size, crc = fields
+            if (first_timestamp + duration) / 1000 < start or first_timestamp / 1000 >= end:
+                continue
+            timestamps, columns = decode_block(payload, flags, count, first_timestamp, channels)
+            for index, timestamp in enumerate(timestamps):
+                if start <= timestamp / 1000 < end:
+                    yield timestamp / 1000, [None if column[index] is None else column[index] / scale for column, scale in zip(columns, scales)]
+
+# write the samples of an archive between two timestamps in the CSV format of the data files
+def export_csv(path, output, start=-math.inf, end=math.inf):
+    count = 0
+    with open(output, "w") as csv_file:
+        csv_file.write(Configuration.DATA_FILE_FIRST_LINE)
+        for timestamp, values in iter_samples(path, start, end):
+            line = datetime.fromtimestamp(timestamp).strftime("%d/%m/%Y %H:%M:%S")
+            for value in values:
+                line += ',' + ('' if value is None else "%.1f" % value)
+            csv_file.write(line + "\n")
+            count += 1
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the archive of the raw samples in the CSV format of the data files")
+    parser.add_argument("archive")
+    parser.add_argument("output")
+    parser.add_argument("--start", help="first day exported (dd/mm/YYYY)")
+    parser.add_argument("--end", help="first day not exported (dd/mm/YYYY)")
+    args = parser.parse_args()
+    start = datetime.strptime(args.start, "%d/%m/%Y").timestamp() if args.start else -math.inf
+    end = datetime.strptime(args.end, "%d/%m/%Y").timestamp() if args.end else math.inf
+    print("%d samples exported" % export_csv(args.archive, args.output, start, end))
+
+if __name__ == "__main__":
+    main()
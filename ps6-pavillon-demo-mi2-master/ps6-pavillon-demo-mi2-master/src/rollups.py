@@ -0,0 +1,140 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This module keeps the statistics of the measures at several resolutions 
+ (1 second, 1 minute, 5 minutes, 1 hour). The tiers are updated while the measures 
+ arrive, each tier being built from the buckets of the tier below, so an hourly 
+ summary costs O(1) per measure.
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import math
+import threading
+import collections
+from window_statistics import RunningStatistics
+
+# statistics of every channel between start and start + seconds
+class Bucket:
+
+    def __init__(self, start, seconds, channels):
+        self.start = start
+        self.seconds = seconds
+        self.statistics = {channel: RunningStatistics() for channel in channels}
+
+    @property
+    def end(self):
+        return self.start + self.seconds
+
+    # return a dict with the start of the bucket and the count, mean, min, max and std of each channel
+    # (None when the channel has no value)
+    def summary(self):
+        result = {"start": self.start, "seconds": self.seconds}
+        for channel, statistics in self.statistics.items():
+            empty = statistics.count == 0
+            result[channel] = {"count": statistics.count,
+                               "mean": None if empty else statistics.mean,
+                               "min": None if empty else statistics.min,
+                               "max": None if empty else statistics.max,
+                               "std": statistics.std()}
+        return result
+
+# tier of buckets of the same duration, the last closed buckets are kept
+class RollupTier:
+
+    def __init__(self, seconds, history):
+        self.seconds = seconds
+        self.current = None
+        self.closed = collections.deque(maxlen=history)
+
+    # start of the bucket containing the timestamp (aligned on the epoch)
+    def bucket_start(self, timestamp):
+        return math.floor(timestamp / self.seconds) * self.seconds
+
+# statistics of the measures at every resolution
+class Rollups:
+
+    def __init__(self, channels, tiers):
+        self.channels = list(channels)
+        # tiers sorted from the finest to the coarsest resolution
+        self.tiers = [RollupTier(seconds, history) for seconds, history in sorted(tiers.items())]
+        self._lock = threading.Lock()
+
+    def _tier(self, seconds):
+        for tier in self.tiers:
+            if tier.seconds == seconds:
+                return tier
+        raise KeyError("no rollup tier of "+str(seconds)+" seconds")
+
+    # close the current bucket of a tier and merge it in the bucket of the next tier (the caller must hold the lock)
+    def _close(self, index):
+        tier = self.tiers[index]
+        bucket = tier.current
+        tier.current = None
+        tier.closed.append(bucket)
+        if index + 1 < len(self.tiers):
+            parent = self._open(index + 1, bucket.start)
+            for channel in self.channels:
+                parent.statistics[channel].merge(bucket.statistics[channel])
+
+    # get the current bucket of a tier for the timestamp, the previous one is closed when it is over
+    # (the caller must hold the lock)
+    def _open(self, index, timestamp):
+        tier = self.tiers[index]
+        start = tier.bucket_start(timestamp)
+        if tier.current is not None and tier.current.start != start:
+            self._close(index)
+        if tier.current is None:
+            tier.current = Bucket(start, tier.seconds, self.channels)
+        return tier.current
+
+    # close the buckets of every tier that ended before the timestamp
+    def advance(self, timestamp):
+        with self._lock:
+            for index, tier in enumerate(self.tiers):
+                if tier.current is not None and tier.current.end <= timestamp:
+                    self._close(index)
+
+    # add a sample to the finest tier
+    # arguments are the timestamp of the sample and a dict with the value of each channel (None or NaN when missing)
+    def add_sample(self, timestamp, values):
+        with self._lock:
+            bucket = self._open(0, timestamp)
+            for channel in self.channels:
+                value = values.get(channel)
+                if value is not None and not math.isnan(value):
+                    bucket.statistics[channel].update(value)
+        self.advance(timestamp)
+
+    # get the summaries of the closed buckets of a tier starting between start and end
+    # arguments are the duration of the buckets of the tier in seconds and the time range (timestamps)
+    def query(self, seconds, start=-math.inf, end=math.inf):
+        with self._lock:
+            return [bucket.summary() for bucket in self._tier(seconds).closed if start <= bucket.start < end]
+
+    # get the summary of the last closed bucket of a tier (None when no bucket was closed yet)
+    def latest(self, seconds):
+        with self._lock:
+            closed = self._tier(seconds).closed
+            return closed[-1].summary() if closed else None
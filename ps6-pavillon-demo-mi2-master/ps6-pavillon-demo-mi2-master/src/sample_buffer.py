@@ -0,0 +1,93 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This module keeps the last measures in a fixed size columnar ring buffer. 
+ The measures are written once by the measure thread and every consumer (CSV file, 
+ LoRa) reads its own window with its own cursor, so the memory stays constant.
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import math
+import logging
+import threading
+from array import array
+
+# fixed size ring buffer of samples, one column (array of doubles) for the timestamps and one
+# for each channel. A missing value is stored as NaN
+class SampleRingBuffer:
+
+    def __init__(self, channels, capacity):
+        self.channels = list(channels)
+        self.capacity = capacity
+        self._timestamps = array('d', [math.nan]) * capacity
+        self._columns = [array('d', [math.nan]) * capacity for channel in self.channels]
+        # number of samples written since the creation of the buffer
+        self._written = 0
+        self._cursors = {}
+        self._lock = threading.Lock()
+
+    # add a consumer, it will read the samples written after this call
+    def register_cursor(self, name):
+        with self._lock:
+            self._cursors[name] = self._written
+
+    # write a sample (only one thread must write in the buffer)
+    # arguments are the timestamp of the sample and a dict with the value of each channel (None when missing)
+    def append(self, timestamp, values):
+        index = self._written % self.capacity
+        with self._lock:
+            self._timestamps[index] = timestamp
+            for column, channel in zip(self._columns, self.channels):
+                value = values.get(channel)
+                column[index] = math.nan if value is None else value
+            self._written += 1
+
+    # copy the samples between two positions of the buffer (the caller must hold the lock)
+    def _copy(self, column, start, end):
+        first = start % self.capacity
+        last = first + (end - start)
+        if last <= self.capacity:
+            return column[first:last]
+        return column[first:] + column[:last - self.capacity]
+
+    # read the samples written since the last read of the consumer and move its cursor
+    # return a dict with the "timestamps" and the values of each channel (arrays of doubles)
+    def read_window(self, name):
+        with self._lock:
+            start = self._cursors[name]
+            end = self._written
+            if end - start > self.capacity:
+                logging.warning("%d samples lost by %s, the buffer is too small" % (end - start - self.capacity, name))
+                start = end - self.capacity
+            self._cursors[name] = end
+            window = {"timestamps": self._copy(self._timestamps, start, end)}
+            for column, channel in zip(self._columns, self.channels):
+                window[channel] = self._copy(column, start, end)
+        return window
+
+    # number of samples waiting to be read by a consumer
+    def pending(self, name):
+        with self._lock:
+            return min(self._written - self._cursors[name], self.capacity)
@@ -30,17 +30,18 @@
  Date:    Mai 2021
 '''
 
-import time, struct, subprocess;
+import time, subprocess, socket;
 import Configuration
+import payload
+import metrics
 import datetime
 import logging
-from rak811.rak811_v3 import Rak811
+import threading
+from device import backend
 
-# Send byte to LoRa
-# Input: bytesTab (bytes)
-# Return: 0 or error message
-def send_frame(bytesTab: bytes):
-    lora = Rak811()
+# Configure the RAK811 for the OTAA join of the device
+# Input: lora (Rak811)
+def configure(lora):
     logging.info("Configure Lora...")
     lora.set_config('lora:work_mode:0')
     lora.set_config('lora:join_mode:0')
@@ -51,66 +52,258 @@ def send_frame(bytesTab: bytes):
     else:
         lora.set_config('lora:app_key:D50268FA6C8566215DEC48B03A1C495D') # Device 1
     lora.set_config('lora:tx_power:0')
-    logging.info("Join Lora...")
-    lora.join()
-    logging.info("Join Success")
-    lora.set_config('lora:dr:0')
-    logging.info("Send to Lora...")
-    lora.send(bytesTab)
-    logging.info("Send Success")
-    lora.close()
-    logging.info("Close Success")
+
+# count, mean and max of the durations of an operation
+class Durations:
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = None
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.last = duration
+
+    def __str__(self):
+        if self.count == 0:
+            return "none"
+        return "%d, mean %.2f s, max %.2f s, last %.2f s" % (self.count, self.total / self.count, self.max, self.last)
+
+# LoRaWAN session of the RAK811. The module is configured and joined once and the session is used for
+# the next frames. The session is joined again after a failure or when it sent max_frames frames or is
+# older than max_age seconds
+class RakSession:
+
+    def __init__(self, max_frames=Configuration.LORA_REJOIN_AFTER_FRAMES, max_age=Configuration.LORA_REJOIN_AFTER_SEC):
+        self.max_frames = max_frames
+        self.max_age = max_age
+        self.joins = Durations()
+        self.sends = Durations()
+        self.failures = 0
+        self._lora = None
+        self._frames = 0
+        self._joined_at = None
+        self._lock = threading.Lock()
+
+    # True when the session must be joined (again) before the next frame
+    def _must_join(self):
+        if self._lora is None:
+            return True
+        if self.max_frames is not None and self._frames >= self.max_frames:
+            logging.info("LoRa session sent "+str(self._frames)+" frames, joining again")
+            return True
+        if self.max_age is not None and time.monotonic() - self._joined_at >= self.max_age:
+            logging.info("LoRa session older than "+str(self.max_age)+" sec, joining again")
+            return True
+        return False
+
+    def _join(self):
+        self._close()
+        start = time.monotonic()
+        lora = backend.get_backend().rak811()
+        try:
+            configure(lora)
+            logging.info("Join Lora...")
+            lora.join()
+            lora.set_config('lora:dr:'+str(Configuration.LORA_DATA_RATE))
+        except Exception:
+            metrics.lora_joins.inc("failed")
+            lora.close()
+            raise
+        metrics.lora_joins.inc("joined")
+        self._lora = lora
+        self._frames = 0
+        self._joined_at = time.monotonic()
+        self.joins.add(self._joined_at - start)
+        metrics.lora_join_seconds.observe(self.joins.last)
+        logging.info("Join Success in %.2f sec" % self.joins.last)
+
+    def _close(self):
+        if self._lora is not None:
+            try:
+                self._lora.close()
+            except Exception as e:
+                logging.error("failed to close the LoRa module: "+repr(e))
+            self._lora = None
+
+    # join the network when the session must be joined, so the join is not done in the slot of the next frame
+    def join_if_needed(self):
+        with self._lock:
+            try:
+                if self._must_join():
+                    self._join()
+            except Exception:
+                self.failures += 1
+                self._close()
+                raise
+
+    # send a frame, joining the network first when needed. After a failure the session is closed so
+    # the next frame joins again
+    def send(self, data):
+        with self._lock:
+            try:
+                if self._must_join():
+                    self._join()
+                logging.info("Send to Lora...")
+                start = time.monotonic()
+                self._lora.send(data)
+                self.sends.add(time.monotonic() - start)
+                self._frames += 1
+                logging.info("Send Success in %.2f sec" % self.sends.last)
+            except Exception:
+                self.failures += 1
+                self._close()
+                raise
+
+    # log the latencies of the joins and the sends
+    def log_statistics(self):
+        logging.info("LoRa joins: "+str(self.joins)+" / sends: "+str(self.sends)+" / failures: "+str(self.failures))
+
+    def close(self):
+        with self._lock:
+            self._close()
+            logging.info("Close Success")
+
+# session of the RAK811 used by all the frames
+session = RakSession()
+
+# Send byte to LoRa
+# Input: bytesTab (bytes)
+# Return: 0 or error message
+def send_frame(bytesTab: bytes):
+    session.send(bytesTab)
     return 0
 
-# Convert sensors data to bytes and call send lora function
-# Input: isTest (bool), timestamp (int), sunIntensity (float), temperature (float), temperatureGlobe (float), humidity (float), windspeed (float), device (int), is_rak (bool)
+# Prepare the LoRa module before the wait for the slot of a frame: the RAK811 joins the network when needed
+# (the LMIC daemon keeps its own session and the executable joins for each frame)
+# Input: is_rak (bool)
+def prepare_send(is_rak = True):
+    if is_rak:
+        session.join_if_needed()
+
+# Convert sensors data to the bytes of a frame
+# Input: isTest (bool), timestamp (int), sunIntensity (float), temperature (float), temperatureGlobe (float), humidity (float), windspeed (float), device (int)
+# Return: frame (bytes)
+def build_frame(isTest: bool, timestamp: int, sunIntensity: float, temperature: float, temperatureGlobe: float, humidity: float, windspeed: float, device = 0):
+    return payload.encode_v1(isTest, timestamp, [sunIntensity, temperature, temperatureGlobe, humidity, windspeed], device)
+
+# commands and status of the protocol of the LMIC daemon (lora/lora_daemon.cpp)
+DAEMON_SEND = 0x01
+DAEMON_SEND_CONFIRMED = 0x02
+DAEMON_STATUS = 0x03
+DAEMON_STATUS_NAMES = {0x00: "sent", 0x01: "ack received", 0x02: "no ack", 0x03: "busy", 0x04: "join failed",
+                       0x05: "bad request", 0x06: "timeout", 0x07: "link dead", 0x08: "joined", 0x09: "not joined"}
+DAEMON_SENT = 0x00
+DAEMON_ACK = 0x01
+
+# client of the LMIC daemon, the daemon keeps the LoRaWAN session and answers each frame with its status
+class LmicDaemonClient:
+
+    def __init__(self, path=Configuration.LORA_DAEMON_SOCKET, timeout=Configuration.LORA_DAEMON_TIMEOUT_SEC, port=1):
+        self.path = path
+        self.timeout = timeout
+        self.port = port
+        self.last_downlink = b""
+        self._socket = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.settimeout(self.timeout)
+            try:
+                self._socket.connect(self.path)
+            except OSError:
+                self._socket.close()
+                self._socket = None
+                raise
+
+    def _receive(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self._socket.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("LoRa daemon closed the connection")
+            data += chunk
+        return data
+
+    # send a request to the daemon and wait for its response
+    # return the status and the downlink payload
+    def request(self, command, data=b""):
+        with self._lock:
+            try:
+                self._connect()
+                self._socket.sendall(bytes([command, self.port, len(data)]) + data)
+                status, length = self._receive(2)
+                downlink = self._receive(length) if length else b""
+            except OSError:
+                # the connection is opened again for the next request
+                self.close()
+                raise
+        return status, downlink
+
+    # send a frame, return the status of the daemon (DAEMON_SENT or DAEMON_ACK when the frame is sent)
+    def send(self, data, confirmed=False):
+        status, self.last_downlink = self.request(DAEMON_SEND_CONFIRMED if confirmed else DAEMON_SEND, data)
+        logging.info("LoRa daemon: "+DAEMON_STATUS_NAMES.get(status, str(status))+(", "+str(len(self.last_downlink))+" bytes received" if self.last_downlink else ""))
+        return status
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+# client of the LMIC daemon used by all the frames
+daemon = LmicDaemonClient()
+
+# Send a frame by running SEND_LORA_EXE_PATH (lmic lib), it joins the network for each frame
+# Input: msg (bytes)
+# Return: return code of the executable
+def run_send_lora(msg: bytes):
+    hexaOut = ''.join('{:02x}'.format(x) for x in msg)
+    bashCmd = (["sudo"] if Configuration.SEND_LORA_SUDO else []) + [Configuration.SEND_LORA_EXE_PATH, hexaOut]
+    process = subprocess.Popen(bashCmd, stdout=subprocess.PIPE)
+    output, error = process.communicate()
+    logging.info(process.returncode)
+    logging.info(output)
+    return process.returncode
+
+# Send a frame to LoRa (with rak lib or lmic lib). Without the python hat the frame goes through the LMIC
+# daemon, or through SEND_LORA_EXE_PATH when the daemon is not used or not running (no socket)
+# Input: msg (bytes), is_rak (bool)
 # Return: 0 or error message
-def send_data(isTest: bool, timestamp: int, sunIntensity: float, temperature: float, temperatureGlobe: float, humidity: float, windspeed: float, device = 0, is_rak = True):
-
-    # Convert values into int
-    sunIntensityInt: int = int(sunIntensity*100)
-    temperatureInt: int = int(temperature*100)
-    temperatureGlobeInt: int = int(temperatureGlobe*100)
-    humidityInt: int = int(humidity*100)
-    windspeedInt: int = int(windspeed*1000)
-
-    # Create control byte
-    controlBytes: bytes
-    control = 1 # Version
-    if isTest:
-        control += 128
-    if device in {1, 3, 5, 7}:
-        control += 16
-    if device in {2, 3, 6, 7}:
-        control += 32
-    if device in {4, 5, 6, 7}:
-        control += 64
-
-    controlBytes = bytes([control])
-
-    # Forge byte array
-    msg = bytearray(15)
-    struct.pack_into('>cIhhhhh', msg, 0, controlBytes, timestamp, sunIntensityInt, temperatureInt, temperatureGlobeInt, humidityInt, windspeedInt)
-
-
-    msg = bytes(msg)
+def send_payload(msg: bytes, is_rak = True):
     logging.info("Send data...")
-    hexaOut = ''.join('{:02x}'.format(x) for x in msg)
 
-    # Send data to LoRa (with rak lib or lmic lib)
-    if is_rak:
-        return send_frame(msg)
-    else:
-        bashCmd = ["sudo", Configuration.SEND_LORA_EXE_PATH, hexaOut]
-        process = subprocess.Popen(bashCmd, stdout=subprocess.PIPE)
-        output, error = process.communicate()
-        logging.info(process.returncode)
-        logging.info(output)
-        return process.returncode
+    path = "rak811" if is_rak else "daemon" if Configuration.LORA_USE_DAEMON else "executable"
+    start = time.monotonic()
+    result = -1
+    try:
+        if is_rak:
+            result = send_frame(msg)
+        elif Configuration.LORA_USE_DAEMON:
+            try:
+                status = daemon.send(msg, Configuration.LORA_CONFIRMED_UPLINKS)
+                result = 0 if status in {DAEMON_SENT, DAEMON_ACK} else status
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                logging.warning("LoRa daemon not running ("+repr(e)+"), frame sent with "+Configuration.SEND_LORA_EXE_PATH)
+                path = "executable"
+                result = run_send_lora(msg)
+        else:
+            result = run_send_lora(msg)
+        return result
+    finally:
+        metrics.lora_send_seconds.observe(time.monotonic() - start, path)
+        metrics.lora_uplinks.inc(path, "sent" if result == 0 else "failed")
+
 
 
 
 
 
 # TEST LINE
-#send_data(True, int(time.time()), 56.45, 23.12, 24.01, 2.1, 3.2, 0)
+#send_payload(build_frame(True, int(time.time()), 56.45, 23.12, 24.01, 2.1, 3.2, 0))
@@ -0,0 +1,129 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This module keeps the last samples in a ring buffer in shared memory 
+ (multiprocessing.shared_memory, Python 3.8 or newer), so the acquisition process writes 
+ each sample once and the storage and uplink processes read them in place. The segment 
+ starts with a header of counters: the number of samples written and the position of each 
+ consumer, so a consumer restarted after a crash continues where it stopped. The columns 
+ are the same as the ones of SampleRingBuffer (timestamps then one column per channel, NaN 
+ when missing). There is only one writer, it publishes a sample by increasing the counter 
+ after the values are written.
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import math
+import logging
+
+# counters of the header: number of samples written, then the positions of the consumers
+MAX_CONSUMERS = 7
+HEADER_COUNTERS = 1 + MAX_CONSUMERS
+COUNTER_SIZE = 8
+VALUE_SIZE = 8
+
+# size in bytes of the shared memory of a ring
+def segment_size(channels, capacity):
+    return HEADER_COUNTERS * COUNTER_SIZE + (1 + len(channels)) * capacity * VALUE_SIZE
+
+# ring buffer of samples in shared memory
+class SharedSampleRing:
+
+    # arguments are the channels and the number of samples kept, the name of an existing segment to
+    # attach it (None to create a new one)
+    def __init__(self, channels, capacity, name=None):
+        from multiprocessing import shared_memory
+        self.channels = list(channels)
+        self.capacity = capacity
+        if name is None:
+            self._memory = shared_memory.SharedMemory(create=True, size=segment_size(self.channels, capacity))
+            self._memory.buf[:HEADER_COUNTERS * COUNTER_SIZE] = bytes(HEADER_COUNTERS * COUNTER_SIZE)
+        else:
+            self._memory = shared_memory.SharedMemory(name=name)
+        self.name = self._memory.name
+        self._owner = name is None
+        self._counters = self._memory.buf[:HEADER_COUNTERS * COUNTER_SIZE].cast('Q')
+        values = self._memory.buf[HEADER_COUNTERS * COUNTER_SIZE:segment_size(self.channels, capacity)].cast('d')
+        # views of the columns in the shared memory, the first one is the timestamps
+        self._columns = [values[index * capacity:(index + 1) * capacity] for index in range(1 + len(self.channels))]
+
+    # number of samples written since the creation of the ring
+    def written(self):
+        return self._counters[0]
+
+    # write a sample (only one process must write in the ring)
+    # arguments are the timestamp of the sample and a dict with the value of each channel (None when missing)
+    def append(self, timestamp, values):
+        written = self._counters[0]
+        index = written % self.capacity
+        self._columns[0][index] = timestamp
+        for column, channel in zip(self._columns[1:], self.channels):
+            value = values.get(channel)
+            column[index] = math.nan if value is None else value
+        # the sample is visible to the consumers once the counter is increased
+        self._counters[0] = written + 1
+
+    # position of a consumer (number of samples it read)
+    def cursor(self, consumer):
+        return self._counters[1 + consumer]
+
+    # set the position of a consumer, the samples before it are not read again after a restart
+    def set_cursor(self, consumer, position):
+        self._counters[1 + consumer] = position
+
+    # start a consumer at the last sample written (its former position is lost)
+    def reset_cursor(self, consumer):
+        self.set_cursor(consumer, self.written())
+
+    # read the samples written after a position
+    # return the position after the last sample read and a list of (position, timestamp, values of the channels).
+    # The samples overwritten by the writer before or during the read are skipped
+    def read(self, start):
+        end = self._counters[0]
+        if end - start > self.capacity:
+            logging.warning("%d samples lost in the shared ring, the ring is too small" % (end - start - self.capacity))
+            start = end - self.capacity
+        samples = []
+        for position in range(start, end):
+            index = position % self.capacity
+            samples.append((position, self._columns[0][index], [column[index] for column in self._columns[1:]]))
+        # the samples overwritten while they were read are dropped
+        overwritten = self._counters[0] - self.capacity
+        if samples and samples[0][0] < overwritten:
+            logging.warning("%d samples overwritten in the shared ring while they were read" % (overwritten - samples[0][0]))
+            samples = [sample for sample in samples if sample[0] >= overwritten]
+        return end, samples
+
+    # release the views of the shared memory, the owner also removes the segment
+    def close(self):
+        if self._memory is None:
+            return
+        for column in self._columns:
+            column.release()
+        self._counters.release()
+        self._columns = []
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+        self._memory = None
@@ -0,0 +1,151 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This module stores the measures in a SQLite database on the device, with one 
+ table indexed by time for each resolution (1 second, 1 minute, 1 hour). The writes 
+ are grouped in transactions, the old measures are deleted after a retention time and 
+ the range and aggregate queries use the time index.
+
+ Usage:   python3 sqlite_store.py data/measures.db humidity --hours 6 [--resolution 60] [--aggregate avg]
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import math
+import time
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+import Configuration
+
+# SQL functions allowed in the aggregate queries
+AGGREGATES = ["avg", "min", "max", "sum", "count"]
+
+# name of the table of a resolution in seconds
+def table_name(resolution):
+    return "measures_%ds" % resolution
+
+# SQLite database of the measures
+class SqliteStore:
+
+    # arguments are the path of the database, the resolutions in seconds and the names of the columns of the channels
+    def __init__(self, path, resolutions, columns=Configuration.DATA_CHANNEL_COLUMNS):
+        self.path = path
+        self.resolutions = list(resolutions)
+        self.columns = list(columns)
+        self._pending = {resolution: [] for resolution in self.resolutions}
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        # the WAL journal lets the queries read while the measures are written and writes less on the SD card
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._connection:
+            for resolution in self.resolutions:
+                self._connection.execute("CREATE TABLE IF NOT EXISTS %s (timestamp REAL PRIMARY KEY, %s) WITHOUT ROWID"
+                                         % (table_name(resolution), ", ".join(column+" REAL" for column in self.columns)))
+
+    def _check(self, resolution, column=None):
+        if resolution not in self.resolutions:
+            raise ValueError("no table for the resolution "+str(resolution))
+        if column is not None and column not in self.columns:
+            raise ValueError("unknown channel "+str(column))
+
+    # add a row to the next transaction
+    # arguments are the resolution in seconds, the timestamp and the values of the channels (None or NaN when missing)
+    def add(self, resolution, timestamp, values):
+        self._check(resolution)
+        row = [timestamp] + [None if value is None or math.isnan(value) else value for value in values]
+        with self._lock:
+            self._pending[resolution].append(row)
+
+    # write the pending rows in one transaction
+    # return the number of rows written
+    def flush(self):
+        written = 0
+        with self._lock:
+            with self._connection:
+                for resolution, rows in self._pending.items():
+                    if rows:
+                        self._connection.executemany("INSERT OR REPLACE INTO %s VALUES (%s)" % (table_name(resolution), ", ".join("?" * (len(self.columns) + 1))), rows)
+                        written += len(rows)
+                        rows.clear()
+        return written
+
+    # delete the rows older than the retention time of their resolution
+    # arguments are a dict with the retention time in seconds of each resolution (None to keep everything)
+    def prune(self, retention, now=None):
+        if now is None:
+            now = time.time()
+        deleted = 0
+        with self._lock:
+            with self._connection:
+                for resolution, seconds in retention.items():
+                    if seconds is not None and resolution in self.resolutions:
+                        deleted += self._connection.execute("DELETE FROM %s WHERE timestamp < ?" % table_name(resolution), (now - seconds,)).rowcount
+        return deleted
+
+    # get the values of a channel between two timestamps (start included, end excluded)
+    # return a list of tuples (timestamp, value)
+    def query_range(self, resolution, column, start, end=math.inf):
+        self._check(resolution, column)
+        with self._lock:
+            return self._connection.execute("SELECT timestamp, %s FROM %s WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp"
+                                            % (column, table_name(resolution)), (start, end)).fetchall()
+
+    # get an aggregate ("avg", "min", "max", "sum" or "count") of a channel between two timestamps
+    def query_aggregate(self, resolution, column, start, end=math.inf, aggregate="avg"):
+        self._check(resolution, column)
+        if aggregate not in AGGREGATES:
+            raise ValueError("unknown aggregate "+str(aggregate))
+        with self._lock:
+            return self._connection.execute("SELECT %s(%s) FROM %s WHERE timestamp >= ? AND timestamp < ?"
+                                            % (aggregate, column, table_name(resolution)), (start, end)).fetchone()[0]
+
+    # write the pending rows and close the database
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the measures stored in the SQLite database of the device")
+    parser.add_argument("database")
+    parser.add_argument("channel", choices=Configuration.DATA_CHANNEL_COLUMNS)
+    parser.add_argument("--hours", type=float, default=6, help="last hours queried")
+    parser.add_argument("--resolution", type=int, default=60, help="resolution in seconds")
+    parser.add_argument("--aggregate", choices=AGGREGATES, help="aggregate of the values instead of the values")
+    args = parser.parse_args()
+    store = SqliteStore(args.database, [args.resolution])
+    start = time.time() - args.hours * 3600
+    query_start = time.monotonic()
+    if args.aggregate:
+        print(store.query_aggregate(args.resolution, args.channel, start, aggregate=args.aggregate))
+    else:
+        for timestamp, value in store.query_range(args.resolution, args.channel, start):
+            print(datetime.fromtimestamp(timestamp).strftime("%d/%m/%Y %H:%M:%S")+","+("" if value is None else "%.2f" % value))
+    print("query done in %.1f ms" % ((time.monotonic() - query_start) * 1000))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This module drives the status led. The led blinks with the PWM of the GPIO 
+ library so the application only wakes up when the blinking interval changes.
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import threading
+
+# status led blinking with a given interval (time of a full on / off cycle in seconds)
+class StatusLed:
+
+    def __init__(self, gpio, pin, interval=1):
+        self._gpio = gpio
+        self._pin = pin
+        self._pwm = None
+        self._lock = threading.Lock()
+        self.interval = interval
+
+    # start the blinking, the GPIO of the led must be set up as an output
+    def start(self):
+        with self._lock:
+            if self._pwm is None:
+                self._pwm = self._gpio.PWM(self._pin, 1 / self.interval)
+                self._pwm.start(50)
+
+    # change the blinking interval, the PWM is only touched when the interval changes
+    def set_interval(self, interval):
+        with self._lock:
+            if interval == self.interval:
+                return
+            self.interval = interval
+            if self._pwm is not None:
+                self._pwm.ChangeFrequency(1 / interval)
+
+    # stop the blinking and switch the led off
+    def stop(self):
+        with self._lock:
+            if self._pwm is not None:
+                self._pwm.stop()
+                self._pwm = None
@@ -0,0 +1,143 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This module schedules the measures. Every task (sensor) has its own period, 
+ the ticks are computed from a monotonic clock so they do not drift, and the missed 
+ ticks are skipped or caught up. The jitter and the overruns are kept in histograms.
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import time
+import math
+import logging
+import threading
+import Configuration
+
+# policies for the ticks missed because a measure took too long
+SKIP = "skip"
+CATCH_UP = "catch_up"
+
+# scheduler of periodic tasks based on time.monotonic()
+class TickScheduler:
+
+    def __init__(self, histogram_bounds=Configuration.TICK_JITTER_HISTOGRAM_MS, max_catch_up=Configuration.TICK_MAX_CATCH_UP):
+        self.histogram_bounds = histogram_bounds
+        self.max_catch_up = max_catch_up
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    # add a task to the scheduler
+    # arguments are the name of the task, its period in seconds and the policy for the missed ticks
+    def add_task(self, name, period, policy=SKIP):
+        if policy not in (SKIP, CATCH_UP):
+            raise ValueError("unknown missed ticks policy "+str(policy))
+        with self._lock:
+            # counted_missed: missed ticks already counted in the overruns and still to be caught up
+            self._tasks[name] = {"period": period, "policy": policy, "next": None, "runs": 0, "overruns": 0, "skipped": 0, "counted_missed": 0,
+                                 "jitter": [0] * (len(self.histogram_bounds) + 1)}
+
+    # align the ticks of every task on the beginning of the next second of the wall clock,
+    # the following ticks only depend on the monotonic clock
+    # arguments are True to restart every task, False to only start the new ones
+    def start(self, restart=True):
+        first_tick = time.monotonic() + (1 - time.time() % 1)
+        with self._lock:
+            if restart:
+                self._wake.clear()
+            for task in self._tasks.values():
+                if restart or task["next"] is None:
+                    task["next"] = first_tick
+                    task["counted_missed"] = 0
+
+    # wake up a scheduler waiting in wait_next()
+    def wake(self):
+        self._wake.set()
+
+    # add the lateness of a tick to the histogram of the task
+    def _record_jitter(self, task, lateness):
+        lateness_ms = lateness * 1000
+        for index, bound in enumerate(self.histogram_bounds):
+            if lateness_ms <= bound:
+                task["jitter"][index] += 1
+                return
+        task["jitter"][-1] += 1
+
+    # get the time (time.monotonic()) of the next tick
+    def next_tick(self):
+        self.start(restart=False)
+        with self._lock:
+            return min(task["next"] for task in self._tasks.values())
+
+    # return the names of the tasks due at the time now (time.monotonic()) and compute their next tick
+    def pop_due(self, now):
+        due = []
+        with self._lock:
+            for name, task in self._tasks.items():
+                if task["next"] > now:
+                    continue
+                lateness = now - task["next"]
+                self._record_jitter(task, lateness)
+                task["runs"] += 1
+                missed = int(lateness // task["period"])
+                if missed > 0:
+                    # the ticks being caught up were counted when the stall was seen
+                    task["overruns"] += max(0, missed - task["counted_missed"])
+                    if task["policy"] == CATCH_UP and missed <= self.max_catch_up:
+                        # the next tick is already late so it is returned by the next call
+                        task["next"] += task["period"]
+                        task["counted_missed"] = missed - 1
+                    else:
+                        task["skipped"] += missed
+                        task["next"] += (missed + 1) * task["period"]
+                        task["counted_missed"] = 0
+                else:
+                    task["next"] += task["period"]
+                    task["counted_missed"] = 0
+                due.append(name)
+        return due
+
+    # wait until the next tick and return the names of the tasks due at this tick
+    # return an empty list when the wait was interrupted by wake()
+    def wait_next(self):
+        delay = self.next_tick() - time.monotonic()
+        if delay > 0 and self._wake.wait(delay):
+            self._wake.clear()
+            return []
+        return self.pop_due(time.monotonic())
+
+    # get the statistics of every task: the number of runs, of missed ticks (overruns) and of
+    # skipped ticks and the histogram of the lateness of the ticks in milliseconds
+    def get_statistics(self):
+        labels = ["<=%g ms" % bound for bound in self.histogram_bounds] + [">%g ms" % self.histogram_bounds[-1]]
+        with self._lock:
+            return {name: {"period": task["period"], "runs": task["runs"], "overruns": task["overruns"], "skipped": task["skipped"],
+                           "jitter": dict(zip(labels, task["jitter"]))}
+                    for name, task in self._tasks.items()}
+
+    # log the statistics of every task
+    def log_statistics(self):
+        for name, statistics in self.get_statistics().items():
+            logging.info("tick statistics of %s: %d runs, %d overruns, %d skipped, jitter %s" % (name, statistics["runs"], statistics["overruns"], statistics["skipped"], statistics["jitter"]))
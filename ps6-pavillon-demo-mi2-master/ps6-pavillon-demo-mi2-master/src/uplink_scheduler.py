@@ -0,0 +1,167 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This module decides when the LoRa frames are sent. It computes the time on air 
+ of a frame at the data rate of the device and keeps the duty cycle budget of the EU868 
+ sub-band (the band is free after a frame for time on air * (1 / duty cycle - 1) and at 
+ most duty cycle * 1 hour is used in one hour). The devices share a cycle of slots, each 
+ device sends only in its slot at a deterministic jittered offset, so the stations of the 
+ pavillon (up to 8 devices in the control byte) do not send at the same time.
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import math
+import time
+import random
+import logging
+import threading
+import collections
+import Configuration
+
+# LoRaWAN overhead of a frame: MHDR (1), FHDR (7), FPort (1) and MIC (4)
+LORAWAN_OVERHEAD = 13
+PREAMBLE_SYMBOLS = 8
+# EU868 data rates at 125 kHz: DR0 is SF12 ... DR5 is SF7
+BANDWIDTH = 125000
+
+# time on air of a frame in seconds (explicit header, CRC, coding rate 4/5)
+# arguments are the size of the application payload in bytes and the data rate (0 to 5)
+def time_on_air(payload_size, data_rate):
+    spreading_factor = 12 - data_rate
+    symbol_time = 2 ** spreading_factor / BANDWIDTH
+    # the low data rate optimization is used with SF11 and SF12 at 125 kHz
+    low_data_rate = 1 if spreading_factor >= 11 else 0
+    size = payload_size + LORAWAN_OVERHEAD
+    payload_symbols = 8 + max(math.ceil((8 * size - 4 * spreading_factor + 28 + 16) / (4 * (spreading_factor - 2 * low_data_rate))) * 5, 0)
+    return (PREAMBLE_SYMBOLS + 4.25) * symbol_time + payload_symbols * symbol_time
+
+# duty cycle budget of a sub-band
+class DutyCycleBudget:
+
+    # arguments are the duty cycle (0.01 for 1 %) and the window of the budget in seconds
+    def __init__(self, duty_cycle, window=3600):
+        self.duty_cycle = duty_cycle
+        self.window = window
+        self._transmissions = collections.deque()
+        self._free_at = -math.inf
+
+    def _expire(self, now):
+        while self._transmissions and self._transmissions[0][0] + self.window <= now:
+            self._transmissions.popleft()
+
+    # time on air used in the window before now
+    def used(self, now):
+        self._expire(now)
+        return sum(duration for start, duration in self._transmissions)
+
+    # first time from now when a frame of this time on air can be sent
+    def available_at(self, duration, now):
+        self._expire(now)
+        at = max(now, self._free_at)
+        used = sum(duration for start, duration in self._transmissions)
+        # the oldest frames leave the window until the new frame fits in the budget
+        for start, old in self._transmissions:
+            if used + duration <= self.duty_cycle * self.window:
+                break
+            used -= old
+            at = max(at, start + self.window)
+        return at
+
+    # record a frame sent at the given time
+    def add(self, start, duration):
+        self._transmissions.append((start, duration))
+        self._free_at = start + duration / self.duty_cycle
+
+# slots of the devices and duty cycle budget of this device
+class UplinkScheduler:
+
+    # arguments are the id of the device, the data rate, the duty cycle, the duration of a cycle of slots in
+    # seconds, the number of devices sharing the cycle and the maximum size of a payload
+    def __init__(self, device_id, data_rate=Configuration.LORA_DATA_RATE, duty_cycle=Configuration.LORA_DUTY_CYCLE,
+                 cycle=Configuration.LORA_SLOT_CYCLE_SEC, devices=Configuration.LORA_MAX_DEVICES,
+                 max_payload=Configuration.LORA_MAX_PAYLOAD_BYTES, clock=time.time):
+        self.device_id = device_id
+        self.data_rate = data_rate
+        self.cycle = cycle
+        self.devices = devices
+        self.slot_width = cycle / devices
+        self.clock = clock
+        self.budget = DutyCycleBudget(duty_cycle)
+        # the jitter keeps room in the slot for the longest frame
+        self.max_jitter = max(0.0, self.slot_width - time_on_air(max_payload, data_rate))
+        self.frames = 0
+        self.delayed_frames = 0
+        self.budget_delay = 0.0
+        self._lock = threading.Lock()
+
+    # start of the slot of the device in a cycle (the same on every device for a cycle index)
+    def slot_start(self, cycle_index):
+        jitter = random.Random(cycle_index * self.devices + self.device_id).uniform(0, self.max_jitter)
+        return cycle_index * self.cycle + self.device_id * self.slot_width + jitter
+
+    # first time from now when a frame of this time on air can start in a slot of the device
+    def next_slot(self, duration, now):
+        cycle_index = math.floor(now / self.cycle)
+        while True:
+            start = self.slot_start(cycle_index)
+            # a frame longer than the slot starts at the beginning of the slot
+            end = max(start, cycle_index * self.cycle + (self.device_id + 1) * self.slot_width - duration)
+            if now <= end:
+                return max(now, start)
+            cycle_index += 1
+
+    # time to wait before sending a frame of this size. A warning is logged when the duty cycle budget
+    # delays the frame after the next slot
+    def delay(self, payload_size):
+        duration = time_on_air(payload_size, self.data_rate)
+        with self._lock:
+            now = self.clock()
+            slot = self.next_slot(duration, now)
+            at = slot
+            # the slot and the budget must both allow the frame
+            while True:
+                available = self.budget.available_at(duration, at)
+                if available <= at:
+                    break
+                at = self.next_slot(duration, available)
+            if at > slot:
+                self.delayed_frames += 1
+                self.budget_delay += at - slot
+                logging.warning("duty cycle budget exhausted (%.1f s used in the last hour), frame delayed by %.1f sec"
+                                % (self.budget.used(now), at - slot))
+            return at - now
+
+    # record a frame sent now
+    def sent(self, payload_size):
+        with self._lock:
+            self.budget.add(self.clock(), time_on_air(payload_size, self.data_rate))
+            self.frames += 1
+
+    # log the use of the budget and the frames delayed by it
+    def log_statistics(self):
+        with self._lock:
+            logging.info("LoRa uplinks: %d frames, %.1f s on air in the last hour (budget %.1f s), %d frames delayed by the budget (%.1f s)"
+                         % (self.frames, self.budget.used(self.clock()), self.budget.duty_cycle * self.budget.window,
+                            self.delayed_frames, self.budget_delay))
@@ -0,0 +1,184 @@
+'''
+ Copyright (c) 2021 University of Applied Sciences Western Switzerland / Fribourg
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy
+ of this software and associated documentation files (the "Software"), to deal
+ in the Software without restriction, including without limitation the rights
+ to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+ copies of the Software, and to permit persons to whom the Software is
+ furnished to do so, subject to the following conditions:
+
+ The above copyright notice and this permission notice shall be included in all
+ copies or substantial portions of the Software.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+ SOFTWARE.
+
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: This module computes the statistics of the measures of a window (count, mean, 
+ min, max, standard deviation and percentiles) while the measures arrive, in constant 
+ memory, so the raw measures do not have to be kept until the window closes.
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import math
+import threading
+
+# count, mean, min, max and standard deviation of a series of values (Welford's algorithm)
+class RunningStatistics:
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    # add a value to the statistics
+    def update(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    # add the values of other statistics (Chan's parallel algorithm)
+    def merge(self, other):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    # standard deviation of the values (population)
+    def std(self):
+        if self.count == 0:
+            return None
+        return math.sqrt(self.m2 / self.count)
+
+# approximate percentile of a series of values with 5 markers (P-square algorithm of Jain and Chlamtac)
+# arguments are the percentile between 0 and 100
+class P2Quantile:
+
+    def __init__(self, percentile):
+        self.p = percentile / 100
+        self._heights = []
+        self._positions = [1, 2, 3, 4, 5]
+        self._desired = [1, 1 + 2 * self.p, 1 + 4 * self.p, 3 + 2 * self.p, 5]
+        self._increments = [0, self.p / 2, self.p, (1 + self.p) / 2, 1]
+
+    # add a value to the estimation
+    def update(self, value):
+        q = self._heights
+        if len(q) < 5:
+            q.append(value)
+            q.sort()
+            return
+        n = self._positions
+        # find the cell of the value and move the extreme markers
+        if value < q[0]:
+            q[0] = value
+            k = 0
+        elif value >= q[4]:
+            q[4] = value
+            k = 3
+        else:
+            k = 0
+            while value >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+        # adjust the height of the middle markers
+        for i in range(1, 4):
+            d = self._desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = q[i] + d / (n[i + 1] - n[i - 1]) * ((n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                                                             + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    # get the estimated percentile (exact while there are less than 5 values)
+    # return None when there is no value
+    def value(self):
+        q = self._heights
+        if not q:
+            return None
+        if len(q) < 5 or self._positions[4] == 5:
+            position = self.p * (len(q) - 1)
+            lower = int(position)
+            upper = min(lower + 1, len(q) - 1)
+            return q[lower] + (q[upper] - q[lower]) * (position - lower)
+        return q[2]
+
+# statistics of a channel: count, mean, min, max, standard deviation and the percentiles
+class ChannelStatistics:
+
+    def __init__(self, percentiles):
+        self.running = RunningStatistics()
+        self.quantiles = {percentile: P2Quantile(percentile) for percentile in percentiles}
+
+    def update(self, value):
+        self.running.update(value)
+        for quantile in self.quantiles.values():
+            quantile.update(value)
+
+    # return a dict with the statistics, the values are None when there was no value
+    def result(self):
+        empty = self.running.count == 0
+        result = {"count": self.running.count,
+                  "mean": None if empty else self.running.mean,
+                  "min": None if empty else self.running.min,
+                  "max": None if empty else self.running.max,
+                  "std": self.running.std()}
+        for percentile, quantile in self.quantiles.items():
+            result["p%g" % percentile] = quantile.value()
+        return result
+
+# statistics of every channel for the current window. The measure thread updates them and the
+# window is closed by the consumer (CSV file, LoRa) in constant time
+class WindowStatistics:
+
+    def __init__(self, channels, percentiles):
+        self.channels = list(channels)
+        self.percentiles = list(percentiles)
+        self._lock = threading.Lock()
+        self._statistics = self._new_window()
+
+    def _new_window(self):
+        return {channel: ChannelStatistics(self.percentiles) for channel in self.channels}
+
+    # add a sample to the window
+    # arguments are a dict with the value of each channel (None or NaN when missing)
+    def update(self, values):
+        with self._lock:
+            for channel in self.channels:
+                value = values.get(channel)
+                if value is not None and not math.isnan(value):
+                    self._statistics[channel].update(value)
+
+    # close the window and start a new one
+    # return a dict with the statistics of each channel for the closed window
+    def close(self):
+        with self._lock:
+            statistics, self._statistics = self._statistics, self._new_window()
+        return {channel: statistics[channel].result() for channel in self.channels}
@@ -0,0 +1,229 @@
+'''
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: Benchmarks of the pipeline of the application with the mock hardware of 
+ conftest.py: cost of a tick (measure_data) with the realistic and the worst case latencies 
+ of the sensors, latency of the window closes (save_data, send_to_lora), packing of the 
+ LoRa payloads and growth of the memory during one simulated hour. The results are written 
+ in a JSON file and compared with the results of a previous version, the regressions are 
+ printed and the program ends with an error.
+
+ Usage:   python3 test/bench_pipeline.py --output results.json [--baseline previous.json]
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import gc
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import datetime
+from statistics import mean
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from conftest import MockHardware, install_mock_modules
+import Configuration
+import payload
+
+# results of a series of durations in milliseconds
+def summarize(durations):
+    durations = sorted(duration * 1000 for duration in durations)
+    return {"runs": len(durations), "mean_ms": mean(durations), "p95_ms": durations[int(len(durations) * 0.95)], "max_ms": durations[-1]}
+
+# durations of the calls of a function
+def time_calls(function, count):
+    durations = []
+    for index in range(count):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+# sample of the channels with realistic values (the radiation stays in the range of the version 1 payload)
+def random_sample(generator):
+    return {"Rayonnement solaire total": generator.uniform(0, 320), "Température": generator.uniform(-5, 30),
+            "Température globe": generator.uniform(-5, 40), "Humidité": generator.uniform(20, 100),
+            "Vitesse du vent": generator.uniform(0, 15)}
+
+# import the application with the mock hardware in a temporary directory
+def load_application():
+    hardware = MockHardware()
+    install_mock_modules(hardware)
+    directory = tempfile.mkdtemp(prefix="demo_mi2_bench_")
+    os.makedirs(os.path.join(directory, "data"))
+    os.makedirs(os.path.join(directory, "logs"))
+    os.chdir(directory)
+    Configuration.SENSOR_BACKEND = "blinka"
+    Configuration.SENSOR_BACKEND_OPTIONS = {}
+    Configuration.METRICS_HTTP_PORT = None
+    import demo_mi2
+    return demo_mi2, hardware
+
+# cost of the ticks with the latencies of a profile
+def bench_ticks(demo, hardware, profile, ticks):
+    hardware.use_profile(profile)
+    try:
+        demo.measure_data()
+        return summarize(time_calls(demo.measure_data, ticks))
+    finally:
+        hardware.use_profile("realistic")
+        # the reads still blocked by the worst case latencies end before the next benchmark
+        time.sleep(1)
+
+# latency of the window closes, each window is filled with the samples of its period
+def bench_window_closes(demo, windows):
+    generator = random.Random(1)
+    timestamp = time.time()
+    save_durations = []
+    send_durations = []
+    put = demo.outbox.put
+    demo.outbox.put = lambda frame: None
+    try:
+        for window in range(windows):
+            for second in range(300):
+                demo.add_sample(timestamp, random_sample(generator))
+                timestamp += 1
+                if second % 60 == 59:
+                    start = time.perf_counter()
+                    demo.save_data()
+                    save_durations.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            demo.send_to_lora()
+            send_durations.append(time.perf_counter() - start)
+    finally:
+        demo.outbox.put = put
+    return {"save_data": summarize(save_durations), "send_to_lora": summarize(send_durations)}
+
+# packing of the LoRa payloads
+def bench_payloads(count):
+    generator = random.Random(2)
+    samples = [[random_sample(generator)[channel] for channel in Configuration.DATA_CHANNELS] for index in range(5)]
+    timestamp = int(time.time())
+    results = {
+        "encode_v1": summarize(time_calls(lambda: payload.encode_v1(False, timestamp, samples[0], 0), count)),
+        "encode_v2": summarize(time_calls(lambda: payload.encode_v2(False, timestamp, 60, samples, 0), count)),
+        "encode_batches": summarize(time_calls(lambda: payload.encode_batches(False, timestamp, 60, samples * 12, 0, Configuration.LORA_MAX_PAYLOAD_BYTES), count // 10)),
+        "decode_v2": summarize(time_calls(lambda: payload.decode(payload.encode_v2(False, timestamp, 60, samples, 0)), count)),
+    }
+    try:
+        import numpy
+    except ImportError:
+        return results
+    rows = numpy.array([samples[index % 5] for index in range(1000)])
+    timestamps = numpy.arange(timestamp, timestamp + 1000)
+    results["encode_v1_batch_1000"] = summarize(time_calls(lambda: payload.encode_v1_batch(timestamps, rows, 0, False), count // 100))
+    return results
+
+# memory allocated by the application during one simulated hour of samples, saves and sends
+def bench_memory(demo, hours):
+    generator = random.Random(3)
+    timestamp = time.time()
+    put = demo.outbox.put
+    demo.outbox.put = lambda frame: None
+    # one hour to fill the buffers and the rollups, then the growth is measured
+    tracemalloc.start()
+    try:
+        growth = []
+        for hour in range(1 + hours):
+            gc.collect()
+            before = tracemalloc.get_traced_memory()[0]
+            for second in range(3600):
+                demo.add_sample(timestamp, random_sample(generator))
+                timestamp += 1
+                if second % 60 == 59:
+                    demo.save_data()
+                if second % 300 == 299:
+                    demo.send_to_lora()
+            gc.collect()
+            if hour > 0:
+                growth.append(tracemalloc.get_traced_memory()[0] - before)
+        return {"growth_bytes_per_hour": mean(growth), "peak_bytes": tracemalloc.get_traced_memory()[1]}
+    finally:
+        tracemalloc.stop()
+        demo.outbox.put = put
+
+# version of the sources
+def source_version():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+# run every benchmark
+# arguments are the application, the mock hardware and the sizes of the benchmarks
+def run_suite(demo, hardware, ticks=200, worst_case_ticks=10, windows=12, payloads=2000, hours=1):
+    return {
+        "version": source_version(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": {
+            "measure_data.realistic": bench_ticks(demo, hardware, "realistic", ticks),
+            "measure_data.worst_case": bench_ticks(demo, hardware, "worst_case", worst_case_ticks),
+            **{"window_close." + name: result for name, result in bench_window_closes(demo, windows).items()},
+            **{"payload." + name: result for name, result in bench_payloads(payloads).items()},
+            "memory": bench_memory(demo, hours),
+        },
+    }
+
+# compare the results with a baseline, a result is a regression when it is larger by more than the threshold
+# (relative) and by more than the minimum difference (absolute, in the unit of the value)
+# return the list of the regressions as strings
+def compare(results, baseline, threshold=0.2, minimum_difference={"ms": 0.1, "bytes": 262144}):
+    regressions = []
+    for name, values in results["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        for key in ["mean_ms", "p95_ms", "growth_bytes_per_hour"]:
+            if key not in values or key not in previous:
+                continue
+            unit = "ms" if key.endswith("_ms") else "bytes"
+            difference = values[key] - previous[key]
+            if difference > minimum_difference[unit] and difference > threshold * abs(previous[key]):
+                regressions.append("%s %s: %.3f -> %.3f (+%.0f %%)" % (name, key, previous[key], values[key], 100 * difference / max(abs(previous[key]), 1e-9)))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline of the application with mock hardware")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file of the results")
+    parser.add_argument("--baseline", help="JSON file of the results of a previous version")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative increase reported as a regression")
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--worst-case-ticks", type=int, default=10)
+    parser.add_argument("--hours", type=int, default=2, help="simulated hours of the memory benchmark")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    demo, hardware = load_application()
+    try:
+        results = run_suite(demo, hardware, ticks=args.ticks, worst_case_ticks=args.worst_case_ticks, hours=args.hours)
+    finally:
+        demo.acquisition_engine.shutdown()
+        demo.close_data_files()
+    with open(output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    for name, values in results["results"].items():
+        print("%-34s %s" % (name, "  ".join("%s: %.3f" % (key, value) if isinstance(value, float) else "%s: %s" % (key, value) for key, value in values.items())))
+    print("results written in "+output)
+    if baseline_path:
+        with open(baseline_path) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print("REGRESSION "+regression)
+        if regressions:
+            sys.exit(1)
+        print("no regression compared to "+baseline_path)
+
+if __name__ == "__main__":
+    main()
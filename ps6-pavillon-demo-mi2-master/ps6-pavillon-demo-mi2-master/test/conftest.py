@@ -0,0 +1,155 @@
+'''
+ Project: HEIA-FR / Measure meteorological data for the DEMO_MI2 modular pavillon 
+
+ Purpose: Configuration of pytest. The libraries of the hardware (board, busio, the 
+ Adafruit drivers, RPi.GPIO, serial and rak811) are replaced by modules answering with 
+ the values of the simulated backend, after a latency chosen for each device, so the 
+ application runs with its real backend (blinka) on any computer. The application 
+ is run in a temporary directory.
+
+ Usage:   python3 -m pytest (the benchmarks: python3 -m pytest -m benchmark [--benchmark-json results.json])
+
+ Author:  Denis Rosset et Julien Piguet
+ Date:    Mai 2021
+'''
+
+import os
+import sys
+import time
+import types
+import pytest
+
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SOURCE_DIRECTORY)
+import Configuration
+
+# the other scripts of this directory are endless loops printing the values of the real sensors
+collect_ignore = ["test_bmp280.py", "test_mcp9808.py", "test_pyrano.py", "test_sht31-d.py", "bench_pipeline.py"]
+
+# latencies of the devices in seconds: measured on the station, and close to the deadlines of the sensors
+LATENCY_PROFILES = {
+    "realistic": {"mcp9808": 0.002, "sht31d": 0.016, "bmp280": 0.005, "ads1115": 0.001, "anemometer": 0.05, "rak811": 0.5},
+    "worst_case": {"mcp9808": 0.25, "sht31d": 0.28, "bmp280": 0.2, "ads1115": 0.01, "anemometer": 0.55, "rak811": 6},
+}
+
+# hardware answering with the values of the simulated backend after the latency of each device
+class MockHardware:
+
+    def __init__(self):
+        from device import backend
+        self.values = backend.SimulatedBackend(latency=0, seed=1)
+        self.serial_backend = backend.SimulatedBackend(latency=0, seed=2)
+        self.latencies = {}
+        self.gpio = backend.SimulatedGPIO()
+        self.rak811 = None
+        self.use_profile("realistic")
+
+    def use_profile(self, name):
+        self.latencies = dict(LATENCY_PROFILES[name])
+        self.serial_backend.latency = self.latencies["anemometer"]
+
+    def wait(self, device):
+        latency = self.latencies.get(device, 0)
+        if latency > 0:
+            time.sleep(latency)
+
+# device of the mock hardware, every attribute given in readers is read after the latency of the device
+class MockDevice:
+
+    def __init__(self, hardware, device, **readers):
+        self._hardware = hardware
+        self._device = device
+        self._readers = readers
+
+    def __getattr__(self, name):
+        readers = self.__dict__.get("_readers", {})
+        if name not in readers:
+            raise AttributeError(name)
+        self._hardware.wait(self._device)
+        return readers[name]()
+
+# LoRa hat of the mock hardware, the frames sent are kept
+class MockRak811:
+
+    def __init__(self, hardware):
+        self._hardware = hardware
+        self.sent = []
+        hardware.rak811 = self
+
+    def set_config(self, config):
+        pass
+
+    def join(self):
+        self._hardware.wait("rak811")
+
+    def send(self, data):
+        self._hardware.wait("rak811")
+        self.sent.append(bytes(data))
+
+    def close(self):
+        pass
+
+# create a module and register it in sys.modules
+def add_module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    if "." in name:
+        parent, child = name.rsplit(".", 1)
+        setattr(sys.modules[parent], child, module)
+    return module
+
+# replace the libraries of the hardware by the mock hardware
+def install_mock_modules(hardware):
+    from device import backend
+    values = hardware.values
+    add_module("board", SCL=3, SDA=2)
+    add_module("busio", I2C=lambda scl, sda: object())
+    add_module("adafruit_mcp9808", MCP9808=lambda i2c: MockDevice(hardware, "mcp9808", temperature=values.globe_temperature))
+    add_module("adafruit_sht31d", SHT31D=lambda i2c: MockDevice(hardware, "sht31d", temperature=values.temperature, relative_humidity=values.humidity))
+    add_module("adafruit_bmp280", Adafruit_BMP280_I2C=lambda i2c: MockDevice(hardware, "bmp280", pressure=values.pressure, altitude=lambda: 600.0))
+    add_module("adafruit_ads1x15")
+    add_module("adafruit_ads1x15.ads1x15", Mode=types.SimpleNamespace(CONTINUOUS=0, SINGLE=256))
+    add_module("adafruit_ads1x15.ads1115", ADS1115=lambda i2c: MockDevice(hardware, "ads1115"), P0=0, P1=1)
+    add_module("adafruit_ads1x15.analog_in", AnalogIn=lambda ads, positive, negative: MockDevice(
+        hardware, "ads1115", voltage=lambda: values.radiation() * ads.gain * Configuration.PYRANOMETER_DIVIDE_NUMBER))
+    add_module("serial", Serial=lambda port=None, *args, **kwargs: backend.SimulatedSerial(hardware.serial_backend, **kwargs),
+               SerialException=IOError, PARITY_NONE="N", STOPBITS_ONE=1, EIGHTBITS=8)
+    add_module("RPi", GPIO=hardware.gpio)
+    sys.modules["RPi.GPIO"] = hardware.gpio
+    add_module("rak811")
+    add_module("rak811.rak811_v3", Rak811=lambda *args, **kwargs: MockRak811(hardware))
+
+# option of pytest giving the file of the results of the benchmarks
+def pytest_addoption(parser):
+    parser.addoption("--benchmark-json", default=None, help="write the results of the benchmarks in this JSON file")
+
+# mock hardware used by the whole session
+@pytest.fixture(scope="session")
+def hardware():
+    hardware = MockHardware()
+    install_mock_modules(hardware)
+    return hardware
+
+# application imported once with the mock hardware, in a temporary directory. The working directory
+# and the configuration are set back at the end of the session
+@pytest.fixture(scope="session")
+def demo(hardware, tmp_path_factory):
+    directory = tmp_path_factory.mktemp("demo_mi2")
+    os.makedirs(os.path.join(str(directory), "data"))
+    os.makedirs(os.path.join(str(directory), "logs"))
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(str(directory))
+        patch.setattr(Configuration, "SENSOR_BACKEND", "blinka")
+        patch.setattr(Configuration, "SENSOR_BACKEND_OPTIONS", {})
+        patch.setattr(Configuration, "METRICS_HTTP_PORT", None)
+        import demo_mi2
+        yield demo_mi2
+        demo_mi2.acquisition_engine.shutdown()
+        demo_mi2.close_data_files()
+
+# the latencies of the realistic profile are set back after each test
+@pytest.fixture
+def profile(hardware):
+    yield hardware.use_profile
+    hardware.use_profile("realistic")
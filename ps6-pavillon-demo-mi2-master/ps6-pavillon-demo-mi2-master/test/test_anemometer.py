@@ -0,0 +1,80 @@
+import time
+import threading
+
+import pytest
+
+# serial port of an anemometer answering the wind speed and the calibration prompt, but not the pressure value
+class SilentPressurePort:
+
+    def __init__(self):
+        self.timeout = None
+        self.in_waiting = 0
+        self.written = []
+
+    def reset_input_buffer(self):
+        pass
+
+    def write(self, data):
+        self.written.append(data)
+
+    def read_until(self, terminator):
+        if self.written[-1] == b' ':
+            return b"3.5 m/s\n"
+        if self.written[-1] == b'B':
+            return b"Pressure:"
+        time.sleep(self.timeout)
+        return b""
+
+    def read(self, size):
+        time.sleep(self.timeout)
+        return b""
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def session(hardware):
+    from device import anemometer
+    session = anemometer.AnemometerSession()
+    session._ser = SilentPressurePort()
+    return session
+
+def test_calibration_and_read_in_the_same_tick(demo, monkeypatch):
+    from device import anemometer
+    results = []
+    set_pressure = anemometer.setPressure
+    monkeypatch.setattr(anemometer, "setPressure", lambda pressure: results.append(set_pressure(pressure)) or results[-1])
+    measures = demo.read_sensors(["bmp280", "anemometer", "mcp9808"])
+    demo.acquisition_engine._running["bmp280"].result(5)
+    # the port is left to the calibration, the wind speed is read again at the next tick
+    assert results == [True]
+    assert measures.get("anemometer") is None and measures["mcp9808"] is not None
+    assert demo.read_sensors(["anemometer"])["anemometer"] is not None
+
+def test_failed_calibration_leaves_the_prompt(session):
+    with pytest.raises(TimeoutError):
+        session.set_pressure("950", timeout=0.2)
+    # the carriage return ends the prompt so the next command is not taken as the pressure
+    assert session._ser.written == [b'B', b'950', b'\r']
+    assert session._ser is not None
+    assert session.read_wind_speed(0.5) == 3.5
+
+def test_read_waits_for_the_calibration_until_its_timeout(session):
+    session._lock.acquire()
+    try:
+        start = time.monotonic()
+        with pytest.raises(TimeoutError):
+            session.read_wind_speed(0.2)
+        assert 0.2 <= time.monotonic() - start < 0.4
+    finally:
+        session._lock.release()
+    assert session._ser.written == []
+
+def test_read_after_the_calibration(session):
+    calibration = threading.Thread(target=lambda: pytest.raises(TimeoutError, session.set_pressure, "950", 0.2))
+    calibration.start()
+    time.sleep(0.05)
+    # the read waits for the end of the dialog, it is never sent in the middle of it
+    assert session.read_wind_speed(0.5) == 3.5
+    calibration.join()
+    assert session._ser.written == [b'B', b'950', b'\r', b' ']
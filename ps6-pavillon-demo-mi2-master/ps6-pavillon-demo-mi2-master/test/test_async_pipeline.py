@@ -0,0 +1,73 @@
+import time
+import asyncio
+import threading
+
+import async_pipeline
+
+# scheduler giving a sensor to read every interval
+class FastTicks:
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.next = time.monotonic()
+
+    def next_tick(self):
+        return self.next
+
+    def pop_due(self, now):
+        if now < self.next:
+            return []
+        self.next += self.interval
+        return ["sensor"]
+
+# run a pipeline in a thread with its own event loop
+def start(pipeline):
+    thread = threading.Thread(target=asyncio.run, args=(pipeline.run(),))
+    thread.start()
+    return thread
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+def test_slow_sink_drops_the_oldest_samples_and_stop_finishes_the_windows():
+    recorded = []
+    written = []
+    release = threading.Event()
+    def write(window):
+        release.wait()
+        written.append(window)
+    pipeline = async_pipeline.AsyncPipeline(FastTicks(), lambda sensors: {"sensor": 1.0}, lambda timestamp, results: recorded.append(timestamp),
+                                            queue_size=4, shutdown_timeout=5)
+    windows = []
+    def close_window():
+        windows.append(len(recorded))
+        return len(recorded)
+    pipeline.add_sink("slow", {"second": "*"}, write, close_window, queue_size=1)
+    pipeline.set_running(True)
+    thread = start(pipeline)
+    # the sink writes the first window, the second is queued and the third blocks the aggregator
+    wait_for(lambda: pipeline.dropped_samples > 0)
+    statistics = pipeline.get_statistics()
+    assert statistics["backlog"] == 4 and statistics["slow"]["backlog"] == 1
+    # the ticks are not delayed by the blocked aggregator
+    samples = pipeline.samples
+    time.sleep(0.2)
+    assert pipeline.samples > samples + 5
+    release.set()
+    pipeline.stop()
+    thread.join(5)
+    assert not thread.is_alive()
+    # every closed window is written and the samples are either recorded or dropped
+    assert written == windows
+    assert len(recorded) + pipeline.dropped_samples == pipeline.samples
+
+def test_stop_before_run():
+    pipeline = async_pipeline.AsyncPipeline(FastTicks(), lambda sensors: {}, lambda timestamp, results: None)
+    pipeline.stop()
+    thread = start(pipeline)
+    thread.join(5)
+    assert not thread.is_alive()
+    assert pipeline.samples == 0
@@ -0,0 +1,44 @@
+import json
+
+import pytest
+import Configuration
+from bench_pipeline import run_suite, compare
+
+# the benchmarks run in a few seconds and assert wall clock times, they only run with -m benchmark
+@pytest.fixture(scope="module")
+def results(demo, hardware, request):
+    results = run_suite(demo, hardware, ticks=50, worst_case_ticks=5, windows=4, payloads=500, hours=1)
+    path = request.config.getoption("--benchmark-json")
+    if path is not None:
+        with open(path, "w") as output:
+            json.dump(results, output, indent=2)
+    return results["results"]
+
+@pytest.mark.benchmark
+def test_tick_cost(results):
+    # a tick is bounded by the deadlines of the sensors, even when every sensor is slow
+    deadline_ms = max(Configuration.SENSOR_DEADLINES_SEC.values()) * 1000
+    assert results["measure_data.realistic"]["p95_ms"] < deadline_ms
+    assert results["measure_data.worst_case"]["max_ms"] < deadline_ms + 200
+
+@pytest.mark.benchmark
+def test_window_close_latency(results):
+    assert results["window_close.save_data"]["p95_ms"] < 100
+    assert results["window_close.send_to_lora"]["p95_ms"] < 100
+
+@pytest.mark.benchmark
+def test_payload_packing(results):
+    assert results["payload.encode_v1"]["mean_ms"] < 1
+    assert results["payload.encode_v2"]["mean_ms"] < 1
+
+@pytest.mark.benchmark
+def test_memory_growth(results):
+    # the buffers, windows and rollups have a fixed size once they are full
+    assert results["memory"]["growth_bytes_per_hour"] < 1000000
+
+def test_compare_finds_regressions():
+    baseline = {"results": {"measure_data.realistic": {"mean_ms": 10.0, "p95_ms": 12.0}, "memory": {"growth_bytes_per_hour": 0}}}
+    same = {"results": {"measure_data.realistic": {"mean_ms": 10.5, "p95_ms": 12.0}, "memory": {"growth_bytes_per_hour": 1000}}}
+    slower = {"results": {"measure_data.realistic": {"mean_ms": 15.0, "p95_ms": 12.0}, "memory": {"growth_bytes_per_hour": 1000000}}}
+    assert compare(same, baseline) == []
+    assert len(compare(slower, baseline)) == 2
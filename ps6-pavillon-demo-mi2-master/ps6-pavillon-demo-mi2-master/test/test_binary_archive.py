@@ -0,0 +1,64 @@
+import math
+from datetime import datetime
+
+import numpy
+
+import binary_archive
+import Configuration
+
+def write_archive(path, count, start=1620000000):
+    writer = binary_archive.BinaryArchiveWriter(path)
+    for index in range(count):
+        writer.append(start + index, [index, 20.5, None, 50, 1.5])
+    writer.close()
+
+# the reader maps the records and selects a time range without copying them
+def test_memmap_reader_range(tmp_path):
+    path = str(tmp_path / "archive.bin")
+    write_archive(path, 10)
+    reader = binary_archive.BinaryArchiveReader(path)
+    assert len(reader) == 10
+    records = reader.range(1620000003, 1620000006)
+    assert list(records["timestamp"]) == [1620000003, 1620000004, 1620000005]
+    assert isinstance(reader.records, numpy.memmap) and numpy.shares_memory(records, reader.records)
+    columns = reader.columns(start=1620000008)
+    assert list(columns["Rayonnement solaire total"]) == [8, 9]
+    assert math.isnan(columns["Température globe"][0])
+
+# a record cut by a power loss is dropped and the next records stay aligned
+def test_truncated_record_dropped(tmp_path):
+    path = str(tmp_path / "archive.bin")
+    write_archive(path, 3)
+    with open(path, "ab") as archive:
+        archive.write(b"\x01\x02\x03")
+    writer = binary_archive.BinaryArchiveWriter(path)
+    writer.append(1620000003, [3, 20.5, None, 50, 1.5])
+    writer.close()
+    assert [record[0] for record in binary_archive.iter_records(path, chunk_records=2)] == [1620000000 + index for index in range(4)]
+    assert len(binary_archive.BinaryArchiveReader(path)) == 4
+
+# an empty archive has no record and a file of another format is refused
+def test_empty_and_foreign_files(tmp_path):
+    path = str(tmp_path / "archive.bin")
+    write_archive(path, 0)
+    assert len(binary_archive.BinaryArchiveReader(path)) == 0
+    foreign = str(tmp_path / "foreign.bin")
+    with open(foreign, "wb") as other:
+        other.write(b"\x00" * binary_archive.HEADER_SIZE)
+    try:
+        binary_archive.BinaryArchiveWriter(foreign)
+        assert False, "the foreign file was accepted"
+    except ValueError:
+        pass
+
+# the export writes the records of the range in the CSV format of the data files
+def test_export_csv(tmp_path):
+    path = str(tmp_path / "archive.bin")
+    write_archive(path, 5)
+    output = str(tmp_path / "export.csv")
+    assert binary_archive.export_csv(path, output, 1620000001, 1620000003) == 2
+    with open(output) as csv_file:
+        lines = csv_file.read().splitlines()
+    assert lines[0] + "\n" == Configuration.DATA_FILE_FIRST_LINE
+    assert lines[1] == datetime.fromtimestamp(1620000001).strftime("%d/%m/%Y %H:%M:%S") + ",1.0,20.5,,50.0,1.5"
+    assert len(lines) == 3
@@ -0,0 +1,61 @@
+import os
+from datetime import datetime, timedelta
+
+import csv_sink
+
+def read_files(tmp_path):
+    return {name: open(os.path.join(str(tmp_path), name)).read() for name in sorted(os.listdir(str(tmp_path)))}
+
+# a new file with the first line is started every day
+def test_daily_rotation(tmp_path):
+    sink = csv_sink.CsvSink(str(tmp_path / "data_"), "a;b\n")
+    day = datetime(2021, 5, 1, 23, 59, 58)
+    sink.write_line("1;2", day)
+    sink.write_line("3;4", day + timedelta(seconds=1))
+    sink.write_line("5;6", day + timedelta(seconds=2))
+    sink.close()
+    assert read_files(tmp_path) == {"data_01-05-2021_23-59-58.csv": "a;b\n1;2\n3;4\n",
+                                    "data_02-05-2021_00-00-00.csv": "a;b\n5;6\n"}
+
+# a new file is started when the current one reached the maximum size
+def test_size_rotation(tmp_path):
+    sink = csv_sink.CsvSink(str(tmp_path / "data_"), "a;b\n", rotation=csv_sink.SIZE, max_bytes=10)
+    start = datetime(2021, 5, 1, 12, 0, 0)
+    for index in range(4):
+        sink.write_line("%d;%d" % (index, index), start + timedelta(seconds=index))
+    sink.close()
+    assert list(read_files(tmp_path).values()) == ["a;b\n0;0\n1;1\n", "a;b\n2;2\n3;3\n"]
+
+# the lines are written to the file every flush_every_lines lines, a reopened file gets no second first line
+def test_lines_flushed_in_groups(tmp_path):
+    sink = csv_sink.CsvSink(str(tmp_path / "data_"), "a;b\n", rotation=None, flush_every_lines=3, fsync_interval=None)
+    now = datetime(2021, 5, 1, 12, 0, 0)
+    sink.write_line("1;1", now)
+    sink.write_line("2;2", now)
+    assert open(sink.filename).read() == ""
+    sink.write_line("3;3", now)
+    assert open(sink.filename).read() == "a;b\n1;1\n2;2\n3;3\n"
+    sink.close()
+    sink.write_line("4;4", now)
+    sink.flush()
+    assert open(sink.filename).read() == "a;b\n1;1\n2;2\n3;3\n4;4\n"
+
+# the file is synchronized on the disk after fsync_interval, and when it is closed
+def test_fsync_interval(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(os, "fsync", synced.append)
+    clock = [100.0]
+    monkeypatch.setattr(csv_sink.time, "monotonic", lambda: clock[0])
+    sink = csv_sink.CsvSink(str(tmp_path / "data_"), "a;b\n", rotation=None, flush_every_lines=100, fsync_interval=10)
+    now = datetime(2021, 5, 1, 12, 0, 0)
+    sink.write_line("1;1", now)
+    assert synced == []
+    clock[0] += 10
+    sink.write_line("2;2", now)
+    assert len(synced) == 1
+    # the fsync also wrote the buffer
+    assert open(sink.filename).read() == "a;b\n1;1\n2;2\n"
+    sink.write_line("3;3", now)
+    assert len(synced) == 1
+    sink.close()
+    assert len(synced) == 2
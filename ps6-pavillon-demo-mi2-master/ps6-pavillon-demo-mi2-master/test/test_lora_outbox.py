@@ -0,0 +1,120 @@
+import os
+
+import lora_outbox
+
+# send function failing a number of times before sending the frames
+class FailingSender:
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.sent = []
+
+    def __call__(self, frame):
+        if self.failures > 0:
+            self.failures -= 1
+            return -1
+        self.sent.append(frame)
+        return 0
+
+# scheduler without slot, it counts the frames sent
+class CountingScheduler:
+
+    def __init__(self):
+        self.sizes = []
+
+    def delay(self, payload_size):
+        return 0
+
+    def sent(self, payload_size):
+        self.sizes.append(payload_size)
+
+def test_failed_frame_sent_again_with_backoff(tmp_path):
+    sender = FailingSender(4)
+    outbox = lora_outbox.LoraOutbox(str(tmp_path), sender, 10, 30)
+    outbox.put(b"first")
+    outbox.put(b"second")
+    # the waits are doubled up to the maximum, the frame stays first in the queue
+    assert [outbox.send_next() for attempt in range(4)] == [10, 20, 30, 30]
+    assert outbox.failed == 4 and len(outbox) == 2
+    assert outbox.send_next() == 0
+    # the backoff starts again after a frame is sent
+    sender.failures = 1
+    assert outbox.send_next() == 10
+    assert outbox.send_next() == 0
+    assert sender.sent == [b"first", b"second"]
+    assert outbox.send_next() is None
+    assert outbox.sent == 2 and len(outbox) == 0
+
+def test_exception_counts_as_a_failed_send(tmp_path):
+    def broken(frame):
+        raise OSError("no LoRa hat")
+    outbox = lora_outbox.LoraOutbox(str(tmp_path), broken, 10, 30)
+    outbox.put(b"frame")
+    assert outbox.send_next() == 10
+    assert len(outbox) == 1
+
+def test_oldest_frames_dropped_when_full(tmp_path):
+    sender = FailingSender(0)
+    outbox = lora_outbox.LoraOutbox(str(tmp_path), sender, 10, 30, max_frames=2)
+    for frame in [b"1", b"2", b"3"]:
+        outbox.put(frame)
+    assert outbox.dropped == 1 and len(outbox) == 2
+    while outbox.send_next() is not None:
+        pass
+    assert sender.sent == [b"2", b"3"]
+
+def test_frames_kept_after_a_restart(tmp_path):
+    outbox = lora_outbox.LoraOutbox(str(tmp_path), FailingSender(1), 10, 30)
+    outbox.put(b"1")
+    outbox.put(b"2")
+    assert outbox.send_next() == 10
+    # no temporary file is left and the new frames are queued after the old ones
+    assert sorted(os.listdir(str(tmp_path))) == ["000000000000.frame", "000000000001.frame"]
+    sender = FailingSender(0)
+    scheduler = CountingScheduler()
+    outbox = lora_outbox.LoraOutbox(str(tmp_path), sender, 10, 30, scheduler=scheduler)
+    outbox.put(b"3")
+    while outbox.send_next() is not None:
+        pass
+    assert sender.sent == [b"1", b"2", b"3"]
+    assert scheduler.sizes == [1, 1, 1]
+
+def test_sender_thread(tmp_path):
+    sender = FailingSender(0)
+    outbox = lora_outbox.LoraOutbox(str(tmp_path), sender, 10, 30)
+    outbox.start()
+    outbox.put(b"frame")
+    for attempt in range(100):
+        if sender.sent:
+            break
+        outbox._stop.wait(0.01)
+    outbox.stop(1)
+    assert sender.sent == [b"frame"]
+
+# the radio is prepared (join) before the wait for the slot and only the frames sent use the budget
+def test_join_before_the_slot_and_failed_sends_not_charged(tmp_path):
+    calls = []
+    class OrderScheduler(CountingScheduler):
+        def delay(self, payload_size):
+            calls.append("slot")
+            return 0
+    sender = FailingSender(1)
+    scheduler = OrderScheduler()
+    outbox = lora_outbox.LoraOutbox(str(tmp_path), sender, 10, 30, scheduler=scheduler,
+                                    prepare_function=lambda: calls.append("join"))
+    outbox.put(b"frame")
+    assert outbox.send_next() == 10
+    assert calls == ["join", "slot"] and scheduler.sizes == []
+    assert outbox.send_next() == 0
+    assert scheduler.sizes == [5]
+
+# a failed join is a failed send, the slot is not waited and no airtime is charged
+def test_failed_join_counts_as_a_failed_send(tmp_path):
+    def no_network():
+        raise OSError("join refused")
+    sender = FailingSender(0)
+    scheduler = CountingScheduler()
+    outbox = lora_outbox.LoraOutbox(str(tmp_path), sender, 10, 30, scheduler=scheduler, prepare_function=no_network)
+    outbox.put(b"frame")
+    assert outbox.send_next() == 10
+    assert sender.sent == [] and scheduler.sizes == [] and outbox.failed == 1
@@ -0,0 +1,75 @@
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import payload
+
+SAMPLES = [[0.0, 12.5, 14.03, 71.2, 2.013],
+           [0.37, 12.52, 14.1, 70.95, 2.4],
+           [15.24, 13.01, 15.67, 69.0, 3.875],
+           [120.5, 14.2, 18.33, 60.41, 0.0],
+           [327.0, -5.5, -3.25, 100.0, 12.345]]
+
+def test_control_byte():
+    for version in [payload.VERSION_SINGLE, payload.VERSION_BATCH]:
+        for device in range(8):
+            for is_test in [False, True]:
+                assert payload.read_control_byte(payload.control_byte(version, is_test, device)) == (version, is_test, device)
+
+def test_v1_layout():
+    frame = payload.encode_v1(True, 1622540000, [56.45, 23.12, 24.01, 2.1, 3.2], 1)
+    assert len(frame) == 15
+    assert frame[0] == 1 + 16 + 128
+    sample, = payload.decode(frame)
+    assert sample["timestamp"] == 1622540000 and sample["test"] and sample["device"] == 1
+
+def test_v2_matches_v1():
+    frame = payload.encode_v2(False, 1622540000, 60, SAMPLES, 3)
+    decoded = payload.decode(frame)
+    assert frame[0] & 0x0f == payload.VERSION_BATCH
+    assert len(decoded) == len(SAMPLES)
+    for index, (sample, values) in enumerate(zip(decoded, SAMPLES)):
+        expected, = payload.decode(payload.encode_v1(False, 1622540000 + index * 60, values, 3))
+        assert sample == expected
+
+def test_v2_missing_values():
+    samples = [[None, 12.5, 14.0, None, 2.0], [1.0, None, 14.5, 70.0, None], [None, None, None, None, None]]
+    decoded = payload.decode(payload.encode_v2(False, 1000, 300, samples))
+    assert [sample["values"] for sample in decoded] == samples
+    assert [sample["timestamp"] for sample in decoded] == [1000, 1300, 1600]
+
+def test_batches_fit_in_frames():
+    generator = random.Random(0)
+    samples = [[generator.uniform(0, 300), generator.uniform(-10, 35), generator.uniform(-10, 45), generator.uniform(0, 100), generator.uniform(0, 20)] for index in range(40)]
+    frames = payload.encode_batches(False, 5000, 60, samples, max_size=51)
+    assert all(len(frame) <= 51 for frame in frames)
+    decoded = [sample for frame in frames for sample in payload.decode(frame)]
+    assert [sample["timestamp"] for sample in decoded] == [5000 + index * 60 for index in range(40)]
+    for sample, values in zip(decoded, samples):
+        expected, = payload.decode(payload.encode_v1(False, sample["timestamp"], values))
+        assert sample["values"] == expected["values"]
+
+def test_v2_smaller_than_v1():
+    frame = payload.encode_v2(False, 1622540000, 60, SAMPLES[:4])
+    assert len(frame) < 4 * payload.V1_SIZE
+
+def test_v1_batch_matches_single_frames():
+    timestamps = [1622540000 + index * 300 for index in range(len(SAMPLES))]
+    devices = [index % 8 for index in range(len(SAMPLES))]
+    batch = payload.encode_v1_batch(timestamps, SAMPLES, devices, True)
+    frames = [payload.encode_v1(True, timestamp, values, device) for timestamp, values, device in zip(timestamps, SAMPLES, devices)]
+    assert batch == b"".join(frames)
+    columns = payload.decode_v1_batch(frames)
+    for index, frame in enumerate(frames):
+        sample, = payload.decode(frame)
+        assert columns["timestamp"][index] == sample["timestamp"]
+        assert columns["device"][index] == sample["device"] and columns["test"][index] == sample["test"]
+        assert [columns[column][index] for column in payload.Configuration.DATA_CHANNEL_COLUMNS] == sample["values"]
+
+def test_decode_batch_mixed_versions():
+    frames = [payload.encode_v1(False, 1000, SAMPLES[0]), payload.encode_v2(False, 2000, 60, [SAMPLES[1], [None] * 5])]
+    columns = payload.decode_batch(frames)
+    assert list(columns["timestamp"]) == [1000, 2000, 2060]
+    assert list(columns["version"]) == [1, 2, 2]
+    assert columns["radiation"][1] == 0.37 and columns["radiation"][2] != columns["radiation"][2]
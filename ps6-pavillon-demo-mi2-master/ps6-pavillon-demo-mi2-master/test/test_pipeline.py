@@ -0,0 +1,110 @@
+import time
+import threading
+import math
+
+import payload
+import send_lora
+import uplink_scheduler
+import Configuration
+
+def test_read_every_sensor(demo):
+    results = demo.read_sensors()
+    for name in ["mcp9808", "sht31_d", "anemometer", "pyrano"]:
+        assert results[name] is not None, name
+    temperature, humidity = results["sht31_d"]
+    assert -20 < temperature < 50 and 0 <= humidity <= 100
+
+def test_sensor_missing_after_deadline(demo, hardware, profile):
+    hardware.latencies["mcp9808"] = Configuration.SENSOR_DEADLINES_SEC["mcp9808"] + 0.2
+    start = time.monotonic()
+    results = demo.read_sensors(["mcp9808", "anemometer"])
+    # the tick is not delayed by the late sensor and the sensors of the other buses are read
+    assert time.monotonic() - start < Configuration.SENSOR_DEADLINES_SEC["anemometer"] + 0.1
+    assert results["mcp9808"] is None
+    assert results["anemometer"] is not None
+    # the late read ends before the next tests
+    time.sleep(0.5)
+
+# the led shows the missing sensor until every sensor answers again
+def test_led_restored_after_a_complete_measure(demo, hardware, profile):
+    demo.set_led_interval(Configuration.LED_INTERVAL_MEASURE)
+    hardware.latencies["mcp9808"] = Configuration.SENSOR_DEADLINES_SEC["mcp9808"] + 0.2
+    demo.read_sensors(["mcp9808"])
+    assert demo.led.interval == Configuration.LED_INTERVAL_SENSOR_ERROR
+    time.sleep(0.5)
+    profile("realistic")
+    demo.read_sensors(["mcp9808"])
+    assert demo.led.interval == Configuration.LED_INTERVAL_MEASURE
+
+def test_save_data_writes_the_window(demo):
+    for index in range(3):
+        demo.measure_data()
+    demo.save_data()
+    demo.data_file.flush()
+    with open(demo.data_file.filename) as data_file:
+        line = data_file.read().splitlines()[-1]
+    values = line.split(",")[1:1 + len(Configuration.DATA_CHANNELS)]
+    assert all(value != "" for value in values)
+
+def test_send_to_lora_queues_the_means(demo, monkeypatch):
+    frames = []
+    monkeypatch.setattr(demo.outbox, "put", frames.append)
+    monkeypatch.setattr(Configuration, "LORA_PAYLOAD_VERSION", payload.VERSION_SINGLE)
+    demo.send_statistics.close()
+    for index in range(3):
+        demo.measure_data()
+    demo.send_to_lora()
+    assert len(frames) == 1
+    sample, = payload.decode(frames[0])
+    assert not sample["test"] and sample["device"] == demo.device_id
+    assert abs(sample["timestamp"] - time.time()) < 5
+    assert all(value is not None and not math.isnan(value) for value in sample["values"])
+
+def test_rak811_session_sends_the_frame(demo, hardware):
+    frame = payload.encode_v1(True, int(time.time()), [1, 2, 3, 4, 5], 0)
+    assert send_lora.send_payload(frame, True) == 0
+    assert hardware.rak811.sent[-1] == frame
+
+def test_raw_samples_kept_only_for_the_archive(demo, monkeypatch):
+    demo.archive_raw_samples()
+    demo.measure_data()
+    assert demo.samples.pending("raw_archive") == 1
+    monkeypatch.setattr(demo, "keep_raw_samples", False)
+    demo.measure_data()
+    assert demo.samples.pending("raw_archive") == 1
+
+def test_uplinks_in_the_slot_of_the_device(demo, monkeypatch):
+    monkeypatch.setattr(Configuration, "RASPBERRY_PI_ID", 1)
+    monkeypatch.setattr(demo, "device_id", demo.device_id)
+    monkeypatch.setattr(demo.uplinks, "device_id", demo.uplinks.device_id)
+    demo.set_device_id(Configuration.RASPBERRY_PI_ID)
+    start = demo.uplinks.slot_start(10)
+    # the slot of the device 1 is the second slot of the cycle
+    assert 10 * demo.uplinks.cycle + demo.uplinks.slot_width <= start < 10 * demo.uplinks.cycle + 2 * demo.uplinks.slot_width
+    assert start != uplink_scheduler.UplinkScheduler(0).slot_start(10)
+
+def test_lmic_daemon_missing_falls_back_to_send_lora(demo, monkeypatch, tmp_path):
+    frames = []
+    monkeypatch.setattr(Configuration, "LORA_USE_DAEMON", True)
+    monkeypatch.setattr(send_lora.daemon, "path", str(tmp_path / "missing.sock"))
+    monkeypatch.setattr(send_lora, "run_send_lora", lambda frame: frames.append(frame) or 0)
+    frame = payload.encode_v1(True, int(time.time()), [1, 2, 3, 4, 5], 0)
+    assert send_lora.send_payload(frame, False) == 0
+    assert frames == [frame]
+
+def test_pyranometer_sampler_follows_the_measures(demo, monkeypatch):
+    from device import pyrano
+    # the jobs of the threads mode are not started in the tests
+    monkeypatch.setattr(demo, "data_jobs", [], raising=False)
+    demo.start_measures()
+    try:
+        assert pyrano.sampler._thread is not None and pyrano.sampler._thread.is_alive()
+        # the measures use the buffered conversions
+        time.sleep(0.1)
+        assert pyrano.sampler.voltage() is not None
+    finally:
+        demo.stop_measures()
+    assert pyrano.sampler._thread is None
+    assert not any(thread.name == "pyrano-sampler" for thread in threading.enumerate())
+    # without the sampler the radiation is read with a single conversion
+    assert demo.read_sensors(["pyrano"])["pyrano"] is not None
@@ -0,0 +1,143 @@
+import os
+import time
+import signal
+
+import process_pipeline
+import shared_sample_ring
+
+CHANNELS = ["a", "b"]
+# a round timestamp, so the windows of {"second": "*/10"} end at BASE + 10, BASE + 20...
+BASE = 1622540000
+
+# stop event set after a number of polls
+class StopAfter:
+
+    def __init__(self, polls):
+        self.polls = polls
+
+    def wait(self, timeout):
+        self.polls -= 1
+        return self.polls < 0
+
+    def is_set(self):
+        return self.polls < 0
+
+# column of the ring calling a function at its first read
+class ColumnWritingAtFirstRead:
+
+    def __init__(self, column, function):
+        self.column = column
+        self.function = function
+
+    def __getitem__(self, index):
+        if self.function is not None:
+            function, self.function = self.function, None
+            function()
+        return self.column[index]
+
+def test_ring_read_after_wrap():
+    ring = shared_sample_ring.SharedSampleRing(CHANNELS, 4)
+    try:
+        for index in range(6):
+            ring.append(BASE + index, {"a": index, "b": None if index == 5 else -index})
+        # the first two samples were overwritten
+        end, samples = ring.read(0)
+        assert end == 6
+        assert [(position, timestamp) for position, timestamp, values in samples] == [(2, BASE + 2), (3, BASE + 3), (4, BASE + 4), (5, BASE + 5)]
+        assert samples[0][2] == [2, -2]
+        assert samples[-1][2][0] == 5 and samples[-1][2][1] != samples[-1][2][1]
+        assert ring.read(6) == (6, [])
+    finally:
+        ring.close()
+
+def test_ring_drops_the_samples_overwritten_during_the_read():
+    ring = shared_sample_ring.SharedSampleRing(CHANNELS, 4)
+    writer = shared_sample_ring.SharedSampleRing(CHANNELS, 4, name=ring.name)
+    try:
+        for index in range(4):
+            ring.append(BASE + index, {"a": index, "b": index})
+        # the writer adds two samples while the reader copies the timestamps
+        ring._columns[0] = ColumnWritingAtFirstRead(ring._columns[0], lambda: [writer.append(BASE + index, {"a": index, "b": index}) for index in (4, 5)])
+        end, samples = ring.read(0)
+        assert end == 4
+        assert [position for position, timestamp, values in samples] == [2, 3]
+        assert [timestamp for position, timestamp, values in samples] == [BASE + 2, BASE + 3]
+    finally:
+        ring._columns[0] = ring._columns[0].column
+        writer.close()
+        ring.close()
+
+def test_consumer_restarts_at_its_open_window():
+    ring = shared_sample_ring.SharedSampleRing(CHANNELS, 64)
+    try:
+        for index in range(15):
+            ring.append(BASE + index, {"a": index, "b": index})
+        windows = []
+        added = []
+        def close_window():
+            window = list(added)
+            added.clear()
+            return window
+        sinks = [({"second": "*/10"}, windows.append, close_window)]
+        process_pipeline.run_consumer(ring, 0, lambda timestamp, sample: added.append(timestamp), sinks, StopAfter(1), 0)
+        assert windows == [[BASE + index for index in range(10)]]
+        # the cursor is at the start of the open window, a restarted consumer reads its samples again
+        assert ring.cursor(0) == 10
+        added.clear()
+        process_pipeline.run_consumer(ring, 0, lambda timestamp, sample: added.append(timestamp), sinks, StopAfter(1), 0)
+        assert added == [BASE + index for index in range(10, 15)]
+        assert len(windows) == 1
+    finally:
+        ring.close()
+
+def crash(stop_event):
+    os._exit(3)
+
+def wait_for_stop(stop_event):
+    while not stop_event.wait(0.01):
+        pass
+
+def stuck(stop_event):
+    while True:
+        time.sleep(1)
+
+def test_supervisor_restarts_with_backoff():
+    supervisor = process_pipeline.ProcessSupervisor(restart_delay=0.1, max_restart_delay=0.4, poll_interval=0.01)
+    supervisor.add_process("crash", crash)
+    starts = []
+    start = supervisor._start
+    def record_start(name):
+        starts.append(time.monotonic())
+        start(name)
+    supervisor._start = record_start
+    supervisor.start()
+    end = time.monotonic() + 1.6
+    while time.monotonic() < end:
+        supervisor.check()
+        time.sleep(0.01)
+    supervisor.stop(1)
+    gaps = [second - first for first, second in zip(starts, starts[1:])]
+    # restarted after 0.1, 0.2, 0.4 then 0.4 sec (the maximum)
+    assert supervisor.get_statistics()["crash"] == len(starts) - 1 >= 4
+    for gap, delay in zip(gaps, [0.1, 0.2, 0.4, 0.4]):
+        assert delay <= gap < delay + 0.19
+
+def test_children_stop_with_the_stop_event_not_sigterm():
+    supervisor = process_pipeline.ProcessSupervisor(poll_interval=0.01)
+    supervisor.add_process("worker", wait_for_stop)
+    supervisor.start()
+    process = supervisor._children["worker"]["process"]
+    time.sleep(0.2)
+    # systemd sends SIGTERM to every process of the service, the child finishes its work with the stop event
+    os.kill(process.pid, signal.SIGTERM)
+    time.sleep(0.2)
+    assert process.is_alive()
+    supervisor.stop(5)
+    assert process.exitcode == 0
+
+def test_stuck_child_killed_at_stop():
+    supervisor = process_pipeline.ProcessSupervisor(poll_interval=0.01)
+    supervisor.add_process("stuck", stuck)
+    supervisor.start()
+    supervisor.stop(0.3)
+    assert supervisor._children["stuck"]["process"].exitcode == -signal.SIGKILL
@@ -0,0 +1,76 @@
+import os
+
+import raw_archive
+
+def test_round_trip(tmp_path):
+    path = os.path.join(str(tmp_path), "raw.bin")
+    writer = raw_archive.RawArchiveWriter(path, block_seconds=10)
+    samples = [(1622540000 + index, [index * 1.5, 12.25, None, 60.0, 2.125]) for index in range(25)]
+    for timestamp, values in samples:
+        writer.append(timestamp, values)
+    writer.close()
+    assert writer.blocks == 3
+    read = list(raw_archive.iter_samples(path))
+    assert [timestamp for timestamp, values in read] == [timestamp for timestamp, values in samples]
+    assert [list(values) for timestamp, values in read][3] == [4.5, 12.25, None, 60.0, 2.125]
+
+def test_clock_going_back(tmp_path):
+    # the clock of the Raspberry Pi is set by NTP after the boot and can go back
+    path = os.path.join(str(tmp_path), "raw.bin")
+    writer = raw_archive.RawArchiveWriter(path, block_seconds=300)
+    for timestamp in [1622540000, 1622540001, 1622539000, 1622539001]:
+        writer.append(timestamp, [1, 2, 3, 4, 5])
+    writer.close()
+    assert writer.blocks == 2
+    assert [timestamp for timestamp, values in raw_archive.iter_samples(path)] == [1622540000, 1622540001, 1622539000, 1622539001]
+
+def test_corrupted_block_keeps_the_next_blocks(tmp_path):
+    path = os.path.join(str(tmp_path), "raw.bin")
+    writer = raw_archive.RawArchiveWriter(path, block_seconds=10)
+    for index in range(30):
+        writer.append(1622540000 + index, [index, 1, 2, 3, 4])
+    writer.close()
+    # one byte of the payload of the first block is changed and the last block is cut by a power loss
+    with open(path, "r+b") as archive:
+        archive.seek(raw_archive.BLOCK_HEADER_SIZE)
+        byte = archive.read(1)
+        archive.seek(raw_archive.BLOCK_HEADER_SIZE)
+        archive.write(bytes([byte[0] ^ 0xff]))
+    size = os.path.getsize(path)
+    os.truncate(path, size - 3)
+    writer = raw_archive.RawArchiveWriter(path, block_seconds=10)
+    writer.append(1622540100, [100, 1, 2, 3, 4])
+    writer.close()
+    timestamps = [timestamp for timestamp, values in raw_archive.iter_samples(path)]
+    assert timestamps == list(range(1622540010, 1622540020)) + [1622540100]
+
+def write_blocks(path, first, count):
+    writer = raw_archive.RawArchiveWriter(path, block_seconds=10)
+    for index in range(first, first + count):
+        writer.append(1622540000 + index, [index, 1, 2, 3, 4])
+    writer.close()
+
+def test_zero_filled_tail_dropped(tmp_path):
+    path = os.path.join(str(tmp_path), "raw.bin")
+    write_blocks(path, 0, 20)
+    size = os.path.getsize(path)
+    # the file system allocated the end of the file but the block was not written before the power loss
+    with open(path, "ab") as archive:
+        archive.write(bytes(4096))
+    assert [timestamp for timestamp, values in raw_archive.iter_samples(path)] == list(range(1622540000, 1622540020))
+    write_blocks(path, 20, 5)
+    assert os.path.getsize(path) > size
+    assert [timestamp for timestamp, values in raw_archive.iter_samples(path)] == list(range(1622540000, 1622540025))
+
+def test_unreadable_header_between_blocks_skipped(tmp_path):
+    path = os.path.join(str(tmp_path), "raw.bin")
+    write_blocks(path, 0, 20)
+    with open(path, "rb") as archive:
+        offsets = [offset for offset, fields, payload, valid in raw_archive.read_blocks(archive)]
+        archive.seek(0)
+        data = archive.read()
+    # garbage between the two blocks
+    with open(path, "wb") as archive:
+        archive.write(data[:offsets[1]] + b"\xff" * 100 + data[offsets[1]:])
+    write_blocks(path, 20, 5)
+    assert [timestamp for timestamp, values in raw_archive.iter_samples(path)] == list(range(1622540000, 1622540025))
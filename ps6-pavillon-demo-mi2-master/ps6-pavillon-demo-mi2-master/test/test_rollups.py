@@ -0,0 +1,51 @@
+import math
+
+import rollups
+
+# a sample every second with the value of its timestamp, the humidity is missing every 10 s
+def add_samples(rollup, start, end):
+    for timestamp in range(start, end):
+        rollup.add_sample(timestamp, {"temperature": timestamp, "humidity": math.nan if timestamp % 10 == 0 else 50})
+
+# each tier is closed at the end of its period and merged in the next tier
+def test_tiers_closed_and_merged():
+    rollup = rollups.Rollups(["temperature", "humidity"], {1: 10, 60: 5, 300: 2})
+    add_samples(rollup, 0, 120)
+    # the last second is closed when the next tick arrives
+    assert len(rollup.query(1)) == 10 and rollup.latest(1)["start"] == 118
+    rollup.advance(120)
+    minutes = rollup.query(60)
+    assert [minute["start"] for minute in minutes] == [0, 60]
+    assert minutes[0]["temperature"]["count"] == 60 and minutes[0]["temperature"]["mean"] == 29.5
+    assert minutes[1]["temperature"]["min"] == 60 and minutes[1]["temperature"]["max"] == 119
+    assert minutes[0]["humidity"]["count"] == 54
+    # the 5 minutes bucket is still open
+    assert rollup.query(300) == [] and rollup.latest(300) is None
+    rollup.advance(300)
+    five_minutes = rollup.latest(300)
+    assert five_minutes["temperature"]["count"] == 120 and five_minutes["temperature"]["mean"] == 59.5
+    assert math.isclose(five_minutes["temperature"]["std"], math.sqrt((120 ** 2 - 1) / 12), rel_tol=1e-3)
+
+# the buckets are aligned on the epoch and a gap in the samples closes the buckets without values
+def test_gap_in_the_samples():
+    rollup = rollups.Rollups(["temperature"], {1: 10, 60: 5})
+    rollup.add_sample(30.5, {"temperature": 1})
+    rollup.add_sample(200, {"temperature": None})
+    assert [second["start"] for second in rollup.query(1)] == [30]
+    minutes = rollup.query(60)
+    assert [minute["start"] for minute in minutes] == [0]
+    rollup.advance(240)
+    minute = rollup.latest(60)
+    assert minute["start"] == 180 and minute["temperature"]["count"] == 0 and minute["temperature"]["mean"] is None
+
+# only the last closed buckets of a tier are kept and the time range of the query is applied
+def test_history_and_query_range():
+    rollup = rollups.Rollups(["temperature"], {1: 3})
+    add_samples(rollup, 0, 10)
+    assert [second["start"] for second in rollup.query(1)] == [6, 7, 8]
+    assert [second["start"] for second in rollup.query(1, 7, 8)] == [7]
+    try:
+        rollup.query(60)
+        assert False, "the tier was found"
+    except KeyError:
+        pass
@@ -0,0 +1,68 @@
+import math
+import sqlite3
+
+import sqlite_store
+
+COLUMNS = ["temperature", "humidity"]
+
+# the rows are only written by flush, in the WAL journal, and can then be queried
+def test_wal_inserts_and_range_query(tmp_path):
+    path = str(tmp_path / "measures.db")
+    store = sqlite_store.SqliteStore(path, [1, 60], COLUMNS)
+    assert store._connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    for second in range(5):
+        store.add(1, 1000 + second, [20 + second, None if second == 2 else math.nan if second == 3 else 50])
+    store.add(60, 960, [21, 55])
+    assert store.query_range(1, "temperature", 0) == []
+    assert store.flush() == 6
+    assert store.flush() == 0
+    assert store.query_range(1, "temperature", 1001, 1003) == [(1001, 21), (1002, 22)]
+    assert store.query_range(1, "humidity", 1002, 1004) == [(1002, None), (1003, None)]
+    assert store.query_range(60, "humidity", 0) == [(960, 55)]
+    # another connection reads the rows written
+    other = sqlite3.connect(path)
+    assert other.execute("SELECT COUNT(*) FROM measures_1s").fetchone()[0] == 5
+    other.close()
+    store.close()
+
+# a row written again for the same timestamp replaces the first one
+def test_row_replaced(tmp_path):
+    store = sqlite_store.SqliteStore(str(tmp_path / "measures.db"), [1], COLUMNS)
+    store.add(1, 1000, [20, 50])
+    store.flush()
+    store.add(1, 1000, [21, 51])
+    store.close()
+    store = sqlite_store.SqliteStore(str(tmp_path / "measures.db"), [1], COLUMNS)
+    assert store.query_range(1, "temperature", 0) == [(1000, 21)]
+    store.close()
+
+# the aggregates ignore the missing values
+def test_aggregates(tmp_path):
+    store = sqlite_store.SqliteStore(str(tmp_path / "measures.db"), [1], COLUMNS)
+    for second, temperature in enumerate([10, 20, None, 30]):
+        store.add(1, 1000 + second, [temperature, 50])
+    store.flush()
+    assert store.query_aggregate(1, "temperature", 1000) == 20
+    assert store.query_aggregate(1, "temperature", 1000, 1002, "max") == 20
+    assert store.query_aggregate(1, "temperature", 0, aggregate="count") == 3
+    for wrong in [lambda: store.query_aggregate(1, "temperature", 0, aggregate="median"),
+                  lambda: store.query_range(1, "pressure", 0),
+                  lambda: store.add(5, 1000, [1, 2])]:
+        try:
+            wrong()
+            assert False, "the query was accepted"
+        except ValueError:
+            pass
+    store.close()
+
+# the rows older than the retention time of their resolution are deleted
+def test_prune(tmp_path):
+    store = sqlite_store.SqliteStore(str(tmp_path / "measures.db"), [1, 60], COLUMNS)
+    for second in range(10):
+        store.add(1, 1000 + second, [20, 50])
+    store.add(60, 0, [20, 50])
+    store.flush()
+    assert store.prune({1: 5, 60: None}, now=1010) == 5
+    assert [row[0] for row in store.query_range(1, "temperature", 0)] == [1005, 1006, 1007, 1008, 1009]
+    assert len(store.query_range(60, "temperature", 0)) == 1
+    store.close()
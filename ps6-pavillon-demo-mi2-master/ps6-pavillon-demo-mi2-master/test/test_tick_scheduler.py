@@ -0,0 +1,53 @@
+import tick_scheduler
+
+def test_tasks_due_at_their_period():
+    scheduler = tick_scheduler.TickScheduler()
+    scheduler.add_task("fast", 1)
+    scheduler.add_task("slow", 3)
+    start = scheduler.next_tick()
+    assert sorted(scheduler.pop_due(start)) == ["fast", "slow"]
+    assert scheduler.pop_due(start + 0.5) == []
+    assert scheduler.pop_due(start + 1.001) == ["fast"]
+    assert scheduler.pop_due(start + 2) == ["fast"]
+    assert sorted(scheduler.pop_due(start + 3)) == ["fast", "slow"]
+    assert scheduler.next_tick() == start + 4
+
+def test_missed_ticks_skipped():
+    scheduler = tick_scheduler.TickScheduler()
+    scheduler.add_task("sensor", 1, tick_scheduler.SKIP)
+    start = scheduler.next_tick()
+    scheduler.pop_due(start)
+    # the measure took 2.5 ticks: the two missed ticks are skipped and the next one stays on the grid
+    assert scheduler.pop_due(start + 3.5) == ["sensor"]
+    assert scheduler.next_tick() == start + 4
+    statistics = scheduler.get_statistics()["sensor"]
+    assert statistics["runs"] == 2 and statistics["overruns"] == 2 and statistics["skipped"] == 2
+    assert statistics["jitter"][">1000 ms"] == 1
+
+def test_missed_ticks_caught_up():
+    scheduler = tick_scheduler.TickScheduler(max_catch_up=5)
+    scheduler.add_task("sensor", 1, tick_scheduler.CATCH_UP)
+    start = scheduler.next_tick()
+    scheduler.pop_due(start)
+    now = start + 3.5
+    runs = 0
+    while scheduler.pop_due(now):
+        runs += 1
+    # the ticks of start + 1, 2 and 3 are run late, one after the other
+    assert runs == 3
+    assert scheduler.next_tick() == start + 4
+    statistics = scheduler.get_statistics()["sensor"]
+    assert statistics["overruns"] == 2 and statistics["skipped"] == 0
+
+def test_overruns_of_a_stall_counted_once():
+    for policy in [tick_scheduler.SKIP, tick_scheduler.CATCH_UP]:
+        scheduler = tick_scheduler.TickScheduler(max_catch_up=5)
+        scheduler.add_task("sensor", 1, policy)
+        start = scheduler.next_tick()
+        scheduler.pop_due(start)
+        # the measure of start blocked for 3 periods: the ticks of start + 2, 3 and 4 are missed
+        now = start + 4.5
+        while scheduler.pop_due(now):
+            pass
+        scheduler.pop_due(start + 5)
+        assert scheduler.get_statistics()["sensor"]["overruns"] == 3, policy
@@ -0,0 +1,62 @@
+import pytest
+import uplink_scheduler
+
+# clock of the tests, set by hand
+class Clock:
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def test_time_on_air():
+    # values of the LoRa calculators for EU868 at 125 kHz
+    assert uplink_scheduler.time_on_air(15, 0) == pytest.approx(1.647, abs=0.001)
+    assert uplink_scheduler.time_on_air(15, 5) == pytest.approx(0.0668, abs=0.0001)
+
+def test_each_device_sends_in_its_slot():
+    schedulers = [uplink_scheduler.UplinkScheduler(device, data_rate=0, cycle=60, devices=8, max_payload=51) for device in range(8)]
+    for cycle_index in range(100, 110):
+        for device, scheduler in enumerate(schedulers):
+            start = scheduler.slot_start(cycle_index)
+            slot = cycle_index * 60 + device * 7.5
+            # the longest frame ends in the slot of the device
+            assert slot <= start <= slot + 7.5 - uplink_scheduler.time_on_air(51, 0)
+            # the offset is the same on every station and changes at each cycle
+            assert start == uplink_scheduler.UplinkScheduler(device, data_rate=0, cycle=60, devices=8, max_payload=51).slot_start(cycle_index)
+    assert len({schedulers[0].slot_start(index) % 60 for index in range(100, 110)}) > 1
+
+def test_next_slot():
+    scheduler = uplink_scheduler.UplinkScheduler(3, data_rate=0, cycle=60, devices=8)
+    start = scheduler.slot_start(100)
+    duration = uplink_scheduler.time_on_air(15, 0)
+    # before the slot the frame waits for it, in the slot it is sent at once, after the slot it waits for the next cycle
+    assert scheduler.next_slot(duration, 6000) == start
+    assert scheduler.next_slot(duration, start + 0.1) == start + 0.1
+    assert scheduler.next_slot(duration, 6000 + 4 * 7.5) == scheduler.slot_start(101)
+
+def test_duty_cycle_delays_the_next_frame():
+    clock = Clock(6000)
+    scheduler = uplink_scheduler.UplinkScheduler(3, data_rate=0, duty_cycle=0.01, cycle=60, devices=8, clock=clock)
+    first = scheduler.slot_start(100)
+    assert scheduler.delay(15) == pytest.approx(first - 6000)
+    clock.now = first
+    scheduler.sent(15)
+    # the band is free again after 99 times the time on air, the frame waits for the first slot after that
+    free_at = first + uplink_scheduler.time_on_air(15, 0) / 0.01
+    at = clock.now + scheduler.delay(15)
+    assert at >= free_at
+    assert any(at == scheduler.slot_start(index) for index in range(101, 106))
+    assert scheduler.next_slot(uplink_scheduler.time_on_air(15, 0), free_at) == at
+    assert scheduler.delayed_frames == 1 and scheduler.frames == 1
+
+def test_budget_of_the_window():
+    budget = uplink_scheduler.DutyCycleBudget(0.01, window=3600)
+    budget.add(0, 20)
+    budget.add(2000, 10)
+    assert budget.used(2500) == 30
+    # the band is free after the off time of the last frame
+    assert budget.available_at(1, 2500) == 3000
+    # the frames leave the budget one window after they were sent
+    assert budget.used(3600) == 10
@@ -0,0 +1,43 @@
+import math
+import random
+import statistics
+
+import pytest
+import window_statistics
+
+def test_window_statistics_of_the_values():
+    window = window_statistics.WindowStatistics(["a", "b"], [50, 95])
+    generator = random.Random(2)
+    values = [generator.gauss(20, 3) for index in range(1000)]
+    for value in values:
+        window.update({"a": value, "b": math.nan})
+    result = window.close()
+    assert result["a"]["count"] == 1000
+    assert result["a"]["mean"] == pytest.approx(statistics.fmean(values))
+    assert result["a"]["std"] == pytest.approx(statistics.pstdev(values))
+    assert result["a"]["min"] == min(values) and result["a"]["max"] == max(values)
+    # the percentiles are estimated
+    ordered = sorted(values)
+    assert result["a"]["p50"] == pytest.approx(ordered[499], abs=0.3)
+    assert result["a"]["p95"] == pytest.approx(ordered[949], abs=0.5)
+    # a channel without value has no statistics
+    assert result["b"]["count"] == 0 and result["b"]["mean"] is None
+
+def test_close_starts_a_new_window():
+    window = window_statistics.WindowStatistics(["a"], [])
+    window.update({"a": 1})
+    window.close()
+    window.update({"a": 3})
+    assert window.close()["a"]["mean"] == 3
+
+def test_merge():
+    first = window_statistics.RunningStatistics()
+    second = window_statistics.RunningStatistics()
+    both = window_statistics.RunningStatistics()
+    for index in range(10):
+        (first if index < 4 else second).update(index * 1.5)
+        both.update(index * 1.5)
+    first.merge(second)
+    assert first.count == both.count
+    assert first.mean == pytest.approx(both.mean) and first.std() == pytest.approx(both.std())
+    assert first.min == both.min and first.max == both.max